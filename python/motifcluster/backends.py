@@ -0,0 +1,258 @@
+"""
+Backends for the sparse matrix products
+are in `motifcluster.backends`.
+"""
+
+import weakref
+from scipy import sparse
+
+from motifcluster import utils as mcut
+
+
+class ScipyBackend:
+
+  """
+  Sparse matrix products with scipy.
+
+  A backend computes the products of indicator matrices which appear
+  in the sparse formulation of the motif adjacency matrices.
+  This is the default backend, which uses scipy
+  together with the masked products in `motifcluster.utils`,
+  and is also used for the products of dense matrices.
+  Other backends provide the same four methods,
+  taking and returning scipy sparse matrices.
+
+  Attributes
+  ----------
+  name : str
+    The name of the backend.
+  """
+
+  name = "scipy"
+
+  def product(self, a_mat, b_mat):
+
+    """
+    Compute a full matrix product.
+
+    Parameters
+    ----------
+    a_mat, b_mat : matrix
+      Matrices such that `a @ b` is defined.
+
+    Returns
+    -------
+    matrix
+      The matrix `a @ b`.
+    """
+
+    return a_mat @ b_mat
+
+
+  def masked_product(self, mask_mat, a_mat, b_mat):
+
+    """
+    Compute a matrix product restricted to a sparsity mask.
+
+    Parameters
+    ----------
+    mask_mat, a_mat, b_mat : sparse matrix
+      Matrices such that `a @ b` has the same size as `mask`.
+
+    Returns
+    -------
+    sparse matrix
+      The matrix `mask * (a @ b)`.
+    """
+
+    return mcut._masked_product(mask_mat, a_mat, b_mat)
+
+
+  def a_b_one(self, mask_mat, a_mat):
+
+    """
+    Compute a masked product with a right all-ones matrix.
+
+    Parameters
+    ----------
+    mask_mat, a_mat : matrix
+      Square matrices of the same size.
+
+    Returns
+    -------
+    matrix
+      The matrix `mask * (a @ 1)`.
+    """
+
+    return mcut._a_b_one(mask_mat, a_mat)
+
+
+  def a_one_b(self, mask_mat, b_mat):
+
+    """
+    Compute a masked product with a middle all-ones matrix.
+
+    Parameters
+    ----------
+    mask_mat, b_mat : matrix
+      Square matrices of the same size.
+
+    Returns
+    -------
+    matrix
+      The matrix `mask * (1 @ b)`.
+    """
+
+    return mcut._a_one_b(mask_mat, b_mat)
+
+
+class GraphBLASBackend(ScipyBackend):
+
+  """
+  Sparse matrix products with SuiteSparse:GraphBLAS.
+
+  Products are computed by python-graphblas,
+  which runs multithreaded and evaluates a masked product
+  `mask * (a @ b)` as a single `mxm` with a structural mask,
+  so that only the entries on the mask are computed.
+  Each scipy matrix is converted to GraphBLAS once and kept
+  for as long as the scipy matrix exists,
+  so a matrix appearing in several products is only converted once.
+  It needs the optional dependency python-graphblas.
+
+  Parameters
+  ----------
+  n_threads : int
+    Number of threads for GraphBLAS to use,
+    or `None` to keep its default of all of the CPUs.
+
+  Attributes
+  ----------
+  name : str
+    The name of the backend.
+  n_threads : int
+    Number of threads for GraphBLAS to use.
+  """
+
+  name = "graphblas"
+
+  def __init__(self, n_threads=None):
+
+    try:
+      import graphblas # pylint: disable=import-outside-toplevel
+
+    except ImportError as error:
+      raise ImportError("the graphblas backend needs python-graphblas, "
+                        "which can be installed with "
+                        "`pip install motifcluster[graphblas]`") from error
+
+    if n_threads is not None:
+      graphblas.ss.config["nthreads"] = n_threads
+
+    self.n_threads = n_threads
+    self._gb = graphblas
+    self._converted = {}
+
+
+  def __reduce__(self):
+
+    # rebuild in worker processes rather than pickling the conversions
+    return (type(self), (self.n_threads,))
+
+
+  def product(self, a_mat, b_mat):
+
+    gb = self._gb
+    ans = self._convert(a_mat).mxm(self._convert(b_mat), gb.semiring.plus_times).new()
+
+    return gb.io.to_scipy_sparse(ans, format="csr")
+
+
+  def masked_product(self, mask_mat, a_mat, b_mat):
+
+    gb = self._gb
+    mask_gb = self._convert(mask_mat)
+    ans = self._convert(a_mat).mxm(self._convert(b_mat),
+                                   gb.semiring.plus_times).new(mask=mask_gb.S)
+    ans = ans.ewise_mult(mask_gb, gb.binary.times).new()
+
+    return gb.io.to_scipy_sparse(ans, format="csr")
+
+
+  def a_b_one(self, mask_mat, a_mat):
+
+    gb = self._gb
+    row_sums = self._convert(a_mat).reduce_rowwise(gb.monoid.plus).new()
+    ans = row_sums.diag().mxm(self._convert(mask_mat), gb.semiring.plus_times).new()
+
+    return gb.io.to_scipy_sparse(ans, format="csr")
+
+
+  def a_one_b(self, mask_mat, b_mat):
+
+    gb = self._gb
+    col_sums = self._convert(b_mat).reduce_columnwise(gb.monoid.plus).new()
+    ans = self._convert(mask_mat).mxm(col_sums.diag(), gb.semiring.plus_times).new()
+
+    return gb.io.to_scipy_sparse(ans, format="csr")
+
+
+  def _convert(self, some_mat):
+
+    """
+    Convert a scipy sparse matrix to a GraphBLAS matrix.
+
+    Parameters
+    ----------
+    some_mat : sparse matrix
+      The matrix to convert.
+
+    Returns
+    -------
+    graphblas.Matrix
+      The converted matrix, reused for later requests
+      with the same scipy matrix.
+    """
+
+    key = id(some_mat)
+
+    # forget the conversion when the scipy matrix is collected
+    if key not in self._converted:
+      self._converted[key] = self._gb.io.from_scipy_sparse(sparse.csr_matrix(some_mat))
+      weakref.finalize(some_mat, self._converted.pop, key, None)
+
+    return self._converted[key]
+
+
+# backends by name
+_BACKENDS = {
+  "scipy": ScipyBackend,
+  "graphblas": GraphBLASBackend,
+}
+
+
+def _get_backend(backend):
+
+  """
+  Get a backend instance.
+
+  Parameters
+  ----------
+  backend : str or backend
+    The name of a backend, one of `"scipy"` or `"graphblas"`,
+    or an instance of a backend class.
+
+  Returns
+  -------
+  backend
+    An instance of the backend.
+  """
+
+  if isinstance(backend, str):
+    assert backend in _BACKENDS
+    return _BACKENDS[backend]()
+
+  assert all(hasattr(backend, attr) for attr in
+             ("name", "product", "masked_product", "a_b_one", "a_one_b"))
+
+  return backend
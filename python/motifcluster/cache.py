@@ -0,0 +1,621 @@
+"""
+Functions for caching motif adjacency matrices and embeddings
+are in `motifcluster.cache`.
+"""
+
+import collections
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+from scipy import sparse
+
+from motifcluster import indicators as mcin
+from motifcluster import enumeration as mcen
+from motifcluster import outofcore as mcoc
+from motifcluster import utils as mcut
+
+# version of the cache layout, changed whenever old entries become invalid
+_CACHE_VERSION = 2
+
+
+class MotifAdjacencyCache:
+
+  """
+  Persistent cache of motif adjacency matrices.
+
+  Hold motif adjacency matrices on disk, keyed by a fingerprint
+  of the adjacency matrix they were built from together with
+  the motif, motif type and weighting scheme.
+  Each matrix is stored by `outofcore.save_csr`,
+  so a cached matrix is memory-mapped rather than read when loaded.
+  When the cache grows beyond its size limit,
+  the least recently used matrices are removed.
+
+  Parameters
+  ----------
+  path : str
+    The directory holding the cache.
+    It is created if it does not exist.
+  max_bytes : int
+    The largest total size of the cached matrices.
+
+  Attributes
+  ----------
+  path : str
+    The directory holding the cache.
+  max_bytes : int
+    The largest total size of the cached matrices.
+
+  Examples
+  --------
+  >>> cache = MotifAdjacencyCache("mam_cache", max_bytes=2**30)
+  >>> build_motif_adjacency_matrix(adj_mat, "M1", cache=cache)
+  """
+
+  def __init__(self, path, max_bytes=2**32):
+
+    assert max_bytes >= 0
+
+    os.makedirs(path, exist_ok=True)
+    self.path = path
+    self.max_bytes = max_bytes
+
+
+  def get_key(self, adj_mat, motif_name, # pylint: disable=too-many-positional-arguments
+              motif_type, mam_weight_type, mam_method, *, dtype=None, upper=False):
+
+    """
+    Get the key of a motif adjacency matrix.
+
+    Parameters
+    ----------
+    adj_mat : matrix or IndicatorBundle
+      Adjacency matrix from which the motif adjacency matrix is built,
+      or an indicator bundle holding it.
+    motif_name : str
+      Motif used for the motif adjacency matrix.
+    motif_type : str
+      Type of motif adjacency matrix.
+    mam_weight_type : str
+      The weighting scheme.
+    mam_method : str
+      The method used to build the motif adjacency matrix.
+      Methods giving the same matrices share their keys,
+      as in `_get_mam_key`.
+    dtype : dtype
+      The data type of the motif adjacency matrix,
+      or `None` for the default type.
+    upper : bool
+      Whether only the upper triangle is stored.
+
+    Returns
+    -------
+    str
+      A hexadecimal key.
+    """
+
+    mam_key = _get_mam_key(adj_mat, motif_name, motif_type, mam_weight_type, mam_method,
+                           dtype=dtype, upper=upper)
+    params = ",".join([str(_CACHE_VERSION)] + [str(param) for param in mam_key[1:]])
+    hasher = hashlib.blake2b(params.encode(), digest_size=20)
+    hasher.update(mam_key[0])
+
+    return hasher.hexdigest()
+
+
+  def get(self, key):
+
+    """
+    Load a motif adjacency matrix from the cache.
+
+    Parameters
+    ----------
+    key : str
+      The key of the matrix, from `get_key`.
+
+    Returns
+    -------
+    sparse matrix
+      The motif adjacency matrix in CSR form, with read-only arrays
+      mapped from disk, or `None` if it is not in the cache.
+    """
+
+    entry_path = os.path.join(self.path, key)
+
+    if not os.path.isfile(os.path.join(entry_path, "meta.json")):
+      return None
+
+    # mark as recently used
+    os.utime(entry_path)
+
+    return mcoc.load_csr(entry_path)
+
+
+  def put(self, key, motif_adj_mat):
+
+    """
+    Save a motif adjacency matrix to the cache.
+
+    The matrix is written to a temporary directory which is then renamed,
+    so that other processes never see a partly written entry.
+    The least recently used entries are then removed
+    until the cache is within its size limit.
+
+    Parameters
+    ----------
+    key : str
+      The key of the matrix, from `get_key`.
+    motif_adj_mat : sparse matrix
+      The motif adjacency matrix.
+
+    Returns
+    -------
+    sparse matrix
+      The cached matrix, loaded with `get`,
+      or `motif_adj_mat` itself if it is too large to cache.
+    """
+
+    entry_path = os.path.join(self.path, key)
+    tmp_path = tempfile.mkdtemp(prefix=".tmp-", dir=self.path)
+    mcoc.save_csr(motif_adj_mat, tmp_path)
+
+    if _get_size(tmp_path) > self.max_bytes:
+      shutil.rmtree(tmp_path)
+      return motif_adj_mat
+
+    try:
+      os.rename(tmp_path, entry_path)
+
+    # another process cached the same matrix first
+    except OSError:
+      shutil.rmtree(tmp_path)
+
+    self._evict(keep=key)
+
+    return self.get(key)
+
+
+  def clear(self):
+
+    """
+    Remove all of the matrices from the cache.
+    """
+
+    for name in os.listdir(self.path):
+      shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+
+  def _evict(self, keep=None):
+
+    """
+    Remove least recently used entries until the cache fits its size limit.
+
+    Parameters
+    ----------
+    keep : str
+      The key of an entry which is never removed.
+    """
+
+    entries = []
+
+    for name in os.listdir(self.path):
+      entry_path = os.path.join(self.path, name)
+
+      if name.startswith(".") or not os.path.isdir(entry_path):
+        continue
+
+      entries.append((os.path.getmtime(entry_path), name, _get_size(entry_path)))
+
+    total_bytes = sum(size for _, _, size in entries)
+
+    for _, name, size in sorted(entries):
+      if total_bytes <= self.max_bytes:
+        break
+
+      if name != keep:
+        shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        total_bytes -= size
+
+
+class MemoryCache:
+
+  """
+  In-memory least recently used cache.
+
+  Hold values in memory up to a total size,
+  removing the least recently used values when it is exceeded.
+  The arrays in the values are made read-only when they are cached,
+  as they are shared between all of the callers which look them up.
+
+  Parameters
+  ----------
+  max_bytes : int
+    The largest total size of the arrays in the cached values.
+
+  Attributes
+  ----------
+  max_bytes : int
+    The largest total size of the arrays in the cached values.
+  n_bytes : int
+    The total size of the arrays in the cached values.
+  """
+
+  def __init__(self, max_bytes=2**30):
+
+    assert max_bytes >= 0
+
+    self.max_bytes = max_bytes
+    self.n_bytes = 0
+    self._values = collections.OrderedDict()
+
+
+  def __len__(self):
+
+    return len(self._values)
+
+
+  def get(self, key):
+
+    """
+    Look up a value in the cache.
+
+    Parameters
+    ----------
+    key : hashable
+      The key of the value.
+
+    Returns
+    -------
+    object
+      The cached value, or `None` if it is not in the cache.
+    """
+
+    if key not in self._values:
+      return None
+
+    # mark as recently used
+    self._values.move_to_end(key)
+
+    return self._values[key][0]
+
+
+  def put(self, key, value):
+
+    """
+    Add a value to the cache.
+
+    Parameters
+    ----------
+    key : hashable
+      The key of the value.
+    value : object
+      The value, such as a matrix, or a dictionary or tuple of them.
+
+    Returns
+    -------
+    object
+      The value, with its arrays made read-only.
+      It is not cached if it is larger than the cache.
+    """
+
+    n_bytes = _get_nbytes(value)
+
+    if n_bytes > self.max_bytes:
+      return value
+
+    if key in self._values:
+      self.n_bytes -= self._values.pop(key)[1]
+
+    _freeze(value)
+    self._values[key] = (value, n_bytes)
+    self.n_bytes += n_bytes
+
+    while self.n_bytes > self.max_bytes:
+      self.n_bytes -= self._values.popitem(last=False)[1][1]
+
+    return value
+
+
+  def clear(self):
+
+    """
+    Remove all of the values from the cache.
+    """
+
+    self._values.clear()
+    self.n_bytes = 0
+
+
+class EmbeddingCache:
+
+  """
+  In-memory caches of the stages of a motif embedding.
+
+  Hold the motif adjacency matrices, Laplacians and spectra
+  computed by `spectral.run_motif_embedding`
+  in separate least recently used caches,
+  keyed by a fingerprint of the adjacency matrix
+  and the parameters of each stage.
+  Repeated runs on the same graph then only compute the stages
+  whose parameters have changed,
+  so that for example changing the number of clusters
+  reuses the spectrum, and changing the type of Laplacian
+  reuses the motif adjacency matrix.
+
+  Parameters
+  ----------
+  max_bytes : int
+    The largest total size of each stage.
+  disk : str or MotifAdjacencyCache
+    If given, a persistent cache behind the in-memory
+    cache of motif adjacency matrices.
+
+  Attributes
+  ----------
+  mams : MemoryCache
+    The motif adjacency matrices.
+  laplacians : MemoryCache
+    The Laplacians.
+  spectra : MemoryCache
+    The spectra of the Laplacians.
+  disk : MotifAdjacencyCache
+    The persistent cache of motif adjacency matrices, or `None`.
+
+  Examples
+  --------
+  >>> cache = EmbeddingCache(max_bytes=2**28)
+  >>> for num_clusts in range(2, 10):
+  >>>   run_motif_clustering(adj_mat, "M1", num_clusts=num_clusts, cache=cache)
+  """
+
+  def __init__(self, max_bytes=2**30, disk=None):
+
+    self.mams = MemoryCache(max_bytes)
+    self.laplacians = MemoryCache(max_bytes)
+    self.spectra = MemoryCache(max_bytes)
+    self.disk = None if disk is None else _get_cache(disk)
+
+
+  def clear(self):
+
+    """
+    Remove all of the values from the in-memory caches.
+    """
+
+    for stage in (self.mams, self.laplacians, self.spectra):
+      stage.clear()
+
+
+def _memoize(stage, key, builder):
+
+  """
+  Look up a value in a cache stage, or build and cache it.
+
+  Parameters
+  ----------
+  stage : MemoryCache
+    The cache stage, or `None` to always build the value.
+  key : hashable
+    The key of the value.
+  builder : function
+    A function of no arguments building the value.
+
+  Returns
+  -------
+  object
+    The cached or built value.
+  """
+
+  if stage is None:
+    return builder()
+
+  value = stage.get(key)
+
+  if value is None:
+    value = stage.put(key, builder())
+
+  return value
+
+
+def _get_mam_key(adj_mat, motif_name, # pylint: disable=too-many-positional-arguments
+                 motif_type, mam_weight_type, mam_method, *, dtype=None, upper=False):
+
+  """
+  Get the key of a motif adjacency matrix.
+
+  Enumeration shares the key of the sparse formulation
+  for the motifs it does not apply to, as it falls back on it.
+  The automatic formulation shares it too, as it only chooses
+  the dense formulation when that gives the same matrices,
+  as does the dense formulation when the graph has no self-loops.
+  With self-loops, the structural formulas of some motifs differ
+  between the dense and sparse formulations, so each keeps its own key.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which the motif adjacency matrix is built,
+    or an indicator bundle holding it.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix.
+  mam_weight_type : str
+    The weighting scheme.
+  mam_method : str
+    The method used to build the motif adjacency matrix.
+  dtype : dtype
+    The data type of the motif adjacency matrix,
+    or `None` for the default type.
+  upper : bool
+    Whether only the upper triangle is stored.
+
+  Returns
+  -------
+  tuple
+    The fingerprint of `adj_mat` followed by the motif settings.
+  """
+
+  if mam_method == "enumerate" and motif_name not in mcen._MOTIF_EDGES:
+    mam_method = "sparse"
+
+  if mam_method == "auto" or (mam_method == "dense" and not mcut._has_self_loops(
+      adj_mat.adj_mat if isinstance(adj_mat, mcin.IndicatorBundle) else adj_mat)):
+    mam_method = "sparse"
+
+  dtype = "default" if dtype is None else np.dtype(dtype).str
+  mam_key = (_fingerprint(adj_mat), motif_name, motif_type, mam_weight_type, mam_method, dtype)
+
+  # full matrices keep the keys they had before upper triangles
+  if upper:
+    mam_key += ("upper",)
+
+  return mam_key
+
+
+def _get_nbytes(value):
+
+  """
+  Get the total size of the arrays in a value.
+
+  Parameters
+  ----------
+  value : object
+    A matrix, or a dictionary, tuple or list of them.
+
+  Returns
+  -------
+  int
+    The total size in bytes.
+  """
+
+  if sparse.issparse(value):
+    return sum(_get_nbytes(getattr(value, attr, None))
+               for attr in ("data", "indices", "indptr", "row", "col", "offsets"))
+
+  if isinstance(value, np.ndarray):
+    return value.nbytes
+
+  if isinstance(value, dict):
+    return sum(_get_nbytes(item) for item in value.values())
+
+  if isinstance(value, (tuple, list)):
+    return sum(_get_nbytes(item) for item in value)
+
+  return 0
+
+
+def _freeze(value):
+
+  """
+  Make the arrays in a value read-only.
+
+  Sparse matrices are first put in canonical format,
+  since scipy sums duplicates and sorts indices in place,
+  which fails on read-only arrays.
+
+  Parameters
+  ----------
+  value : object
+    A matrix, or a dictionary, tuple or list of them.
+  """
+
+  if sparse.issparse(value):
+    if hasattr(value, "sum_duplicates"):
+      value.sum_duplicates()
+
+    for attr in ("data", "indices", "indptr", "row", "col", "offsets"):
+      _freeze(getattr(value, attr, None))
+
+  elif isinstance(value, np.ndarray):
+    value.flags.writeable = False
+
+  elif isinstance(value, dict):
+    for item in value.values():
+      _freeze(item)
+
+  elif isinstance(value, (tuple, list)):
+    for item in value:
+      _freeze(item)
+
+
+def _get_cache(cache):
+
+  """
+  Get a cache instance.
+
+  Parameters
+  ----------
+  cache : str or MotifAdjacencyCache
+    The directory of a cache with the default size limit,
+    or a cache instance.
+
+  Returns
+  -------
+  MotifAdjacencyCache
+    An instance of the cache.
+  """
+
+  if isinstance(cache, MotifAdjacencyCache):
+    return cache
+
+  return MotifAdjacencyCache(cache)
+
+
+def _fingerprint(adj_mat):
+
+  """
+  Fingerprint an adjacency matrix.
+
+  The matrix is hashed in canonical CSR form,
+  so that equal matrices get equal fingerprints
+  whatever their format.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    An adjacency matrix, or an indicator bundle holding it.
+
+  Returns
+  -------
+  bytes
+    A digest of the shape and entries of the matrix.
+  """
+
+  if isinstance(adj_mat, mcin.IndicatorBundle):
+    adj_mat = adj_mat.adj_mat
+
+  adj_mat = sparse.csr_matrix(adj_mat, dtype=float, copy=True)
+  adj_mat.sum_duplicates()
+  adj_mat.eliminate_zeros()
+
+  hasher = hashlib.blake2b(digest_size=20)
+  hasher.update(np.array(adj_mat.shape, dtype=np.int64).tobytes())
+
+  for array in (adj_mat.indptr, adj_mat.indices):
+    hasher.update(array.astype(np.int64).tobytes())
+
+  hasher.update(adj_mat.data.tobytes())
+
+  return hasher.digest()
+
+
+def _get_size(path):
+
+  """
+  Get the total size of the files in a directory.
+
+  Parameters
+  ----------
+  path : str
+    The directory.
+
+  Returns
+  -------
+  int
+    The total size in bytes.
+  """
+
+  return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
@@ -37,7 +37,7 @@ def cluster_spectrum(spectrum, num_clusts):
   return cluster_assigns
 
 
-def run_motif_clustering(adj_mat, motif_name,
+def run_motif_clustering(adj_mat, motif_name, # pylint: disable=too-many-arguments
                          motif_type="struc",
                          mam_weight_type="unweighted",
                          mam_method="sparse",
@@ -45,7 +45,13 @@ def run_motif_clustering(adj_mat, motif_name,
                          type_lap="comb",
                          num_clusts=2,
                          restrict=True,
-                         gr_method="sparse"):
+                         gr_method="sparse",
+                         *,
+                         reorder=None,
+                         backend=None,
+                         cache=None,
+                         dtype=None,
+                         upper=False):
 
   """
   Run motif-based clustering.
@@ -71,7 +77,7 @@ def run_motif_clustering(adj_mat, motif_name,
     One of `"unweighted"`, `"mean"` or `"product"`.
   mam_method : str
     The method to use for building the motif adjacency matrix.
-    One of `"sparse"` or `"dense"`.
+    One of `"sparse"`, `"dense"`, `"enumerate"`, `"approx"` or `"auto"`.
   num_eigs : int
     Number of eigenvalues and eigenvectors for the embedding.
   type_lap : str
@@ -85,13 +91,36 @@ def run_motif_clustering(adj_mat, motif_name,
   gr_method : str
     Format to use for getting largest component.
     One of `"sparse"` or `"dense"`.
+  reorder : str
+    If given, the vertices are relabelled for better locality
+    while building the motif adjacency matrix and computing
+    the embedding, as in `spectral.run_motif_embedding`.
+    All of the results are returned in the original order.
+    One of `"degree"`, `"rcm"` or `"bfs"`.
+  backend : str or backend
+    The backend for the sparse matrix products,
+    as in `motifadjacency.build_motif_adjacency_matrix`.
+    One of `"scipy"` or `"graphblas"`.
+  cache : str, MotifAdjacencyCache or EmbeddingCache
+    If given, a persistent or in-memory cache,
+    as in `spectral.run_motif_embedding`.
+    With a `cache.EmbeddingCache`, changing only the number of clusters
+    reuses the cached spectrum.
+  dtype : dtype
+    The precision of the motif adjacency matrix, Laplacian
+    and eigenvectors, as in `spectral.run_motif_embedding`.
+    One of `np.float32` or `np.float64`.
+  upper : bool
+    Whether to build and return only the upper triangle
+    of the motif adjacency matrix, and embed it without
+    forming the full matrix, as in `spectral.run_motif_embedding`.
 
   Returns
   -------
   adj_mat : sparse matrix
     The original adjacency matrix.
   motif_adj_mat : sparse matrix
-    The motif adjacency matrix.
+    The motif adjacency matrix, or its upper triangle.
   comps : list
     The indices of the largest connected component
     of the motif adjacency matrix
@@ -123,12 +152,14 @@ def run_motif_clustering(adj_mat, motif_name,
 
   assert motif_type in ["struc", "func"]
   assert mam_weight_type in ["unweighted", "mean", "product"]
-  assert mam_method in ["sparse", "dense"]
+  assert mam_method in ["sparse", "dense", "enumerate", "approx", "auto"]
   assert isinstance(restrict, bool)
   assert type_lap in ["comb", "rw"]
 
   spectrum = mcsp.run_motif_embedding(adj_mat, motif_name, motif_type, mam_weight_type,
-                                      mam_method, num_eigs, type_lap, restrict, gr_method)
+                                      mam_method, num_eigs, type_lap, restrict, gr_method,
+                                      reorder=reorder, backend=backend, cache=cache,
+                                      dtype=dtype, upper=upper)
 
   cluster_assigns = cluster_spectrum(spectrum, num_clusts)
 
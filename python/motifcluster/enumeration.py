@@ -0,0 +1,981 @@
+"""
+Functions for enumerating motif instances
+are in `motifcluster.enumeration`.
+"""
+
+import itertools
+import numpy as np
+from scipy import sparse
+
+from motifcluster import utils as mcut
+from motifcluster import indicators as mcin
+
+# Directed edges of the triangle motifs on the vertices 0, 1 and 2.
+# A double edge appears as two directed edges.
+_MOTIF_EDGES = {
+  "M1": [(0, 1), (1, 2), (2, 0)],
+  "M2": [(0, 1), (1, 0), (0, 2), (2, 1)],
+  "M3": [(0, 2), (2, 0), (2, 1), (1, 2), (0, 1)],
+  "M4": [(0, 1), (1, 0), (0, 2), (2, 0), (1, 2), (2, 1)],
+  "M5": [(0, 1), (0, 2), (2, 1)],
+  "M6": [(0, 1), (0, 2), (1, 2), (2, 1)],
+  "M7": [(0, 2), (1, 2), (0, 1), (1, 0)],
+}
+
+# The six directed edges of a triangle on the vertices 0, 1 and 2.
+# Bit `e` of the pattern of a triangle is set
+# if the directed edge `_TRIANGLE_EDGES[e]` is present.
+_TRIANGLE_EDGES = [(0, 1), (1, 0), (0, 2), (2, 0), (1, 2), (2, 1)]
+
+# Directed edges of every motif on the vertices 0, 1 and possibly 2.
+# A double edge appears as two directed edges.
+_ALL_MOTIF_EDGES = {
+  "Ms": [(0, 1)],
+  "Md": [(0, 1), (1, 0)],
+  **_MOTIF_EDGES,
+  "M8": [(0, 1), (0, 2)],
+  "M9": [(0, 1), (1, 2)],
+  "M10": [(1, 0), (2, 0)],
+  "M11": [(0, 1), (1, 0), (0, 2)],
+  "M12": [(0, 1), (1, 0), (2, 0)],
+  "M13": [(0, 1), (1, 0), (0, 2), (2, 0)],
+  "Mcoll": [(0, 2), (1, 2)],
+  "Mexpa": [(2, 0), (2, 1)],
+}
+
+# The vertices of an instance whose pairs are counted,
+# for the motifs which do not count all of their pairs.
+_MOTIF_ANCHORS = { # pylint: disable=consider-using-namedtuple-or-dataclass
+  "Mcoll": (0, 1),
+  "Mexpa": (0, 1),
+}
+
+# The directed edges and vertex pairs on two or three vertices.
+# Bit `e` of the pattern of a vertex set is set
+# if the directed edge `_LOCAL_EDGES[n_verts][e]` is present.
+_LOCAL_EDGES = {2: [(0, 1), (1, 0)], 3: _TRIANGLE_EDGES}
+_LOCAL_PAIRS = {2: [(0, 1)], 3: [(0, 1), (0, 2), (1, 2)]}
+
+
+def mam_enumerate(adj_mat, motif_name, motif_type, mam_weight_type, upper=False):
+
+  """
+  Perform the motif adjacency matrix calculations by enumeration.
+
+  Build a motif adjacency matrix for one of the triangle motifs
+  M1 to M7 by listing the triangles of the graph,
+  rather than by evaluating a matrix formula.
+  Each triangle is classified by which of its six directed edges
+  are present, and contributes the weights of the motif instances
+  it contains to each of its three vertex pairs.
+  The cost scales with the number of triangles,
+  rather than with the number of paths of length two.
+  The triangles and their classifications are kept in the bundle,
+  so they are only found once for several motifs or weighting schemes.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+    One of `"M1"` to `"M7"`.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  upper : bool
+    Whether to build only the upper triangle
+    of the motif adjacency matrix.
+
+  Returns
+  -------
+  sparse matrix
+    A motif adjacency matrix, or its upper triangle.
+  """
+
+  assert motif_name in _MOTIF_EDGES
+  assert motif_type in ["struc", "func"]
+  assert mam_weight_type in ["unweighted", "mean", "product"]
+
+  adj_mat = mcin._as_bundle(adj_mat, "sparse")
+  verts, patterns, weights = _classify_triangles(adj_mat)
+  instance_table = _get_instance_table(motif_name, motif_type)
+
+  rows = []
+  cols = []
+  vals = []
+
+  for pattern in np.unique(patterns):
+    inds = np.flatnonzero(patterns == pattern)
+
+    for instance in instance_table[pattern]:
+      instance_weights = _get_instance_weights(weights[np.ix_(inds, instance)], mam_weight_type)
+
+      # each instance contains all three vertex pairs
+      for i, j in ((0, 1), (0, 2), (1, 2)):
+        if upper:
+          rows += [np.minimum(verts[inds, i], verts[inds, j])]
+          cols += [np.maximum(verts[inds, i], verts[inds, j])]
+          vals += [instance_weights]
+
+        else:
+          rows += [verts[inds, i], verts[inds, j]]
+          cols += [verts[inds, j], verts[inds, i]]
+          vals += [instance_weights, instance_weights]
+
+  row_inds = np.concatenate([np.zeros(0, dtype=np.int64)] + rows)
+  col_inds = np.concatenate([np.zeros(0, dtype=np.int64)] + cols)
+  data = np.concatenate([np.zeros(0)] + vals)
+  motif_adj_mat = sparse.coo_matrix((data, (row_inds, col_inds)), shape=adj_mat.shape,
+                                    dtype=adj_mat.dtype).tocsr()
+
+  return motif_adj_mat
+
+
+def _get_instance_weights(edge_weights, mam_weight_type):
+
+  """
+  Get the weights of motif instances from the weights of their edges.
+
+  Parameters
+  ----------
+  edge_weights : array
+    An array of shape `(n_instances, n_edges)` holding the weight
+    of each directed edge of each instance.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  array
+    The weight of each instance.
+  """
+
+  if mam_weight_type == "unweighted":
+    return np.ones(edge_weights.shape[0])
+
+  if mam_weight_type == "mean":
+    return edge_weights.mean(axis=1)
+
+  return edge_weights.prod(axis=1)
+
+
+def _get_instance_table(motif_name, motif_type):
+
+  """
+  Get the motif instances contained in each triangle pattern.
+
+  A functional instance is any set of directed edges of the triangle
+  forming the motif.
+  A structural instance must use all of the directed edges of the
+  triangle, so that the motif appears as an induced subgraph.
+
+  Parameters
+  ----------
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+    One of `"M1"` to `"M7"`.
+  motif_type : str
+    Type of motif instance.
+    One of `"func"` or `"struc"`.
+
+  Returns
+  -------
+  instance_table : list
+    For each of the 64 triangle patterns, a list of instances,
+    each given as a list of the indices in `_TRIANGLE_EDGES`
+    of its directed edges.
+  """
+
+  instance_table = []
+
+  for pattern in range(64):
+    present = {e for e in range(6) if (pattern >> e) & 1}
+    instances = set()
+
+    for perm in itertools.permutations(range(3)):
+      instance = frozenset(_TRIANGLE_EDGES.index((perm[u], perm[v]))
+                           for u, v in _MOTIF_EDGES[motif_name])
+
+      if motif_type == "func" and instance <= present:
+        instances.add(instance)
+
+      if motif_type == "struc" and instance == present:
+        instances.add(instance)
+
+    instance_table.append([sorted(instance) for instance in sorted(instances, key=sorted)])
+
+  return instance_table
+
+
+def _classify_triangles(adj_mat):
+
+  """
+  List and classify the triangles of a graph.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+
+  Returns
+  -------
+  verts : array
+    An array of shape `(n_triangles, 3)` holding
+    the vertices of each triangle.
+  patterns : array
+    The pattern of each triangle, with bit `e` set if
+    the directed edge `_TRIANGLE_EDGES[e]` is present.
+  weights : array
+    An array of shape `(n_triangles, 6)` holding the weight of each
+    directed edge `_TRIANGLE_EDGES[e]` of each triangle.
+  """
+
+  key = ("triangles",)
+
+  if key not in adj_mat.cache:
+    J = adj_mat.get("J")
+    G = adj_mat.get("G")
+    verts = _list_triangles(J)
+
+    # look up all six directed edges of each triangle at once
+    rows = np.concatenate([verts[:, u] for u, _ in _TRIANGLE_EDGES])
+    cols = np.concatenate([verts[:, v] for _, v in _TRIANGLE_EDGES])
+    present = mcut._lookup(J, rows, cols).reshape((6, -1)).T != 0
+    weights = mcut._lookup(G, rows, cols).reshape((6, -1)).T.astype(float)
+    weights[~present] = 0
+
+    patterns = present.astype(np.int64) @ (2 ** np.arange(6))
+    adj_mat.cache[key] = (verts, patterns, weights)
+
+  return adj_mat.cache[key]
+
+
+def _list_triangles(adj_mat, max_chunk=2**22):
+
+  """
+  List the triangles of a graph.
+
+  Each edge is oriented from the endpoint of lower degree to the
+  endpoint of higher degree, breaking ties by index.
+  A triangle is then found once, from its two lowest-ranked vertices,
+  by intersecting their forward neighbourhoods.
+  The shorter of the two neighbourhoods is expanded,
+  so the total work is at most of order `m^(3/2)`
+  for a graph with `m` edges.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    An adjacency matrix of a graph.
+    The directions and weights of its edges are ignored.
+  max_chunk : int
+    Maximum number of candidate triangles to hold in memory at once.
+
+  Returns
+  -------
+  verts : array
+    An array of shape `(n_triangles, 3)` holding
+    the vertices of each triangle.
+  """
+
+  triangles = [np.zeros((0, 3), dtype=np.int64)] + list(_iter_triangles(adj_mat, max_chunk))
+
+  return np.concatenate(triangles)
+
+
+def _iter_triangles(adj_mat, max_chunk=2**22):
+
+  """
+  Iterate over the triangles of a graph in chunks.
+
+  The triangles are found as in `_list_triangles`,
+  one chunk of candidate triangles at a time.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    An adjacency matrix of a graph.
+    The directions and weights of its edges are ignored.
+  max_chunk : int
+    Maximum number of candidate triangles to hold in memory at once.
+
+  Yields
+  ------
+  verts : array
+    An array of shape `(n_triangles, 3)` holding
+    the vertices of each triangle in the chunk.
+  """
+
+  fwd_mat, order = _forward_adjacency(adj_mat)
+  n = fwd_mat.shape[0]
+  keys = mcut._csr_keys(fwd_mat)
+
+  if len(keys) == 0:
+    return
+
+  # expand the shorter forward neighbourhood of each edge
+  us = np.repeat(np.arange(n), np.diff(fwd_mat.indptr))
+  vs = fwd_mat.indices.astype(np.int64)
+  out_degs = np.diff(fwd_mat.indptr)
+  use_u = out_degs[us] <= out_degs[vs]
+  segs = np.where(use_u, us, vs)
+  others = np.where(use_u, vs, us)
+  lens = out_degs[segs]
+  cum_lens = np.cumsum(lens)
+  first = 0
+
+  while first < len(segs):
+
+    # chunk of edges whose expansion fits in memory
+    offset = cum_lens[first] - lens[first]
+    last = max(np.searchsorted(cum_lens, offset + max_chunk, side="right"), first + 1)
+    pairs, pos = mcut._segment_positions(fwd_mat.indptr[segs[first:last]],
+                                         lens[first:last])
+    pairs += first
+    ws = fwd_mat.indices[pos].astype(np.int64)
+
+    # keep the candidates adjacent to the other endpoint
+    query = others[pairs] * n + ws
+    found = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    hits = keys[found] == query
+    yield order[np.column_stack([us[pairs[hits]], vs[pairs[hits]], ws[hits]])]
+    first = last
+
+
+def _iter_open_wedges(und_mat, max_chunk=2**22):
+
+  """
+  Iterate over the open wedges of a graph in chunks.
+
+  An open wedge is a vertex together with two of its neighbours
+  which are not adjacent to each other.
+  Each pair of neighbours of each vertex is a candidate,
+  and the candidates are expanded one chunk at a time.
+
+  Parameters
+  ----------
+  und_mat : sparse matrix
+    The undirected adjacency matrix of a graph
+    in canonical CSR form without self-loops.
+  max_chunk : int
+    Maximum number of candidate wedges to hold in memory at once.
+
+  Yields
+  ------
+  verts : array
+    An array of shape `(n_wedges, 3)` holding the centre
+    and the two other vertices of each open wedge in the chunk,
+    with the other vertices in increasing order.
+  pos : array
+    An array of shape `(n_wedges, 2)` holding the positions
+    in `und_mat` of the edges from the centre to the other vertices.
+  """
+
+  n = und_mat.shape[0]
+  keys = mcut._csr_keys(und_mat)
+  centres = np.repeat(np.arange(n), np.diff(und_mat.indptr))
+
+  # pair each neighbour with the later neighbours of the same centre
+  lens = und_mat.indptr[centres + 1] - np.arange(len(centres)) - 1
+  cum_lens = np.cumsum(lens)
+  first = 0
+
+  while first < len(centres):
+
+    # chunk of neighbours whose pairs fit in memory
+    offset = cum_lens[first] - lens[first]
+    last = max(np.searchsorted(cum_lens, offset + max_chunk, side="right"), first + 1)
+    pairs, pos = mcut._segment_positions(np.arange(first, last) + 1, lens[first:last])
+    pairs += first
+    us = und_mat.indices[pairs].astype(np.int64)
+    ws = und_mat.indices[pos].astype(np.int64)
+
+    # keep the pairs of neighbours which are not adjacent
+    open_wedges = mcut._lookup(und_mat, us, ws, keys) == 0
+    yield (np.column_stack([centres[pairs[open_wedges]], us[open_wedges], ws[open_wedges]]),
+           np.column_stack([pairs[open_wedges], pos[open_wedges]]))
+    first = last
+
+
+def _forward_adjacency(adj_mat):
+
+  """
+  Orient the edges of a graph by degree.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    An adjacency matrix of a graph.
+    The directions and weights of its edges are ignored.
+
+  Returns
+  -------
+  fwd_mat : sparse matrix
+    The adjacency matrix of the oriented graph in canonical CSR form,
+    with each vertex relabelled by its rank,
+    and each edge pointing from the lower rank to the higher rank.
+  order : array
+    The vertex of each rank.
+  """
+
+  # undirected simple graph
+  adj_coo = sparse.coo_matrix(adj_mat)
+  n = adj_coo.shape[0]
+  keep = (adj_coo.data != 0) & (adj_coo.row != adj_coo.col)
+  rows = np.concatenate([adj_coo.row[keep], adj_coo.col[keep]])
+  cols = np.concatenate([adj_coo.col[keep], adj_coo.row[keep]])
+  und_mat = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+
+  # rank vertices by degree
+  order = np.lexsort((np.arange(n), np.diff(und_mat.indptr)))
+  ranks = np.empty(n, dtype=np.int64)
+  ranks[order] = np.arange(n)
+
+  # forward adjacency matrix on the ranks
+  und_coo = und_mat.tocoo()
+  keep = ranks[und_coo.row] < ranks[und_coo.col]
+  fwd_mat = sparse.csr_matrix((np.ones(keep.sum()), (ranks[und_coo.row[keep]],
+                                                      ranks[und_coo.col[keep]])),
+                              shape=(n, n))
+  fwd_mat.sort_indices()
+
+  return fwd_mat, order
+
+
+def _get_role_table(motif_name, motif_type):
+
+  """
+  Get the motif instances on each pattern, with the roles of their vertices.
+
+  Parameters
+  ----------
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif instance.
+    One of `"func"` or `"struc"`.
+
+  Returns
+  -------
+  table : list
+    For each pattern of the directed edges `_LOCAL_EDGES`
+    on the vertices of the motif, a list of instances,
+    each given as a tuple `(edges, perm)` of the indices in
+    `_LOCAL_EDGES` of its directed edges and the position in the
+    vertex set of each vertex of the motif in `_ALL_MOTIF_EDGES`.
+  """
+
+  motif_edges = _ALL_MOTIF_EDGES[motif_name]
+  n_verts = 2 if motif_name in ["Ms", "Md"] else 3
+  local_edges = _LOCAL_EDGES[n_verts]
+  table = []
+
+  for pattern in range(2 ** len(local_edges)):
+    present = {e for e in range(len(local_edges)) if (pattern >> e) & 1}
+    instances = {}
+
+    for perm in itertools.permutations(range(n_verts)):
+      instance = frozenset(local_edges.index((perm[u], perm[v])) for u, v in motif_edges)
+
+      if (motif_type == "func" and instance <= present) or \
+         (motif_type == "struc" and instance == present):
+        instances.setdefault(instance, list(perm))
+
+    table.append([(sorted(instance), instances[instance])
+                  for instance in sorted(instances, key=sorted)])
+
+  return table
+
+
+def _iter_instances(adj_mat, motif_name, motif_type, mam_weight_type, batch_size):
+
+  """
+  Iterate over the instances of a motif in batches.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+  motif_name : str
+    Motif whose instances to list.
+  motif_type : str
+    Type of motif instance.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  batch_size : int
+    Maximum number of instances in each batch.
+
+  Yields
+  ------
+  verts : array
+    An array of shape `(n_instances, n_verts)` holding the vertices
+    of each instance in the order of the motif in `_ALL_MOTIF_EDGES`.
+  weights : array
+    The weight of each instance.
+  """
+
+  n_verts = 2 if motif_name in ["Ms", "Md"] else 3
+  table = _get_role_table(motif_name, motif_type)
+
+  for verts, edge_weights in _iter_vertex_sets(adj_mat, motif_name, motif_type, batch_size):
+    patterns = (edge_weights != 0).astype(np.int64) @ (2 ** np.arange(edge_weights.shape[1]))
+    instance_verts = [np.zeros((0, n_verts), dtype=np.int64)]
+    instance_weights = [np.zeros(0)]
+
+    for pattern in np.unique(patterns):
+      inds = np.flatnonzero(patterns == pattern)
+
+      for instance, perm in table[pattern]:
+        instance_verts.append(verts[inds][:, perm])
+        instance_weights.append(_get_instance_weights(edge_weights[np.ix_(inds, instance)],
+                                                      mam_weight_type))
+
+    all_verts = np.concatenate(instance_verts)
+    all_weights = np.concatenate(instance_weights)
+
+    for first in range(0, len(all_weights), batch_size):
+      yield all_verts[first:first + batch_size], all_weights[first:first + batch_size]
+
+
+def _iter_vertex_sets(adj_mat, motif_name, motif_type, max_chunk):
+
+  """
+  Iterate over the vertex sets which can hold instances of a motif.
+
+  The vertex sets are listed in chunks:
+  the edges for the motifs on two vertices,
+  the triangles for the triangle motifs,
+  and the open wedges, together with the triangles
+  for functional instances, for the other motifs.
+  The weights of the edges of the triangles are looked up at once,
+  while those of the edges and open wedges are read off
+  from the positions of their edges.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+  motif_name : str
+    Motif whose instances to list.
+  motif_type : str
+    Type of motif instance.
+    One of `"func"` or `"struc"`.
+  max_chunk : int
+    Maximum number of candidate vertex sets to hold in memory at once.
+
+  Yields
+  ------
+  verts : array
+    An array of shape `(n_sets, n_verts)` holding the vertices of each set.
+  weights : array
+    An array of shape `(n_sets, n_edges)` holding the weight of each
+    directed edge `_LOCAL_EDGES[n_verts][e]` of each set,
+    or zero if the edge is missing.
+  """
+
+  # look up all six directed edges of each triangle at once
+  if motif_name in _MOTIF_EDGES or (motif_type == "func" and motif_name not in ["Ms", "Md"]):
+    weight_mat = _get_weight_matrix(adj_mat)
+    weight_keys = mcut._csr_keys(weight_mat)
+
+    for verts in _iter_triangles(adj_mat.get("J"), max_chunk):
+      rows = np.concatenate([verts[:, u] for u, _ in _TRIANGLE_EDGES])
+      cols = np.concatenate([verts[:, v] for _, v in _TRIANGLE_EDGES])
+      weights = mcut._lookup(weight_mat, rows, cols, weight_keys)
+      yield verts, weights.reshape((len(_TRIANGLE_EDGES), -1)).T
+
+  if motif_name in _MOTIF_EDGES:
+    return
+
+  und_mat, und_rows, out_weights, in_weights = _get_undirected_weights(adj_mat)
+
+  if motif_name in ["Ms", "Md"]:
+    pos = np.flatnonzero(und_rows < und_mat.indices)
+
+    for first in range(0, len(pos), max_chunk):
+      chunk = pos[first:first + max_chunk]
+      yield (np.column_stack([und_rows[chunk], und_mat.indices[chunk]]),
+             np.column_stack([out_weights[chunk], in_weights[chunk]]))
+
+    return
+
+  # the edges between the other vertices of an open wedge are missing
+  for verts, pos in _iter_open_wedges(und_mat, max_chunk):
+    zeros = np.zeros(len(verts))
+    yield verts, np.column_stack([out_weights[pos[:, 0]], in_weights[pos[:, 0]],
+                                  out_weights[pos[:, 1]], in_weights[pos[:, 1]],
+                                  zeros, zeros])
+
+
+def _get_weight_matrix(adj_mat):
+
+  """
+  Get the weights of the edges of a graph, without self-loops.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+
+  Returns
+  -------
+  sparse matrix
+    The canonical CSR matrix `J * G`.
+  """
+
+  J = sparse.csr_matrix(adj_mat.get("J"))
+  weight_mat = sparse.csr_matrix(J.multiply(adj_mat.get("G")), dtype=float)
+  weight_mat.sum_duplicates()
+
+  return weight_mat
+
+
+def _get_undirected_weights(adj_mat):
+
+  """
+  Get the weights of both directions of each undirected edge of a graph.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+
+  Returns
+  -------
+  und_mat : sparse matrix
+    The undirected adjacency matrix of the graph
+    in canonical CSR form without self-loops.
+  und_rows : array
+    The row of each stored entry of `und_mat`.
+  out_weights, in_weights : array
+    The weight of the directed edge from the row to the column
+    of each stored entry of `und_mat`, and back,
+    or zero if the edge is missing.
+  """
+
+  weight_mat = _get_weight_matrix(adj_mat)
+  weight_keys = mcut._csr_keys(weight_mat)
+  J = sparse.csr_matrix(adj_mat.get("J"))
+  und_mat = sparse.csr_matrix((J + J.T) > 0, dtype=float)
+  und_mat.sort_indices()
+  und_rows = np.repeat(np.arange(und_mat.shape[0]), np.diff(und_mat.indptr))
+  out_weights = mcut._lookup(weight_mat, und_rows, und_mat.indices, weight_keys)
+
+  # the transpose of the symmetric pattern gives the position of each reverse edge
+  positions = sparse.csr_matrix((np.arange(und_mat.nnz), und_mat.indices, und_mat.indptr),
+                                shape=und_mat.shape)
+  in_weights = out_weights[sparse.csr_matrix(positions.T).data]
+
+  return und_mat, und_rows, out_weights, in_weights
+
+
+def _get_census(adj_mat):
+
+  """
+  Count the instances of every motif in one pass.
+
+  The motifs on two vertices are counted over the connected pairs,
+  and the motifs on three vertices over the triangles,
+  as classified by `_classify_triangles`.
+  The motifs on three vertices also have instances
+  on the open wedges, which are not listed.
+  Their instances on all wedges, open or closed,
+  are instead summed from the degrees of each centre vertex
+  by `_add_wedge_totals`,
+  and those on the wedges contained in triangles are subtracted.
+  The cost is therefore that of one triangle enumeration
+  together with a few passes over the edges.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+
+  Returns
+  -------
+  census : dict
+    The total weights `census[motif_type][mam_weight_type][motif_name]`.
+  """
+
+  motif_names = mcut.get_motif_names()
+  tables = {(motif_name, motif_type): _get_role_table(motif_name, motif_type)
+            for motif_name in motif_names for motif_type in ("func", "struc")}
+  census = {motif_type: {mam_weight_type: dict.fromkeys(motif_names, 0)
+                         for mam_weight_type in ("unweighted", "mean", "product")}
+            for motif_type in ("func", "struc")}
+
+  # motifs on two vertices, over the connected pairs
+  und_mat, und_rows, out_weights, in_weights = _get_undirected_weights(adj_mat)
+  pos = np.flatnonzero(und_rows < und_mat.indices)
+  _add_pattern_totals(census, tables, np.column_stack([out_weights[pos], in_weights[pos]]), 1)
+
+  # motifs on three vertices, over the triangles
+  weights = _classify_triangles(adj_mat)[2]
+  _add_pattern_totals(census, tables, weights, 1)
+
+  # motifs on three vertices, over the wedges not contained in triangles
+  _add_wedge_totals(census, tables, und_mat.shape[0], und_rows, out_weights, in_weights)
+
+  for centre, u, w in ((0, 1, 2), (1, 0, 2), (2, 0, 1)):
+    cols = [_TRIANGLE_EDGES.index(edge) for edge in ((centre, u), (u, centre),
+                                                     (centre, w), (w, centre))]
+    zeros = np.zeros((len(weights), 2))
+    _add_pattern_totals(census, tables, np.column_stack([weights[:, cols], zeros]), -1)
+
+  for motif_type, totals in census.items():
+    for mam_weight_type, motif_totals in totals.items():
+      convert = int if mam_weight_type == "unweighted" else float
+      totals[mam_weight_type] = {motif_name: convert(total)
+                                 for motif_name, total in motif_totals.items()}
+
+  return census
+
+
+def _add_pattern_totals(census, tables, edge_weights, sign):
+
+  """
+  Add the total weights of the motif instances on some vertex sets.
+
+  Parameters
+  ----------
+  census : dict
+    The totals `census[motif_type][mam_weight_type][motif_name]`,
+    which are updated in place.
+  tables : dict
+    The role table of each motif and motif type,
+    as from `_get_role_table`.
+  edge_weights : array
+    An array of shape `(n_sets, n_edges)` holding the weight of each
+    directed edge `_LOCAL_EDGES[n_verts][e]` of each vertex set,
+    or zero if the edge is missing.
+  sign : int
+    One to add the totals or minus one to subtract them.
+  """
+
+  patterns = (edge_weights != 0).astype(np.int64) @ (2 ** np.arange(edge_weights.shape[1]))
+
+  for pattern in np.unique(patterns):
+    inds = np.flatnonzero(patterns == pattern)
+    totals = {}
+
+    for (motif_name, motif_type), table in tables.items():
+      if len(table) != 2 ** edge_weights.shape[1]:
+        continue
+
+      # instances shared between motifs are summed once
+      for instance, _ in table[pattern]:
+        if tuple(instance) not in totals:
+          instance_weights = edge_weights[np.ix_(inds, instance)]
+          totals[tuple(instance)] = {
+            "unweighted": len(inds),
+            "mean": _get_instance_weights(instance_weights, "mean").sum(),
+            "product": _get_instance_weights(instance_weights, "product").sum()
+          }
+
+        for mam_weight_type, total in totals[tuple(instance)].items():
+          census[motif_type][mam_weight_type][motif_name] += sign * total
+
+
+def _add_wedge_totals(census, tables, # pylint: disable=too-many-positional-arguments
+                      n, und_rows, out_weights, in_weights):
+
+  """
+  Add the total weights of the motif instances on all wedges.
+
+  A wedge is a vertex, its centre, together with two of its neighbours,
+  whether or not these are adjacent to each other,
+  and its pattern is that of an open wedge.
+  The neighbours of each centre are split by which of the edges to
+  and from the centre are present, and an instance uses some of
+  the edges between the centre and each of the two neighbours.
+  Summing over ordered pairs of distinct neighbours,
+  the total unweighted, mean or product weight of each instance
+  then follows from sums over the neighbours of each centre,
+  less the terms pairing a neighbour with itself.
+
+  Parameters
+  ----------
+  census : dict
+    The totals `census[motif_type][mam_weight_type][motif_name]`,
+    which are updated in place.
+  tables : dict
+    The role table of each motif and motif type,
+    as from `_get_role_table`.
+  n : int
+    The number of vertices.
+  und_rows : array
+    The centre of each stored entry of the undirected adjacency matrix.
+  out_weights, in_weights : array
+    The weight of the edge from the centre to the neighbour
+    of each stored entry, and back, or zero if the edge is missing.
+  """
+
+  kinds = (out_weights != 0) + 2 * (in_weights != 0)
+  members = {kind: np.flatnonzero(kinds == kind) for kind in (1, 2, 3)}
+  stats = {}
+  totals = {}
+
+  for (motif_name, motif_type), table in tables.items():
+    if len(table) != 2 ** len(_LOCAL_EDGES[3]):
+      continue
+
+    for kind_u, kind_w in itertools.product((1, 2, 3), repeat=2):
+      for instance, _ in table[kind_u + 4 * kind_w]:
+        subset_u = sum(2 ** e for e in instance if e < 2)
+        subset_w = sum(2 ** (e - 2) for e in instance if e >= 2)
+        key = (kind_u, kind_w, subset_u, subset_w)
+
+        for kind, subset in ((kind_u, subset_u), (kind_w, subset_w)):
+          if (kind, subset) not in stats:
+            stats[(kind, subset)] = _get_neighbour_sums(n, und_rows[members[kind]],
+                                                        out_weights[members[kind]],
+                                                        in_weights[members[kind]], subset)
+
+        if key not in totals:
+          totals[key] = _get_wedge_total(stats[(kind_u, subset_u)], stats[(kind_w, subset_w)],
+                                         len(instance), kind_u == kind_w)
+
+        # each wedge is visited in both orders
+        for mam_weight_type, total in totals[key].items():
+          census[motif_type][mam_weight_type][motif_name] += total / 2
+
+
+def _get_wedge_total(stats_u, stats_w, n_edges, same_kind):
+
+  """
+  Sum the weights of one instance over ordered pairs of neighbours.
+
+  Parameters
+  ----------
+  stats_u, stats_w : tuple
+    The weights of the edges used by the instance
+    to the first and second neighbours of each centre,
+    as from `_get_neighbour_sums`.
+  n_edges : int
+    The number of edges of the instance.
+  same_kind : bool
+    Whether both neighbours are taken from the same pairs,
+    so that a neighbour paired with itself must be excluded.
+
+  Returns
+  -------
+  dict
+    The total unweighted, mean and product weights.
+  """
+
+  prods_u, sums_u, counts_u, prod_sums_u, sum_sums_u = stats_u
+  prods_w, sums_w, counts_w, prod_sums_w, sum_sums_w = stats_w
+  total = {
+    "unweighted": counts_u @ counts_w,
+    "mean": (sum_sums_u @ counts_w + counts_u @ sum_sums_w) / n_edges,
+    "product": prod_sums_u @ prod_sums_w
+  }
+
+  # pairs of a neighbour with itself
+  if same_kind:
+    total["unweighted"] -= len(prods_u)
+    total["mean"] -= (sums_u.sum() + sums_w.sum()) / n_edges
+    total["product"] -= prods_u @ prods_w
+
+  return total
+
+
+def _get_neighbour_sums(n, centres, out_weights, in_weights, subset):
+
+  """
+  Sum the weights of some of the edges to the neighbours of each vertex.
+
+  Parameters
+  ----------
+  n : int
+    The number of vertices.
+  centres : array
+    The centre of each pair of a centre and a neighbour.
+  out_weights, in_weights : array
+    The weight of the edge from the centre to the neighbour
+    of each pair, and back.
+  subset : int
+    Which edges to use, with bit zero for the edge to the
+    neighbour and bit one for the edge back.
+
+  Returns
+  -------
+  prods, sums : array
+    The product and sum of the weights of the edges of each pair.
+  counts, prod_sums, sum_sums : array
+    The number of pairs, and the sums of `prods` and `sums`,
+    for each centre.
+  """
+
+  prods = np.ones(len(centres))
+  sums = np.zeros(len(centres))
+
+  for bit, weights in ((1, out_weights), (2, in_weights)):
+    if subset & bit:
+      prods = prods * weights
+      sums = sums + weights
+
+  return (prods, sums, np.bincount(centres, minlength=n),
+          np.bincount(centres, prods, minlength=n), np.bincount(centres, sums, minlength=n))
+
+
+def _get_edge_participation(adj_mat, csr_mat, # pylint: disable=too-many-positional-arguments
+                            motif_name, motif_type, mam_weight_type, batch_size):
+
+  """
+  Sum the weights of the motif instances using each edge.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+  csr_mat : sparse matrix
+    The adjacency matrix in CSR form, whose stored entries
+    need not be sorted.
+  motif_name : str
+    Motif whose instances to list.
+  motif_type : str
+    Type of motif instance.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  batch_size : int
+    Maximum number of instances to hold in memory at once.
+
+  Returns
+  -------
+  array
+    The total weight of the instances using the edge of each
+    stored entry of `csr_mat`, in the order of its `indices`.
+  """
+
+  n_cols = csr_mat.shape[1]
+  rows = np.repeat(np.arange(csr_mat.shape[0], dtype=np.int64), np.diff(csr_mat.indptr))
+  keys = rows * n_cols + csr_mat.indices
+
+  order = np.argsort(keys, kind="stable")
+  sorted_keys = keys[order]
+  participation = np.zeros(csr_mat.nnz, dtype=np.int64 if mam_weight_type == "unweighted"
+                           else float)
+
+  for verts, weights in _iter_instances(adj_mat, motif_name, motif_type,
+                                        mam_weight_type, batch_size):
+    for u, v in _ALL_MOTIF_EDGES[motif_name]:
+      entries = order[np.searchsorted(sorted_keys, verts[:, u] * n_cols + verts[:, v])]
+
+      if mam_weight_type == "unweighted":
+        participation += np.bincount(entries, minlength=csr_mat.nnz)
+
+      else:
+        participation += np.bincount(entries, weights, minlength=csr_mat.nnz)
+
+  return participation
@@ -0,0 +1,777 @@
+"""
+Functions for maintaining motif adjacency matrices of changing graphs
+are in `motifcluster.incremental`.
+"""
+
+import itertools
+import multiprocessing
+import numpy as np
+from scipy import sparse
+
+from motifcluster import enumeration as mcen
+from motifcluster import indicators as mcin
+from motifcluster import motifadjacency as mcmo
+from motifcluster import parallel as mcpa
+from motifcluster import utils as mcut
+
+# Deriving a motif adjacency matrix in a series is preferred
+# while this multiple of the number of vertex sets to recompute
+# is at most the number of paths of length two in the graph,
+# from timings of both on Erdos-Renyi graphs.
+_DERIVE_COST_RATIO = 20
+
+class MotifAdjacencyState:
+
+  """
+  Motif adjacency matrix of a changing graph.
+
+  Hold the adjacency matrix of a graph together with one of its
+  motif adjacency matrices, and keep the motif adjacency matrix up to
+  date as edges are inserted, deleted or reweighted.
+  Every motif instance lies on two or three vertices,
+  and its weight depends only on the edges among them,
+  so a change to the edges between `u` and `v` can only
+  change the instances on `{u, v}` and on `{u, v, w}`,
+  where `w` is a neighbour of `u` or `v`.
+  An update recomputes the contributions of just these vertex sets,
+  before and after the change,
+  so its cost is proportional to the neighbourhoods
+  of the changed edges rather than to the size of the graph.
+  The changes to the motif adjacency matrix are accumulated,
+  and merged into it when it is next requested.
+  The number of instances counting towards each entry is kept alongside,
+  so that an entry is removed exactly when its last instance is,
+  rather than left holding the rounding error of the weighted changes.
+  Self-loops do not form part of any motif instance,
+  so they are dropped.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    The initial adjacency matrix, with non-negative weights.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Attributes
+  ----------
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix.
+  mam_weight_type : str
+    The weighting scheme.
+  shape : tuple
+    The shape of the adjacency matrix.
+
+  Examples
+  --------
+  >>> adj_mat = np.array([[0, 1, 0], [0, 0, 1], [0, 0, 0]])
+  >>> state = MotifAdjacencyState(adj_mat, "M1", "func")
+  >>> state.update([2], [0], [1])
+  >>> state.motif_adj_mat
+  """
+
+  def __init__(self, adj_mat, motif_name, motif_type="struc", mam_weight_type="unweighted"):
+
+    assert motif_name in mcut.get_motif_names()
+    assert motif_type in ["struc", "func"]
+    assert mam_weight_type in ["unweighted", "mean", "product"]
+
+    adj_mat = sparse.csr_matrix(adj_mat, dtype=float)
+    adj_mat.setdiag(0)
+    adj_mat.eliminate_zeros()
+    assert (adj_mat.data > 0).all()
+
+    self.motif_name = motif_name
+    self.motif_type = motif_type
+    self.mam_weight_type = mam_weight_type
+    self.shape = adj_mat.shape
+
+    # edge weights and undirected neighbourhoods
+    adj_coo = adj_mat.tocoo()
+    self._weights = dict(zip(zip(adj_coo.row.tolist(), adj_coo.col.tolist()),
+                             adj_coo.data.tolist()))
+    self._nbrs = [set() for _ in range(self.shape[0])]
+
+    for u, v in self._weights:
+      self._nbrs[u].add(v)
+      self._nbrs[v].add(u)
+
+    self._adj_mat = adj_mat
+    self._motif_adj_mat, self._counts = _build_with_counts(adj_mat, motif_name, motif_type,
+                                                           mam_weight_type)
+    self._pending = []
+    self._table = _get_local_table(motif_name, motif_type)
+
+
+  @property
+  def adj_mat(self):
+
+    """
+    The current adjacency matrix, as a sparse matrix in CSR form.
+    """
+
+    if self._adj_mat is None:
+      rows, cols = np.array(list(self._weights.keys()), dtype=np.int64).reshape((-1, 2)).T
+      data = np.array(list(self._weights.values()), dtype=float)
+      self._adj_mat = sparse.csr_matrix((data, (rows, cols)), shape=self.shape)
+
+    return self._adj_mat
+
+
+  @property
+  def motif_adj_mat(self):
+
+    """
+    The current motif adjacency matrix, as a sparse matrix in CSR form.
+    """
+
+    if self._pending:
+      rows, cols, vals, counts = (np.concatenate(arrays) for arrays in zip(*self._pending))
+      delta = sparse.csr_matrix((vals, (rows, cols)), shape=self.shape)
+      count_delta = sparse.csr_matrix((counts, (rows, cols)), shape=self.shape)
+      self._motif_adj_mat, self._counts = _apply_delta(self._motif_adj_mat, self._counts,
+                                                       delta, count_delta)
+      self._pending = []
+
+    return self._motif_adj_mat
+
+
+  def update(self, rows, cols, weights):
+
+    """
+    Change a batch of edges.
+
+    Set the weight of each directed edge from `rows[k]` to `cols[k]`
+    to `weights[k]`, which inserts the edge if it is missing,
+    reweights it if it is present,
+    and deletes it if the new weight is zero.
+    Later changes to the same edge in a batch take precedence.
+
+    Parameters
+    ----------
+    rows, cols : array
+      The source and target vertices of the changed edges.
+      Each source must differ from its target.
+    weights : array
+      The new weight of each edge, non-negative.
+    """
+
+    changes = {}
+
+    for u, v, weight in zip(np.asarray(rows).tolist(), np.asarray(cols).tolist(),
+                            np.asarray(weights, dtype=float).tolist()):
+      assert u != v and weight >= 0
+      changes[(u, v)] = weight
+
+    old_weights = {edge: self._weights.get(edge, 0) for edge in changes}
+    changes = {edge: weight for edge, weight in changes.items() if weight != old_weights[edge]}
+
+    if not changes:
+      return
+
+    # vertex sets whose edges have changed
+    n_verts = 2 if self.motif_name in ["Ms", "Md"] else 3
+    local_edges = mcen._LOCAL_EDGES[n_verts]
+    changed_nbrs = {}
+
+    for u, v in changes:
+      changed_nbrs.setdefault(u, set()).add(v)
+      changed_nbrs.setdefault(v, set()).add(u)
+
+    def get_new_weight(edge):
+      return self._weights.get(edge, 0)
+
+    def get_old_weight(edge):
+      return old_weights[edge] if edge in old_weights else self._weights.get(edge, 0)
+
+    # apply the changes
+    for (u, v), weight in changes.items():
+      if weight == 0:
+        del self._weights[(u, v)]
+
+        if (v, u) not in self._weights:
+          self._nbrs[u].discard(v)
+          self._nbrs[v].discard(u)
+
+      else:
+        self._weights[(u, v)] = weight
+        self._nbrs[u].add(v)
+        self._nbrs[v].add(u)
+
+    self._adj_mat = None
+    vertex_sets = _get_changed_vertex_sets(changes, self._nbrs, changed_nbrs, n_verts,
+                                           self.motif_name in mcen._MOTIF_EDGES)
+
+    # replace the old contributions with the new ones
+    for sign, get_weight in ((-1, get_old_weight), (1, get_new_weight)):
+      weights = np.array([[get_weight((verts[i], verts[j])) for i, j in local_edges]
+                          for verts in vertex_sets], dtype=float)
+      weights = weights.reshape((len(vertex_sets), len(local_edges)))
+      rows, cols, vals = _local_entries(np.array(vertex_sets, dtype=np.int64).reshape(
+        (-1, n_verts)), weights, self._table, self.mam_weight_type)
+      self._pending.append((rows, cols, sign * vals, np.full(len(vals), sign)))
+
+
+def build_motif_adjacency_matrix_series(adj_mats, motif_name, motif_type="struc",
+                                        mam_weight_type="unweighted", n_jobs=1):
+
+  """
+  Build the motif adjacency matrices of a series of graph snapshots.
+
+  The snapshots share a vertex set and typically most of their edges,
+  so only the first motif adjacency matrix of a chain
+  of consecutive snapshots is built in full.
+  Each later one is derived from the previous one by recomputing
+  the contributions of the vertex sets around the edges
+  which differ between the snapshots, as in `MotifAdjacencyState`.
+  If deriving a matrix is estimated to cost more than a full build,
+  as can happen for large changes around hubs,
+  the rest of the chain is built in full.
+  The estimate compares the vertex sets to recompute
+  with the paths of length two in the graph,
+  so the choice depends only on the snapshots.
+  The series can be split into independent chains,
+  which are built in parallel.
+  As in `MotifAdjacencyState`, self-loops are dropped.
+
+  Parameters
+  ----------
+  adj_mats : list of matrix
+    The adjacency matrices of the snapshots, all of the same shape,
+    with non-negative weights.
+  motif_name : str
+    Motif used for the motif adjacency matrices.
+  motif_type : str
+    Type of motif adjacency matrices to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  n_jobs : int
+    Number of chains of consecutive snapshots,
+    each built in its own worker process.
+    `None` or `1` builds the whole series as one chain,
+    and `-1` uses one chain for each CPU.
+
+  Returns
+  -------
+  list of sparse matrix
+    The motif adjacency matrix of each snapshot, in order.
+
+  Examples
+  --------
+  >>> adj_mat = np.array([[0, 1, 0], [0, 0, 1], [0, 0, 0]])
+  >>> adj_mat_next = np.array([[0, 1, 0], [0, 0, 1], [1, 0, 0]])
+  >>> build_motif_adjacency_matrix_series([adj_mat, adj_mat_next], "M1", "func")
+  """
+
+  assert len(adj_mats) > 0
+  n_jobs = mcpa._get_n_jobs(n_jobs)
+  chains = [(adj_mats[start:stop], motif_name, motif_type, mam_weight_type)
+            for start, stop in mcpa._get_row_blocks(len(adj_mats), n_jobs)]
+
+  if len(chains) == 1:
+    return _build_chain(*chains[0])
+
+  with multiprocessing.get_context().Pool(len(chains)) as pool:
+    chain_mams = pool.starmap(_build_chain, chains, chunksize=1)
+
+  return [motif_adj_mat for mams in chain_mams for motif_adj_mat in mams]
+
+
+def _build_chain(adj_mats, motif_name, motif_type, mam_weight_type):
+
+  """
+  Build the motif adjacency matrices of a chain of snapshots.
+
+  Parameters
+  ----------
+  adj_mats : list of matrix
+    The adjacency matrices of the snapshots in the chain.
+  motif_name : str
+    Motif used for the motif adjacency matrices.
+  motif_type : str
+    Type of motif adjacency matrices to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  list of sparse matrix
+    The motif adjacency matrix of each snapshot, in order.
+  """
+
+  adj_mats = [_drop_self_loops(adj_mat) for adj_mat in adj_mats]
+  table = _get_local_table(motif_name, motif_type)
+  motif_adj_mat, counts = _build_with_counts(adj_mats[0], motif_name, motif_type,
+                                             mam_weight_type)
+  motif_adj_mats = [motif_adj_mat]
+  derive = True
+
+  for old_mat, new_mat in zip(adj_mats[:-1], adj_mats[1:]):
+    derive = derive and _is_derive_cheaper(old_mat, new_mat, motif_name)
+
+    # build in full once deriving is estimated to be slower
+    if not derive:
+      motif_adj_mats.append(mcmo.build_motif_adjacency_matrix(new_mat, motif_name, motif_type,
+                                                              mam_weight_type))
+      continue
+
+    delta, count_delta = _get_motif_delta(old_mat, new_mat, motif_name, table, mam_weight_type)
+    motif_adj_mat, counts = _apply_delta(motif_adj_mats[-1], counts, delta, count_delta)
+    motif_adj_mats.append(motif_adj_mat)
+
+  return motif_adj_mats
+
+
+def _is_derive_cheaper(old_mat, new_mat, motif_name):
+
+  """
+  Estimate whether deriving a motif adjacency matrix beats building it.
+
+  Deriving recomputes the vertex sets around the changed edges,
+  of which there are at most the sizes of the neighbourhoods
+  of their endpoints, or of the smaller neighbourhood
+  for the triangle motifs.
+  Building in full costs of order the number of paths of length two,
+  or of edges for the motifs on two vertices.
+
+  Parameters
+  ----------
+  old_mat, new_mat : sparse matrix
+    The adjacency matrices before and after the change,
+    in canonical CSR form without self-loops.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+
+  Returns
+  -------
+  bool
+    Whether deriving the motif adjacency matrix of `new_mat`
+    is estimated to be cheaper than building it in full.
+  """
+
+  rows, cols = _get_edge_diff(old_mat, new_mat)
+
+  if motif_name in ["Ms", "Md"]:
+    return _DERIVE_COST_RATIO * len(rows) <= old_mat.nnz
+
+  degs = np.diff(sparse.csr_matrix((old_mat + old_mat.T) > 0).indptr).astype(np.int64)
+
+  if motif_name in mcen._MOTIF_EDGES:
+    derive_cost = np.minimum(degs[rows], degs[cols]).sum()
+
+  else:
+    derive_cost = (degs[rows] + degs[cols]).sum()
+
+  return _DERIVE_COST_RATIO * derive_cost <= (degs ** 2).sum()
+
+
+def _drop_self_loops(adj_mat):
+
+  """
+  Remove the self-loops from an adjacency matrix.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    An adjacency matrix, with non-negative weights.
+
+  Returns
+  -------
+  sparse matrix
+    The adjacency matrix without self-loops, in canonical CSR form
+    with floating point weights.
+  """
+
+  adj_mat = sparse.csr_matrix(adj_mat, dtype=float, copy=True)
+  adj_mat.setdiag(0)
+  adj_mat.eliminate_zeros()
+  adj_mat.sum_duplicates()
+  assert (adj_mat.data > 0).all()
+
+  return adj_mat
+
+
+def _build_with_counts(adj_mat, motif_name, motif_type, mam_weight_type):
+
+  """
+  Build a motif adjacency matrix together with its instance counts.
+
+  Parameters
+  ----------
+  adj_mat : sparse matrix
+    The adjacency matrix, without self-loops.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  motif_adj_mat : sparse matrix
+    The motif adjacency matrix.
+  counts : sparse matrix
+    The number of motif instances counting towards each entry,
+    or `None` if `mam_weight_type` is `"unweighted"`,
+    as the motif adjacency matrix then holds these counts itself.
+  """
+
+  if mam_weight_type == "unweighted":
+    return mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, motif_type,
+                                             mam_weight_type), None
+
+  # share the indicators between the two matrices
+  bundle = mcin.IndicatorBundle(adj_mat, "sparse")
+  counts = mcmo.build_motif_adjacency_matrix(bundle, motif_name, motif_type, "unweighted")
+  motif_adj_mat = mcmo.build_motif_adjacency_matrix(bundle, motif_name, motif_type,
+                                                    mam_weight_type)
+
+  return motif_adj_mat, counts
+
+
+def _apply_delta(motif_adj_mat, counts, delta, count_delta):
+
+  """
+  Add a change to a motif adjacency matrix.
+
+  Entries whose instances have all been removed are dropped,
+  rather than left holding the rounding error of the change.
+
+  Parameters
+  ----------
+  motif_adj_mat : sparse matrix
+    The motif adjacency matrix before the change.
+  counts : sparse matrix
+    The number of motif instances counting towards each entry
+    before the change, or `None` if the motif adjacency matrix
+    is unweighted and so holds these counts itself.
+  delta : sparse matrix
+    The change in the motif adjacency matrix.
+  count_delta : sparse matrix
+    The change in the number of instances counting towards each entry.
+
+  Returns
+  -------
+  motif_adj_mat : sparse matrix
+    The motif adjacency matrix after the change.
+  counts : sparse matrix
+    The number of instances counting towards each entry
+    after the change, or `None`.
+  """
+
+  motif_adj_mat = sparse.csr_matrix(motif_adj_mat + delta)
+
+  if counts is not None:
+    counts = sparse.csr_matrix(counts + count_delta)
+    counts.eliminate_zeros()
+    motif_adj_mat = sparse.csr_matrix(motif_adj_mat.multiply(counts.astype(bool)))
+
+  motif_adj_mat.eliminate_zeros()
+
+  return motif_adj_mat, counts
+
+
+def _get_motif_delta(old_mat, new_mat, motif_name, table, mam_weight_type):
+
+  """
+  Get the change in a motif adjacency matrix between two snapshots.
+
+  This is the vectorized counterpart of `MotifAdjacencyState.update`,
+  for when both adjacency matrices are available.
+
+  Parameters
+  ----------
+  old_mat, new_mat : sparse matrix
+    The adjacency matrices before and after the change,
+    in canonical CSR form without self-loops.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  table : list
+    The motif instances on each pattern, from `_get_local_table`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  delta : sparse matrix
+    The new motif adjacency matrix minus the old one.
+  count_delta : sparse matrix
+    The change in the number of motif instances
+    counting towards each entry.
+  """
+
+  n_verts = 2 if motif_name in ["Ms", "Md"] else 3
+  rows, cols = _get_edge_diff(old_mat, new_mat)
+  und_mat = sparse.csr_matrix(((old_mat + old_mat.T + new_mat + new_mat.T) > 0).astype(float))
+  und_mat.sort_indices()
+  verts = _get_diff_vertex_sets(und_mat, np.minimum(rows, cols), np.maximum(rows, cols),
+                                n_verts, motif_name in mcen._MOTIF_EDGES)
+  local_edges = mcen._LOCAL_EDGES[n_verts]
+
+  # look up all of the directed edges of each vertex set at once
+  edge_rows = np.concatenate([verts[:, i] for i, _ in local_edges])
+  edge_cols = np.concatenate([verts[:, j] for _, j in local_edges])
+  entries = []
+
+  for sign, adj_mat in ((-1, old_mat), (1, new_mat)):
+    weights = mcut._lookup(adj_mat, edge_rows, edge_cols).reshape((len(local_edges), -1)).T
+    rows, cols, vals = _local_entries(verts, weights, table, mam_weight_type)
+    entries.append((rows, cols, sign * vals, np.full(len(vals), sign)))
+
+  rows, cols, vals, counts = (np.concatenate(arrays) for arrays in zip(*entries))
+
+  delta = sparse.csr_matrix((vals, (rows, cols)), shape=old_mat.shape)
+  count_delta = sparse.csr_matrix((counts, (rows, cols)), shape=old_mat.shape)
+
+  return delta, count_delta
+
+
+def _get_diff_vertex_sets(und_mat, us, vs, n_verts, triangles_only):
+
+  """
+  Get the vertex sets whose motif instances may have changed.
+
+  This is the vectorized counterpart of `_get_changed_vertex_sets`.
+
+  Parameters
+  ----------
+  und_mat : sparse matrix
+    The undirected adjacency matrix of the union of the graphs before
+    and after the changes, in canonical CSR form without self-loops.
+  us, vs : array
+    The endpoints of the changed edges, with `us < vs`.
+  n_verts : int
+    The number of vertices of the motif, two or three.
+  triangles_only : bool
+    Whether the motif has edges between all three of its vertices.
+
+  Returns
+  -------
+  array
+    An array of shape `(n_sets, n_verts)` holding the vertices of each
+    set in increasing order, without repeated sets.
+  """
+
+  if n_verts == 2:
+    return np.unique(np.column_stack([us, vs]).reshape((-1, 2)), axis=0)
+
+  degs = np.diff(und_mat.indptr)
+
+  # for triangles, expand the smaller neighbourhood and check the other
+  if triangles_only:
+    use_u = degs[us] <= degs[vs]
+    segs = [np.where(use_u, us, vs)]
+    others = np.where(use_u, vs, us)
+
+  else:
+    segs = [us, vs]
+
+  triple_blocks = [np.zeros((0, 3), dtype=np.int64)]
+
+  for seg in segs:
+    pairs, pos = mcut._segment_positions(und_mat.indptr[seg], degs[seg])
+    ws = und_mat.indices[pos].astype(np.int64)
+    keep = (ws != us[pairs]) & (ws != vs[pairs])
+
+    if triangles_only:
+      keep &= mcut._lookup(und_mat, others[pairs], ws) != 0
+
+    triple_blocks.append(np.column_stack([us[pairs[keep]], vs[pairs[keep]], ws[keep]]))
+
+  triples = np.sort(np.concatenate(triple_blocks), axis=1)
+  n = und_mat.shape[0]
+
+  # unique rows, through linear keys if they fit
+  if n < 2 ** 21:
+    keys = np.unique((triples[:, 0] * n + triples[:, 1]) * n + triples[:, 2])
+    return np.column_stack([keys // (n * n), keys // n % n, keys % n])
+
+  return np.unique(triples, axis=0)
+
+
+def _get_edge_diff(old_mat, new_mat):
+
+  """
+  Get the edges which differ between two adjacency matrices.
+
+  Parameters
+  ----------
+  old_mat, new_mat : sparse matrix
+    The adjacency matrices before and after the change.
+
+  Returns
+  -------
+  rows, cols : array
+    The source and target vertices of the changed edges.
+  """
+
+  assert old_mat.shape == new_mat.shape
+  diff_mat = sparse.coo_matrix(new_mat - old_mat)
+  keep = diff_mat.data != 0
+
+  return diff_mat.row[keep].astype(np.int64), diff_mat.col[keep].astype(np.int64)
+
+
+def _get_changed_vertex_sets(changes, nbrs, changed_nbrs, n_verts, triangles_only):
+
+  """
+  Get the vertex sets whose motif instances may have changed.
+
+  Parameters
+  ----------
+  changes : dict
+    The changed directed edges `(u, v)`.
+  nbrs : list of set
+    The undirected neighbourhood of each vertex after the changes.
+  changed_nbrs : dict
+    For each vertex, the other endpoints of its changed edges,
+    which include its neighbours lost in the changes.
+  n_verts : int
+    The number of vertices of the motif, two or three.
+  triangles_only : bool
+    Whether the motif has edges between all three of its vertices.
+
+  Returns
+  -------
+  list of tuple
+    The sorted vertex sets of size `n_verts` containing
+    both endpoints of some changed edge,
+    and connected, or forming a triangle if `triangles_only`,
+    before or after the changes.
+  """
+
+  vertex_sets = set()
+
+  for u, v in changes:
+    u, v = min(u, v), max(u, v)
+
+    if n_verts == 2:
+      vertex_sets.add((u, v))
+      continue
+
+    u_nbrs = nbrs[u] | changed_nbrs[u]
+    v_nbrs = nbrs[v] | changed_nbrs[v]
+
+    # the triangle motifs only lie on triangles
+    others = u_nbrs & v_nbrs if triangles_only else u_nbrs | v_nbrs
+
+    for w in others:
+      if w not in (u, v):
+        vertex_sets.add(tuple(sorted((u, v, w))))
+
+  return sorted(vertex_sets)
+
+
+def _get_local_table(motif_name, motif_type):
+
+  """
+  Get the motif instances on each pattern of a small vertex set.
+
+  A functional instance is any set of directed edges forming the motif.
+  A structural instance must use all of the present directed edges,
+  so that the motif appears as an induced subgraph.
+
+  Parameters
+  ----------
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif instance.
+    One of `"func"` or `"struc"`.
+
+  Returns
+  -------
+  table : list
+    For each pattern of the directed edges `enumeration._LOCAL_EDGES`
+    on the vertices of the motif, a list of instances,
+    each given as a tuple `(edges, pairs)` of the indices in
+    `enumeration._LOCAL_EDGES` of its directed edges and the indices in
+    `enumeration._LOCAL_PAIRS` of the vertex pairs it counts towards.
+  """
+
+  motif_edges = mcen._ALL_MOTIF_EDGES[motif_name]
+  n_verts = 2 if motif_name in ["Ms", "Md"] else 3
+  local_edges = mcen._LOCAL_EDGES[n_verts]
+  anchors = mcen._MOTIF_ANCHORS.get(motif_name, range(n_verts))
+  table = []
+
+  for pattern in range(2 ** len(local_edges)):
+    present = {e for e in range(len(local_edges)) if (pattern >> e) & 1}
+    instances = {}
+
+    for perm in itertools.permutations(range(n_verts)):
+      instance = frozenset(local_edges.index((perm[u], perm[v])) for u, v in motif_edges)
+      pairs = [mcen._LOCAL_PAIRS[n_verts].index(tuple(sorted((perm[i], perm[j]))))
+               for i, j in itertools.combinations(anchors, 2)]
+
+      if (motif_type == "func" and instance <= present) or \
+         (motif_type == "struc" and instance == present):
+        instances[instance] = sorted(pairs)
+
+    table.append([(sorted(instance), instances[instance])
+                  for instance in sorted(instances, key=sorted)])
+
+  return table
+
+
+def _local_entries(verts, weights, table, mam_weight_type):
+
+  """
+  Compute the motif adjacency matrix entries from small vertex sets.
+
+  Parameters
+  ----------
+  verts : array
+    An array of shape `(n_sets, n_verts)` holding the vertices of each set.
+  weights : array
+    An array of shape `(n_sets, n_edges)` holding the weight of each
+    directed edge `enumeration._LOCAL_EDGES[n_verts][e]` of each set,
+    or zero if the edge is missing.
+  table : list
+    The motif instances on each pattern, from `_get_local_table`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  rows, cols, vals : array
+    The entries contributed by the motif instances on the vertex sets,
+    with repeated entries to be summed.
+  """
+
+  pairs = mcen._LOCAL_PAIRS[verts.shape[1]]
+  patterns = (weights != 0).astype(np.int64) @ (2 ** np.arange(weights.shape[1]))
+  rows = [np.zeros(0, dtype=np.int64)]
+  cols = [np.zeros(0, dtype=np.int64)]
+  vals = [np.zeros(0)]
+
+  for pattern in np.unique(patterns):
+    inds = np.flatnonzero(patterns == pattern)
+
+    for instance, instance_pairs in table[pattern]:
+      instance_weights = mcen._get_instance_weights(weights[np.ix_(inds, instance)],
+                                                    mam_weight_type)
+
+      for pair in instance_pairs:
+        i, j = pairs[pair]
+        rows += [verts[inds, i], verts[inds, j]]
+        cols += [verts[inds, j], verts[inds, i]]
+        vals += [instance_weights, instance_weights]
+
+  return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
@@ -3,11 +3,252 @@ Functions for building adjacency and indicator matrices
 are in `motifcluster.indicators`.
 """
 
+import functools
 import numpy as np
 from scipy import sparse
 
 import motifcluster.utils as mcut
+from motifcluster import backends as mcbe
 
+class IndicatorBundle:
+
+  """
+  Collection of indicator matrices of a graph.
+
+  Hold a graph adjacency matrix together with the indicator matrices
+  built from it.
+  Each indicator matrix is built lazily the first time it is requested,
+  from any others it depends on, and is then kept for later requests.
+  A bundle can be passed in place of an adjacency matrix
+  to the indicator matrix builders, to the `mam_*` functions
+  and to `build_motif_adjacency_matrix`,
+  so that sweeping several motifs or weighting schemes over
+  the same graph only builds each indicator matrix once.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    The original adjacency matrix.
+  mam_method : str
+    Which formulation the indicators are for.
+    One of `"dense"` or `"sparse"`,
+    or `None` to keep the format of `adj_mat`.
+  backend : str or backend
+    The backend for the sparse matrix products.
+    One of `"scipy"` or `"graphblas"`,
+    or a backend instance from `motifcluster.backends`.
+    The dense formulation always uses numpy.
+  dtype : dtype
+    The data type of the indicator matrices,
+    or `None` for the default types.
+    With an integer type, the weighted matrices such as `G` and `Gd`
+    keep the type of `adj_mat`, so that their weights are not rounded.
+
+  Attributes
+  ----------
+  adj_mat : matrix
+    The adjacency matrix in dense or sparse form.
+  mam_method : str
+    Which formulation the indicators are for.
+  backend : backend
+    The backend for the sparse matrix products.
+  dtype : dtype
+    The data type of the indicator matrices, or `None`.
+  shape : tuple
+    The shape of the adjacency matrix.
+  cache : dict
+    The indicator matrices built so far, keyed by name.
+
+  Examples
+  --------
+  >>> adj_mat = np.array(range(1, 10)).reshape((3, 3))
+  >>> bundle = IndicatorBundle(adj_mat, "sparse")
+  >>> bundle.get("Js")
+  """
+
+  def __init__(self, adj_mat, mam_method="sparse", backend="scipy", dtype=None):
+
+    assert mam_method in ["sparse", "dense", None]
+
+    if isinstance(adj_mat, IndicatorBundle):
+      adj_mat = adj_mat.adj_mat
+
+    if mam_method == "dense":
+      if sparse.issparse(adj_mat):
+        adj_mat = adj_mat.toarray()
+
+    elif mam_method == "sparse":
+      adj_mat = sparse.csr_matrix(adj_mat)
+
+    if mam_method is None:
+      mam_method = "sparse" if sparse.issparse(adj_mat) else "dense"
+
+    self.adj_mat = adj_mat
+    self.mam_method = mam_method
+    self.backend = mcbe._get_backend(backend if mam_method == "sparse" else "scipy")
+    self.dtype = None if dtype is None else np.dtype(dtype)
+    self.shape = adj_mat.shape
+    self.cache = {}
+
+
+  def is_sparse(self):
+
+    """
+    Check whether the indicator matrices are sparse.
+
+    Returns
+    -------
+    bool
+      Whether the adjacency matrix is held in sparse form.
+    """
+
+    return sparse.issparse(self.adj_mat)
+
+
+  def get(self, name):
+
+    """
+    Get an indicator matrix by name.
+
+    Parameters
+    ----------
+    name : str
+      The name of the matrix, such as `"J"`, `"Gs"` or `"Gsym"`.
+      A trailing `".T"`, as in `"Js.T"`, requests the transpose.
+
+    Returns
+    -------
+    matrix
+      The requested matrix, built now if it has not been already.
+    """
+
+    if name.endswith(".T"):
+      if name not in self.cache:
+        some_mat = self.get(name[:-2]).transpose()
+
+        if self.is_sparse():
+          some_mat = sparse.csr_matrix(some_mat)
+
+        self.cache[name] = some_mat
+
+      return self.cache[name]
+
+    builder = globals()["_build_" + name]
+
+    return builder(self)
+
+
+def _as_bundle(adj_mat, mam_method=None, backend=None, dtype=None):
+
+  """
+  Wrap an adjacency matrix in an indicator bundle.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    An adjacency matrix, or an existing bundle.
+  mam_method : str
+    Which formulation the indicators are for.
+    One of `"dense"` or `"sparse"`,
+    or `None` to keep the format of `adj_mat`.
+  backend : str or backend
+    The backend for the sparse matrix products,
+    or `None` to keep the backend of an existing bundle,
+    or otherwise to use scipy.
+  dtype : dtype
+    The data type of the indicator matrices,
+    or `None` to keep the type of an existing bundle.
+
+  Returns
+  -------
+  IndicatorBundle
+    The existing bundle if it has the requested formulation,
+    backend and data type,
+    or otherwise a new bundle holding `adj_mat`.
+  """
+
+  if isinstance(adj_mat, IndicatorBundle):
+    same_backend = backend in [None, adj_mat.backend, adj_mat.backend.name]
+    same_dtype = dtype is None or np.dtype(dtype) == adj_mat.dtype
+
+    if mam_method in [None, adj_mat.mam_method] and same_dtype and \
+       (same_backend or not adj_mat.is_sparse()):
+      return adj_mat
+
+    if backend is None:
+      backend = adj_mat.backend
+
+    if dtype is None:
+      dtype = adj_mat.dtype
+
+  return IndicatorBundle(adj_mat, mam_method, "scipy" if backend is None else backend, dtype)
+
+
+def _memoize(builder):
+
+  """
+  Memoize an indicator matrix builder.
+
+  Wrap a builder `_build_X` so that it accepts either an adjacency matrix
+  or an `IndicatorBundle`, and so that its result is kept
+  in the bundle under the name `X`,
+  converted to the data type of the bundle.
+
+  Parameters
+  ----------
+  builder : function
+    A builder taking an `IndicatorBundle`.
+
+  Returns
+  -------
+  function
+    The memoized builder.
+  """
+
+  name = builder.__name__[len("_build_"):]
+
+  @functools.wraps(builder)
+  def memoized_builder(adj_mat):
+
+    bundle = _as_bundle(adj_mat)
+
+    if name not in bundle.cache:
+      bundle.cache[name] = _as_dtype(builder(bundle), bundle.dtype, name)
+
+    return bundle.cache[name]
+
+  return memoized_builder
+
+
+def _as_dtype(some_mat, dtype, name):
+
+  """
+  Convert an indicator matrix to a data type.
+
+  Parameters
+  ----------
+  some_mat : matrix
+    The indicator matrix.
+  dtype : dtype
+    The data type, or `None` to leave the matrix unchanged.
+  name : str
+    The name of the matrix.
+    Weighted matrices, whose names start with `"G"`,
+    are not converted to integer types.
+
+  Returns
+  -------
+  matrix
+    The matrix with entries of type `dtype`.
+  """
+
+  if dtype is None or (name.startswith("G") and not np.issubdtype(dtype, np.floating)):
+    return some_mat
+
+  return some_mat.astype(dtype, copy=False)
+
+
+@_memoize
 def _build_G(adj_mat):
 
   """
@@ -17,8 +258,8 @@ def _build_G(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -26,11 +267,38 @@ def _build_G(adj_mat):
     The adjacency matrix in sparse form.
   """
 
-  G = adj_mat
+  G = adj_mat.adj_mat
 
   return G
 
 
+@_memoize
+def _build_Gsym(adj_mat):
+
+  """
+  Build symmetrized adjacency matrix.
+
+  Build the symmetrized adjacency matrix `Gsym = G + G.T`
+  from a graph adjacency matrix.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
+
+  Returns
+  -------
+  Gsym : sparse matrix
+    The symmetrized adjacency matrix.
+  """
+
+  G = _build_G(adj_mat)
+  Gsym = G + G.T
+
+  return Gsym
+
+
+@_memoize
 def _build_J(adj_mat):
 
   """
@@ -41,8 +309,8 @@ def _build_J(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -52,7 +320,7 @@ def _build_J(adj_mat):
 
   G = _build_G(adj_mat)
 
-  if sparse.issparse(adj_mat):
+  if adj_mat.is_sparse():
     J = mcut._drop0_killdiag(G > 0)
   else:
     J = mcut._drop0_killdiag(1 * (G > 0))
@@ -60,6 +328,7 @@ def _build_J(adj_mat):
   return J
 
 
+@_memoize
 def _build_Gs(adj_mat):
 
   """
@@ -70,8 +339,8 @@ def _build_Gs(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -82,7 +351,7 @@ def _build_Gs(adj_mat):
   G = _build_G(adj_mat)
   J = _build_J(adj_mat)
 
-  if sparse.issparse(adj_mat):
+  if adj_mat.is_sparse():
     Gs = mcut._drop0_killdiag(G - G.multiply(J.T))
   else:
     Gs = mcut._drop0_killdiag(G - G * J.T)
@@ -90,6 +359,7 @@ def _build_Gs(adj_mat):
   return Gs
 
 
+@_memoize
 def _build_Js(adj_mat):
 
   """
@@ -100,8 +370,8 @@ def _build_Js(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -111,7 +381,7 @@ def _build_Js(adj_mat):
 
   Gs = _build_Gs(adj_mat)
 
-  if sparse.issparse(adj_mat):
+  if adj_mat.is_sparse():
     Js = mcut._drop0_killdiag(Gs > 0)
   else:
     Js = mcut._drop0_killdiag(1 * (Gs > 0))
@@ -119,6 +389,7 @@ def _build_Js(adj_mat):
   return Js
 
 
+@_memoize
 def _build_Gd(adj_mat):
 
   """
@@ -129,8 +400,8 @@ def _build_Gd(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -139,16 +410,17 @@ def _build_Gd(adj_mat):
   """
 
   J = _build_J(adj_mat)
-  G = _build_G(adj_mat)
+  Gsym = _build_Gsym(adj_mat)
 
-  if sparse.issparse(adj_mat):
-    Gd = mcut._drop0_killdiag((G + G.T).multiply(J).multiply(J.T))
+  if adj_mat.is_sparse():
+    Gd = mcut._drop0_killdiag(Gsym.multiply(J).multiply(J.T))
   else:
-    Gd = mcut._drop0_killdiag((G + G.T) * J * J.T)
+    Gd = mcut._drop0_killdiag(Gsym * J * J.T)
 
   return Gd
 
 
+@_memoize
 def _build_Jd(adj_mat):
 
   """
@@ -159,8 +431,8 @@ def _build_Jd(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -170,7 +442,7 @@ def _build_Jd(adj_mat):
 
   Gd = _build_Gd(adj_mat)
 
-  if sparse.issparse(adj_mat):
+  if adj_mat.is_sparse():
     Jd = mcut._drop0_killdiag(Gd > 0)
   else:
     Jd = mcut._drop0_killdiag(1 * (Gd > 0))
@@ -178,6 +450,7 @@ def _build_Jd(adj_mat):
   return Jd
 
 
+@_memoize
 def _build_J0(adj_mat):
 
   """
@@ -188,8 +461,8 @@ def _build_J0(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -197,16 +470,17 @@ def _build_J0(adj_mat):
     A missing-edge indicator matrix.
   """
 
-  G = _build_G(adj_mat)
+  Gsym = _build_Gsym(adj_mat)
 
-  if sparse.issparse(adj_mat):
-    J0 = sparse.csr_matrix(mcut._drop0_killdiag((G + G.T) == 0))
+  if adj_mat.is_sparse():
+    J0 = sparse.csr_matrix(mcut._drop0_killdiag(Gsym == 0))
   else:
-    J0 = mcut._drop0_killdiag((G + G.T) == 0)
+    J0 = mcut._drop0_killdiag(Gsym == 0)
 
   return J0
 
 
+@_memoize
 def _build_Jn(adj_mat):
 
   """
@@ -217,8 +491,8 @@ def _build_Jn(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -228,7 +502,7 @@ def _build_Jn(adj_mat):
 
   n = adj_mat.shape[0]
 
-  if sparse.issparse(adj_mat):
+  if adj_mat.is_sparse():
     Jn = sparse.csr_matrix(mcut._drop0_killdiag(np.ones((n, n))))
   else:
     Jn = mcut._drop0_killdiag(np.ones((n, n)))
@@ -236,6 +510,7 @@ def _build_Jn(adj_mat):
   return Jn
 
 
+@_memoize
 def _build_Id(adj_mat):
 
   """
@@ -246,8 +521,8 @@ def _build_Id(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -257,7 +532,7 @@ def _build_Id(adj_mat):
 
   n = adj_mat.shape[0]
 
-  if sparse.issparse(adj_mat):
+  if adj_mat.is_sparse():
     Id = sparse.identity(n)
   else:
     Id = np.identity(n)
@@ -265,6 +540,7 @@ def _build_Id(adj_mat):
   return Id
 
 
+@_memoize
 def _build_Je(adj_mat):
 
   """
@@ -275,8 +551,8 @@ def _build_Je(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -284,13 +560,14 @@ def _build_Je(adj_mat):
     An edge-and-diagonal matrix in sparse form.
   """
 
-  G = _build_G(adj_mat)
+  Gsym = _build_Gsym(adj_mat)
   Id = _build_Id(adj_mat)
-  Je = Id + ((G + G.T) > 0)
+  Je = Id + (Gsym > 0)
 
   return Je
 
 
+@_memoize
 def _build_Gp(adj_mat):
 
   """
@@ -301,8 +578,8 @@ def _build_Gp(adj_mat):
 
   Parameters
   ----------
-  adj_mat : matrix
-    The original adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    The original adjacency matrix, or a bundle holding it.
 
   Returns
   -------
@@ -312,7 +589,7 @@ def _build_Gp(adj_mat):
 
   G = _build_G(adj_mat)
 
-  if sparse.issparse(adj_mat):
+  if adj_mat.is_sparse():
     Gp = mcut._drop0_killdiag(G.multiply(G.T))
   else:
     Gp = mcut._drop0_killdiag(G * G.T)
@@ -3,13 +3,217 @@ Functions for building motif adjacency matrices
 are in `motifcluster.motifadjacency`.
 """
 
+import logging
+import re
+import numpy as np
 from scipy import sparse
+from scipy.sparse import linalg as spla
 
 from motifcluster import utils as mcut
 from motifcluster import indicators as mcin
-
-def build_motif_adjacency_matrix(adj_mat, motif_name, motif_type="struc",
-                                 mam_weight_type="unweighted", mam_method="sparse"):
+from motifcluster import enumeration as mcen
+from motifcluster import parallel as mcpa
+from motifcluster import outofcore as mcoc
+from motifcluster import cache as mcca
+
+_logger = logging.getLogger(__name__)
+
+# With `mam_method="auto"`, the dense formulation is chosen
+# when `n^3` is below this multiple of the number of paths of length two,
+# from timings of both formulations on Erdos-Renyi graphs
+# as in `performance/performance_test.py`.
+_DENSE_COST_RATIO = 50
+
+# With `mam_method="auto"`, the memory in bytes allowed for
+# the dense indicator matrices or the sparse products,
+# beyond which the sparse products are computed in panels of rows.
+_AUTO_MEMORY_BYTES = 2**30
+
+# Number of dense matrices held at once by the dense formulation.
+_DENSE_MATRICES = 16
+
+# Formulas for the functional motif adjacency matrices.
+# The motif adjacency matrix is `(C + C.T + Cprime) / divisor`,
+# where `C` and `Cprime` are sums of terms.
+# Each term is either an indicator matrix such as `"Jd"`,
+# or a masked product such as `"J.T * (J @ G)"`,
+# where `*` is an entry-wise (Hadamard) product
+# and `@` represents matrix multiplication.
+# The structural formulas are obtained by replacing
+# `J`, `G` and `Jn` with `Js`, `Gs` and `J0` respectively.
+_MOTIF_FORMULAS = { # pylint: disable=consider-using-namedtuple-or-dataclass
+
+  "Ms": {
+    "unweighted": {"C": ["J"], "Cprime": [], "divisor": 1},
+    "mean": {"C": ["G"], "Cprime": [], "divisor": 1},
+    "product": {"C": ["G"], "Cprime": [], "divisor": 1},
+  },
+
+  "Md": {
+    "unweighted": {"C": [], "Cprime": ["Jd"], "divisor": 1},
+    "mean": {"C": [], "Cprime": ["Gd"], "divisor": 2},
+    "product": {"C": [], "Cprime": ["Gp"], "divisor": 1},
+  },
+
+  "M1": {
+    "unweighted": {"C": ["J.T * (J @ J)"], "Cprime": [], "divisor": 1},
+    "mean": {"C": ["J.T * (J @ G)", "J.T * (G @ J)", "G.T * (J @ J)"],
+             "Cprime": [], "divisor": 3},
+    "product": {"C": ["G.T * (G @ G)"], "Cprime": [], "divisor": 1},
+  },
+
+  "M2": {
+    "unweighted": {"C": ["J.T * (Jd @ J)", "J.T * (J @ Jd)", "Jd * (J @ J)"],
+                   "Cprime": [], "divisor": 1},
+    "mean": {"C": ["J.T * (Jd @ G)", "J.T * (Gd @ J)", "G.T * (Jd @ J)",
+                   "J.T * (J @ Gd)", "J.T * (G @ Jd)", "G.T * (J @ Jd)",
+                   "Jd * (J @ G)", "Jd * (G @ J)", "Gd * (J @ J)"],
+             "Cprime": [], "divisor": 4},
+    "product": {"C": ["G.T * (Gp @ G)", "G.T * (G @ Gp)", "Gp * (G @ G)"],
+                "Cprime": [], "divisor": 1},
+  },
+
+  "M3": {
+    "unweighted": {"C": ["J * (Jd @ Jd)", "Jd * (Jd @ J)", "Jd * (J @ Jd)"],
+                   "Cprime": [], "divisor": 1},
+    "mean": {"C": ["J * (Jd @ Gd)", "J * (Gd @ Jd)", "G * (Jd @ Jd)",
+                   "Jd * (Jd @ G)", "Jd * (Gd @ J)", "Gd * (Jd @ J)",
+                   "Jd * (J @ Gd)", "Jd * (G @ Jd)", "Gd * (J @ Jd)"],
+             "Cprime": [], "divisor": 5},
+    "product": {"C": ["G * (Gp @ Gp)", "Gp * (Gp @ G)", "Gp * (G @ Gp)"],
+                "Cprime": [], "divisor": 1},
+  },
+
+  "M4": {
+    "unweighted": {"C": [], "Cprime": ["Jd * (Jd @ Jd)"], "divisor": 1},
+    "mean": {"C": [], "Cprime": ["Jd * (Jd @ Gd)", "Jd * (Gd @ Jd)", "Gd * (Jd @ Jd)"],
+             "divisor": 6},
+    "product": {"C": [], "Cprime": ["Gp * (Gp @ Gp)"], "divisor": 1},
+  },
+
+  "M5": {
+    "unweighted": {"C": ["J * (J @ J)", "J * (J @ J.T)", "J * (J.T @ J)"],
+                   "Cprime": [], "divisor": 1},
+    "mean": {"C": ["J * (J @ G)", "J * (G @ J)", "G * (J @ J)",
+                   "J * (J @ G.T)", "J * (G @ J.T)", "G * (J @ J.T)",
+                   "J * (J.T @ G)", "J * (G.T @ J)", "G * (J.T @ J)"],
+             "Cprime": [], "divisor": 3},
+    "product": {"C": ["G * (G @ G)", "G * (G @ G.T)", "G * (G.T @ G)"],
+                "Cprime": [], "divisor": 1},
+  },
+
+  "M6": {
+    "unweighted": {"C": ["J * (J @ Jd)"], "Cprime": ["Jd * (J.T @ J)"], "divisor": 1},
+    "mean": {"C": ["J * (J @ Gd)", "J * (G @ Jd)", "G * (J @ Jd)"],
+             "Cprime": ["Jd * (J.T @ G)", "Jd * (G.T @ J)", "Gd * (J.T @ J)"],
+             "divisor": 4},
+    "product": {"C": ["G * (G @ Gp)"], "Cprime": ["Gp * (G.T @ G)"], "divisor": 1},
+  },
+
+  "M7": {
+    "unweighted": {"C": ["J * (Jd @ J)"], "Cprime": ["Jd * (J @ J.T)"], "divisor": 1},
+    "mean": {"C": ["J * (Jd @ G)", "J * (Gd @ J)", "G * (Jd @ J)"],
+             "Cprime": ["Jd * (J @ G.T)", "Jd * (G @ J.T)", "Gd * (J @ J.T)"],
+             "divisor": 4},
+    "product": {"C": ["G * (Gp @ G)"], "Cprime": ["Gp * (G @ G.T)"], "divisor": 1},
+  },
+
+  "M8": {
+    "unweighted": {"C": ["J * (J @ Jn)"], "Cprime": ["Jn * (J.T @ J)"], "divisor": 1},
+    "mean": {"C": ["J * (G @ Jn)", "G * (J @ Jn)"],
+             "Cprime": ["Jn * (J.T @ G)", "Jn * (G.T @ J)"], "divisor": 2},
+    "product": {"C": ["G * (G @ Jn)"], "Cprime": ["Jn * (G.T @ G)"], "divisor": 1},
+  },
+
+  "M9": {
+    "unweighted": {"C": ["J * (Jn @ J.T)", "Jn * (J @ J)", "J * (J.T @ Jn)"],
+                   "Cprime": [], "divisor": 1},
+    "mean": {"C": ["J * (Jn @ G.T)", "G * (Jn @ J.T)", "Jn * (J @ G)",
+                   "Jn * (G @ J)", "J * (G.T @ Jn)", "G * (J.T @ Jn)"],
+             "Cprime": [], "divisor": 2},
+    "product": {"C": ["G * (Jn @ G.T)", "Jn * (G @ G)", "G * (G.T @ Jn)"],
+                "Cprime": [], "divisor": 1},
+  },
+
+  "M10": {
+    "unweighted": {"C": ["J * (Jn @ J)"], "Cprime": ["Jn * (J @ J.T)"], "divisor": 1},
+    "mean": {"C": ["J * (Jn @ G)", "G * (Jn @ J)"],
+             "Cprime": ["Jn * (J @ G.T)", "Jn * (G @ J.T)"], "divisor": 2},
+    "product": {"C": ["G * (Jn @ G)"], "Cprime": ["Jn * (G @ G.T)"], "divisor": 1},
+  },
+
+  "M11": {
+    "unweighted": {"C": ["Jd * (J @ Jn)", "Jn * (Jd @ J)", "J * (Jd @ Jn)"],
+                   "Cprime": [], "divisor": 1},
+    "mean": {"C": ["Jd * (G @ Jn)", "Gd * (J @ Jn)", "Jn * (Jd @ G)",
+                   "Jn * (Gd @ J)", "J * (Gd @ Jn)", "G * (Jd @ Jn)"],
+             "Cprime": [], "divisor": 3},
+    "product": {"C": ["Gp * (G @ Jn)", "Jn * (Gp @ G)", "G * (Gp @ Jn)"],
+                "Cprime": [], "divisor": 1},
+  },
+
+  "M12": {
+    "unweighted": {"C": ["Jd * (Jn @ J)", "Jn * (J @ Jd)", "J * (Jn @ Jd)"],
+                   "Cprime": [], "divisor": 1},
+    "mean": {"C": ["Jd * (Jn @ G)", "Gd * (Jn @ J)", "Jn * (J @ Gd)",
+                   "Jn * (G @ Jd)", "J * (Jn @ Gd)", "G * (Jn @ Jd)"],
+             "Cprime": [], "divisor": 3},
+    "product": {"C": ["Gp * (Jn @ G)", "Jn * (G @ Gp)", "G * (Jn @ Gp)"],
+                "Cprime": [], "divisor": 1},
+  },
+
+  "M13": {
+    "unweighted": {"C": ["Jd * (Jd @ Jn)"], "Cprime": ["Jn * (Jd @ Jd)"], "divisor": 1},
+    "mean": {"C": ["Jd * (Gd @ Jn)", "Gd * (Jd @ Jn)", "Jn * (Jd @ Gd)"],
+             "Cprime": [], "divisor": 4},
+    "product": {"C": ["Gp * (Gp @ Jn)"], "Cprime": ["Jn * (Gp @ Gp)"], "divisor": 1},
+  },
+
+  "Mcoll": {
+    "unweighted": {"C": [], "Cprime": ["Jn * (J @ J.T)"], "divisor": 1},
+    "mean": {"C": [], "Cprime": ["Jn * (J @ G.T)", "Jn * (G @ J.T)"], "divisor": 2},
+    "product": {"C": [], "Cprime": ["Jn * (G @ G.T)"], "divisor": 1},
+  },
+
+  "Mexpa": {
+    "unweighted": {"C": [], "Cprime": ["Jn * (J.T @ J)"], "divisor": 1},
+    "mean": {"C": [], "Cprime": ["Jn * (J.T @ G)", "Jn * (G.T @ J)"], "divisor": 2},
+    "product": {"C": [], "Cprime": ["Jn * (G.T @ G)"], "divisor": 1},
+  },
+}
+
+# structural replacements for the functional indicator matrices
+_STRUC_NAMES = {"J": "Js", "G": "Gs", "Jn": "J0"}
+
+# complements of the vertex-distinct and missing-edge indicator matrices
+# within the all-ones matrix `"1"`, used by the sparse formulation
+_COMPLEMENT_NAMES = {"Jn": "Id", "J0": "Je"}
+
+# matrices equal to their own transposes
+_SYMMETRIC_NAMES = ["1", "Id", "Je", "Jn", "J0", "Jd", "Gd", "Gp", "Gsym"]
+
+# indicator matrices holding the off-diagonal sparsity patterns
+# of the weighted and structural matrices, for non-negative weights
+_PATTERN_NAMES = {"G": "J", "Gs": "Js", "Gd": "Jd", "Gp": "Jd", "Js": "J"}
+
+# structural indicator matrices as combinations of functional ones,
+# as a single edge is an edge which is not a double edge
+_FUNC_EXPANSIONS = { # pylint: disable=consider-using-namedtuple-or-dataclass
+  "Js": [(1, "J"), (-1, "Jd")],
+  "Js.T": [(1, "J.T"), (-1, "Jd")],
+}
+
+# Structural products are derived from functional ones when at most
+# this fraction of the edges are in double edges,
+# from timings on Erdos-Renyi graphs with added reciprocal edges,
+# above which the corrections cost as much as the direct products.
+_DERIVE_DOUBLE_FRACTION = 0.1
+
+
+def build_motif_adjacency_matrix(adj_mat, motif_name, # pylint: disable=too-many-arguments,too-many-branches
+                                 motif_type="struc", mam_weight_type="unweighted",
+                                 mam_method="sparse", *, n_jobs=1, reorder=None,
+                                 backend=None, cache=None, dtype=None, upper=False):
 
   """
   Build a motif adjacency matrix.
@@ -34,26 +238,108 @@ def build_motif_adjacency_matrix(adj_mat, motif_name, motif_type="struc",
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+    Passing the same bundle to several calls
+    avoids rebuilding the indicator matrices.
   motif_name : str
     Motif used for the motif adjacency matrix.
   motif_type : str
     Type of motif adjacency matrix to build.
-    One of `"func"` or `"struc"`.
+    One of `"func"`, `"struc"` or `"both"`.
+    With `"both"`, the functional and structural motif adjacency
+    matrices are built from one indicator bundle, functional first,
+    and the structural products are derived from the functional ones
+    by writing the single-edge indicator `Js` as `J - Jd`,
+    where this only needs further products with double edges.
   mam_weight_type : str
     The weighting scheme to use.
-    One of `"unweighted"`, `"mean"` or `"product"`.
+    One of `"unweighted"`, `"mean"`, `"product"` or `"all"`.
+    With `"all"`, the three motif adjacency matrices are built
+    from one indicator bundle, so the indicator matrices
+    and any products common to the formulas are only computed once,
+    and the masked products of the weighted formulas are read off
+    from those of the unweighted formula where possible.
   mam_method : str
     Which formulation to use.
-    One of `"dense"` or `"sparse"`.
+    One of `"dense"`, `"sparse"`, `"enumerate"`, `"approx"` or `"auto"`.
     The sparse formulation avoids generating large dense matrices
     so tends to be faster for large sparse graphs.
+    The enumeration method lists the triangles of the graph
+    for motifs M1 to M7, so tends to be faster again
+    for large sparse graphs with hubs,
+    and uses the sparse formulation for other motifs.
+    Unlike the formulations, it ignores the weights of self-loops,
+    which do not form part of any triangle.
+    The approximate method estimates the motif adjacency matrix
+    by sampling wedges with the default settings of
+    `build_approximate_motif_adjacency_matrix`,
+    which is faster again but inexact.
+    The automatic method estimates the costs of the dense
+    and sparse formulations from the degrees of the graph,
+    and uses the cheaper one, computing the sparse products
+    in panels of rows if they would not fit in memory.
+    The choice and its reason are logged at the info level.
+  n_jobs : int
+    Number of worker processes for the formulations.
+    The rows of the motif adjacency matrix are split into blocks,
+    which are computed in parallel from an adjacency matrix
+    held in shared memory.
+    `None` or `1` means no parallelism,
+    and `-1` uses all of the CPUs.
+  reorder : str
+    If given, the vertices are relabelled before building
+    the motif adjacency matrix, so that neighbours have nearby labels,
+    and the labels are restored in the result.
+    One of `"degree"`, `"rcm"` or `"bfs"`,
+    as for `utils._get_vertex_order`.
+    This can speed up the sparse formulations on graphs
+    whose vertices are labelled in a random order.
+  backend : str or backend
+    The backend for the sparse matrix products of the formulations.
+    One of `"scipy"` or `"graphblas"`,
+    or a backend instance from `motifcluster.backends`.
+    The GraphBLAS backend runs multithreaded masked products,
+    and needs the optional dependency python-graphblas.
+    Defaults to the backend of a bundle passed as `adj_mat`,
+    or otherwise to scipy.
+  cache : str, MotifAdjacencyCache or EmbeddingCache
+    If given, a directory or `cache.MotifAdjacencyCache` in which
+    to look up the motif adjacency matrix before building it,
+    and to save it after building it.
+    Matrices are keyed by a fingerprint of the adjacency matrix
+    and the motif settings, and a cached matrix is returned
+    memory-mapped read-only from disk.
+    A `cache.EmbeddingCache` instead holds the matrices in memory,
+    and returns them read-only.
+    The approximate method is never cached.
+  dtype : dtype
+    The precision in which to build the motif adjacency matrix.
+    One of `np.float32` or `np.float64`,
+    or `None` for the default types.
+    The indicator matrices and products are held in this type,
+    and single precision halves their memory.
+    Unweighted motif adjacency matrices count motif instances exactly,
+    in the signed integer type of the same size,
+    unless they are estimated by sampling.
+  upper : bool
+    Whether to build only the upper triangle of the
+    motif adjacency matrix, including the diagonal.
+    Motif adjacency matrices are symmetric,
+    so this holds all of their information in about half the memory,
+    and the sparse formulations sum the parts of the formula
+    straight into the upper triangle rather than adding a transpose.
+    `spectral.run_motif_embedding` can embed the upper triangle
+    without forming the full matrix.
 
   Returns
   -------
   sparse matrix
-    A motif adjacency matrix.
+    A motif adjacency matrix, or its upper triangle.
+    With `mam_weight_type="all"`, a dictionary of these
+    keyed by weighting scheme,
+    and with `motif_type="both"`, a dictionary of these keyed by motif type.
 
   Examples
   --------
@@ -63,17 +349,115 @@ def build_motif_adjacency_matrix(adj_mat, motif_name, motif_type="struc",
 
   # check args
   assert motif_name in mcut.get_motif_names()
-  assert motif_type in ["struc", "func"]
-  assert mam_weight_type in ["unweighted", "mean", "product"]
-  assert mam_method in ["sparse", "dense"]
-
-  # ensure correct sparsity type
-  if mam_method == "dense":
-    if sparse.issparse(adj_mat):
-      adj_mat = adj_mat.toarray()
-
-  elif mam_method == "sparse":
-    adj_mat = sparse.csr_matrix(adj_mat)
+  assert motif_type in ["struc", "func", "both"]
+  assert mam_weight_type in ["unweighted", "mean", "product", "all"]
+  assert mam_method in ["sparse", "dense", "enumerate", "approx", "auto"]
+  assert reorder in [None, "degree", "rcm", "bfs"]
+  assert isinstance(upper, bool)
+
+  # build every motif type and weighting scheme from one bundle,
+  # functional and unweighted first
+  if motif_type == "both" or mam_weight_type == "all":
+    bundle = adj_mat if reorder is not None else mcin._as_bundle(
+      adj_mat, "dense" if mam_method == "dense" else "sparse", backend,
+      mcut._get_mam_dtype(dtype, "mean", mam_method))
+
+    if motif_type == "both":
+      return {some_type: build_motif_adjacency_matrix(bundle, motif_name, some_type,
+                                                      mam_weight_type, mam_method,
+                                                      n_jobs=n_jobs, reorder=reorder,
+                                                      backend=backend, cache=cache,
+                                                      dtype=dtype, upper=upper)
+              for some_type in ("func", "struc")}
+
+    return {weight_type: build_motif_adjacency_matrix(bundle, motif_name, motif_type,
+                                                      weight_type, mam_method,
+                                                      n_jobs=n_jobs, reorder=reorder,
+                                                      backend=backend, cache=cache,
+                                                      dtype=dtype, upper=upper)
+            for weight_type in ("unweighted", "mean", "product")}
+
+  mam_dtype = mcut._get_mam_dtype(dtype, mam_weight_type, mam_method)
+
+  # look up in memory, backed by any persistent cache
+  if isinstance(cache, mcca.EmbeddingCache) and mam_method != "approx":
+    mam_key = mcca._get_mam_key(adj_mat, motif_name, motif_type, mam_weight_type,
+                                mam_method, dtype=mam_dtype, upper=upper)
+
+    return mcca._memoize(cache.mams, mam_key, lambda: build_motif_adjacency_matrix(
+      adj_mat, motif_name, motif_type, mam_weight_type, mam_method, n_jobs=n_jobs,
+      reorder=reorder, backend=backend, cache=cache.disk, dtype=dtype, upper=upper))
+
+  # look up in the persistent cache, or build and save
+  if cache is not None and mam_method != "approx":
+    cache = mcca._get_cache(cache)
+    key = cache.get_key(adj_mat, motif_name, motif_type, mam_weight_type, mam_method,
+                        dtype=mam_dtype, upper=upper)
+    motif_adj_mat = cache.get(key)
+
+    if motif_adj_mat is None:
+      motif_adj_mat = build_motif_adjacency_matrix(adj_mat, motif_name, motif_type,
+                                                   mam_weight_type, mam_method,
+                                                   n_jobs=n_jobs, reorder=reorder,
+                                                   backend=backend, dtype=dtype, upper=upper)
+      motif_adj_mat = cache.put(key, motif_adj_mat)
+
+    return motif_adj_mat
+
+  # build in the new order and restore the original order
+  if reorder is not None:
+    if isinstance(adj_mat, mcin.IndicatorBundle):
+      adj_mat = adj_mat.adj_mat
+
+    order = mcut._get_vertex_order(adj_mat, reorder)
+    motif_adj_mat = build_motif_adjacency_matrix(mcut._permute_matrix(adj_mat, order),
+                                                 motif_name, motif_type, mam_weight_type,
+                                                 mam_method, n_jobs=n_jobs, backend=backend,
+                                                 dtype=dtype, upper=upper)
+    motif_adj_mat = mcut._permute_matrix(motif_adj_mat, np.argsort(order))
+
+    # a permuted upper triangle has entries on both sides of the diagonal
+    return mcut._fold_upper(motif_adj_mat) if upper else motif_adj_mat
+
+  # choose a formulation from the degrees of the graph
+  if mam_method == "auto":
+    mam_method = _choose_mam_method(mcin._as_bundle(adj_mat, "sparse", backend, mam_dtype),
+                                    [motif_name], motif_type, mam_weight_type)
+
+  # ensure correct sparsity type, reusing any indicators already built
+  adj_mat = mcin._as_bundle(adj_mat, "dense" if mam_method == "dense" else "sparse", backend,
+                            mam_dtype)
+
+  # enumerate triangles for the triangle motifs
+  if mam_method == "enumerate":
+    if motif_name in mcen._MOTIF_EDGES:
+      return mcen.mam_enumerate(adj_mat, motif_name, motif_type, mam_weight_type, upper)
+
+    mam_method = "sparse"
+
+  # estimate by sampling wedges
+  if mam_method == "approx":
+    motif_adj_mat = build_approximate_motif_adjacency_matrix(adj_mat, motif_name, motif_type,
+                                                             mam_weight_type)[0]
+
+    return sparse.csr_matrix(sparse.triu(motif_adj_mat) if upper else motif_adj_mat,
+                             dtype=mam_dtype)
+
+  # compute blocks of rows in parallel
+  if mcpa._get_n_jobs(n_jobs) > 1:
+    return _build_in_row_blocks(adj_mat, [motif_name], motif_type, mam_weight_type,
+                                mcpa._get_n_jobs(n_jobs), upper=upper)[motif_name]
+
+  # compute panels of rows in turn
+  if mam_method == "chunked":
+    return _build_in_panels(adj_mat, motif_name, motif_type, mam_weight_type, upper)
+
+  # sum the parts straight into the upper triangle
+  if upper:
+    motif_adj_mat = _combine_parts(*_evaluate_parts(adj_mat, motif_name, motif_type,
+                                                    mam_weight_type), upper=True)
+
+    return sparse.csr_matrix(motif_adj_mat, dtype=mam_dtype)
 
   # build mam
   if motif_name == "Ms":
@@ -127,498 +511,2091 @@ def build_motif_adjacency_matrix(adj_mat, motif_name, motif_type="struc",
   if motif_name == "Mexpa":
     motif_adj_mat = mam_Mexpa(adj_mat, motif_type, mam_weight_type, mam_method)
 
-  return sparse.csr_matrix(motif_adj_mat)
+  return sparse.csr_matrix(motif_adj_mat, dtype=mam_dtype)
 
 
-def mam_Ms(adj_mat, motif_type, mam_weight_type):
+def build_motif_adjacency_matrices(adj_mat, motif_names=None, motif_type="struc",
+                                   mam_weight_type="unweighted", mam_method="sparse", *,
+                                   n_jobs=1, backend=None, dtype=None, upper=False):
 
   """
-  Perform the motif adjacency matrix calculations for motif Ms.
+  Build several motif adjacency matrices together.
+
+  Build the motif adjacency matrices of several motifs
+  from one adjacency matrix.
+  All of the motifs are computed from a single indicator bundle,
+  so each indicator matrix, and each matrix product appearing
+  in the formulas of more than one motif, is only computed once.
+  Motifs whose formulas need full matrix products are built first,
+  so that masked products needed by the triangle motifs
+  can be read off from those where possible.
+  This is faster than calling `build_motif_adjacency_matrix`
+  separately for each motif.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrices,
+    or an indicator bundle holding it.
+  motif_names : list of str
+    Motifs for which to build motif adjacency matrices.
+    Defaults to all motifs in `utils.get_motif_names()`.
+  motif_type : str
+    Type of motif adjacency matrices to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"`, `"product"` or `"all"`.
+    With `"all"`, the three motif adjacency matrices are built
+    from one indicator bundle, so the indicator matrices
+    and any products common to the formulas are only computed once,
+    and the masked products of the weighted formulas are read off
+    from those of the unweighted formula where possible.
+  mam_method : str
+    Which formulation to use.
+    One of `"dense"`, `"sparse"`, `"enumerate"`, `"approx"` or `"auto"`.
+    The automatic method chooses the dense or sparse formulation
+    once for all of the motifs.
+  n_jobs : int
+    Number of worker processes for the formulations,
+    as for `build_motif_adjacency_matrix`.
+    All of the motifs share one process pool.
+  backend : str or backend
+    The backend for the sparse matrix products,
+    as for `build_motif_adjacency_matrix`.
+  dtype : dtype
+    The precision in which to build the motif adjacency matrices,
+    as for `build_motif_adjacency_matrix`.
+  upper : bool
+    Whether to build only the upper triangles,
+    as for `build_motif_adjacency_matrix`.
+
+  Returns
+  -------
+  dict
+    The motif adjacency matrices as sparse matrices,
+    keyed by motif name.
+    With `mam_weight_type="all"`, each motif maps to a dictionary
+    of these keyed by weighting scheme.
+
+  Examples
+  --------
+  >>> adj_mat = np.array(range(1, 10)).reshape((3, 3))
+  >>> build_motif_adjacency_matrices(adj_mat, ["M1", "M5", "Mcoll"], "func")
+  """
+
+  # check args
+  if motif_names is None:
+    motif_names = mcut.get_motif_names()
+
+  assert all(motif_name in mcut.get_motif_names() for motif_name in motif_names)
+  assert motif_type in ["struc", "func"]
+  assert mam_weight_type in ["unweighted", "mean", "product", "all"]
+  assert mam_method in ["sparse", "dense", "enumerate", "approx", "auto"]
+
+  # build every weighting scheme of every motif from one bundle, unweighted first
+  if mam_weight_type == "all":
+    adj_mat = mcin._as_bundle(adj_mat, "dense" if mam_method == "dense" else "sparse",
+                              backend, mcut._get_mam_dtype(dtype, "mean", mam_method))
+    weighted_mams = {weight_type: build_motif_adjacency_matrices(adj_mat, motif_names,
+                                                                 motif_type, weight_type,
+                                                                 mam_method, n_jobs=n_jobs,
+                                                                 backend=backend,
+                                                                 dtype=dtype, upper=upper)
+                     for weight_type in ("unweighted", "mean", "product")}
+
+    return {motif_name: {weight_type: mams[motif_name]
+                         for weight_type, mams in weighted_mams.items()}
+            for motif_name in motif_names}
+
+  mam_dtype = mcut._get_mam_dtype(dtype, mam_weight_type, mam_method)
+
+  # choose between the formulations for all motifs, leaving
+  # each motif to choose whether to compute its products in panels
+  if mam_method == "auto":
+    adj_mat = mcin._as_bundle(adj_mat, "sparse", backend, mam_dtype)
+
+    if _choose_mam_method(adj_mat, motif_names, motif_type, mam_weight_type) == "dense":
+      mam_method = "dense"
+
+  # share one bundle between all motifs
+  formulation = "dense" if mam_method == "dense" else "sparse"
+  adj_mat = mcin._as_bundle(adj_mat, formulation, backend, mam_dtype)
+  motif_adj_mats = {}
+
+  # build motifs with unmasked products first, so that
+  # later masked products can be read off from them
+  planned_motif_names = sorted(motif_names, key=lambda x: not _has_full_products(
+    x, motif_type, mam_weight_type, formulation))
+
+  # compute blocks of rows of the formulations in parallel
+  if mcpa._get_n_jobs(n_jobs) > 1:
+    parallel_motif_names = [x for x in planned_motif_names if mam_method != "approx"
+                            and (mam_method != "enumerate" or x not in mcen._MOTIF_EDGES)]
+    motif_adj_mats = _build_in_row_blocks(adj_mat, parallel_motif_names, motif_type,
+                                          mam_weight_type, mcpa._get_n_jobs(n_jobs),
+                                          upper=upper)
+
+  for motif_name in planned_motif_names:
+    if motif_name not in motif_adj_mats:
+      motif_adj_mats[motif_name] = build_motif_adjacency_matrix(adj_mat, motif_name,
+                                                                motif_type, mam_weight_type,
+                                                                mam_method, dtype=dtype,
+                                                                upper=upper)
+
+  # return in the requested order
+  motif_adj_mats = {motif_name: motif_adj_mats[motif_name] for motif_name in motif_names}
+
+  return motif_adj_mats
+
+
+def build_approximate_motif_adjacency_matrix(adj_mat, motif_name, motif_type="struc",
+                                             mam_weight_type="unweighted", *,
+                                             sample_budget=None, rel_error=None,
+                                             n_replicates=4, random_state=None):
+
+  """
+  Estimate a motif adjacency matrix by sampling wedges.
+
+  Every matrix product `a @ b` in the sparse formula
+  sums over the middle vertices `k` of the wedges `i - k - j`.
+  Each vertex is kept as a wedge centre independently
+  with probability `p`, and the products are evaluated as
+  `a @ diag(z / p) @ b`, where `z` indicates the kept centres,
+  so every entry of the estimate is unbiased,
+  and the cost scales with the number of wedges at the kept centres.
+  Terms without products, and row and column sums, are exact.
+  The estimate is the mean of `n_replicates` independent estimates,
+  whose spread gives an unbiased estimate of the variance of each entry.
+  With few replicates this is itself noisy,
+  and tends to be low when a few high-degree centres dominate.
+  Sampling pays off for the motifs with unmasked products,
+  whose entries sum over many wedges, such as M8 to M13;
+  entries made up of a few wedges, as for the triangle motifs,
+  cannot be estimated accurately from a small sample.
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
   motif_type : str
     Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
   mam_weight_type : str
-    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  sample_budget : int
+    Expected number of wedges to sample, over all of the replicates.
+    Defaults to a tenth of the wedges of the graph.
+    The matrix is computed exactly if this is at least
+    the number of wedges of the graph.
+  rel_error : float
+    Target relative standard error of the estimate,
+    measured as the square root of the total estimated variance
+    over the Frobenius norm of the estimate.
+    If given, the budget is increased until the target is met,
+    up to computing the matrix exactly.
+  n_replicates : int
+    Number of independent estimates to average, at least two.
+  random_state : int or Generator
+    Seed or random number generator for sampling the wedge centres.
 
   Returns
   -------
-  sparse matrix
-    A motif adjacency matrix.
+  motif_adj_mat : sparse matrix
+    An estimate of the motif adjacency matrix.
+  variance_mat : sparse matrix
+    An estimate of the variance of each entry of the estimate.
+    The global relative standard error is
+    `sqrt(variance_mat.sum()) / sparse.linalg.norm(motif_adj_mat)`.
+
+  Examples
+  --------
+  >>> adj_mat = np.array(range(1, 10)).reshape((3, 3))
+  >>> build_approximate_motif_adjacency_matrix(adj_mat, "M1", "func", sample_budget=5)
   """
 
-  if mam_weight_type == "unweighted":
-    if motif_type == "func":
-      J = mcin._build_J(adj_mat)
-      motif_adj_mat = J + J.transpose()
+  # check args
+  assert motif_name in mcut.get_motif_names()
+  assert motif_type in ["struc", "func"]
+  assert mam_weight_type in ["unweighted", "mean", "product"]
+  assert n_replicates >= 2
+  assert rel_error is None or rel_error > 0
+
+  adj_mat = mcin._as_bundle(adj_mat, "sparse")
+  rng = np.random.default_rng(random_state)
+  wedges = _get_wedge_counts(adj_mat)
 
-    if motif_type == "struc":
-      Js = mcin._build_Js(adj_mat)
-      motif_adj_mat = Js + Js.transpose()
+  if sample_budget is None:
+    sample_budget = wedges.sum() / 10
 
-  if mam_weight_type == "mean":
-    if motif_type == "func":
-      G = mcin._build_G(adj_mat)
-      motif_adj_mat = G + G.transpose()
+  while True:
+    sample_prob = sample_budget / max(n_replicates * wedges.sum(), 1)
 
-    if motif_type == "struc":
-      Gs = mcin._build_Gs(adj_mat)
-      motif_adj_mat = Gs + Gs.transpose()
+    # exact when sampling would cost as much
+    if sample_budget >= wedges.sum():
+      motif_adj_mat = sparse.csr_matrix(_evaluate_formula(adj_mat, motif_name, motif_type,
+                                                          mam_weight_type))
+      return motif_adj_mat, sparse.csr_matrix(adj_mat.shape)
 
-  if mam_weight_type == "product":
-    if motif_type == "func":
-      G = mcin._build_G(adj_mat)
-      motif_adj_mat = G + G.transpose()
+    motif_adj_mat, variance_mat = _sample_formula(adj_mat, motif_name, motif_type,
+                                                  mam_weight_type, sample_prob,
+                                                  n_replicates, rng)
 
-    if motif_type == "struc":
-      Gs = mcin._build_Gs(adj_mat)
-      motif_adj_mat = Gs + Gs.transpose()
+    if rel_error is None:
+      return motif_adj_mat, variance_mat
 
-  return motif_adj_mat
+    # the variance scales inversely with the budget
+    norm_squared = motif_adj_mat.power(2).sum()
+    achieved = np.sqrt(variance_mat.sum() / norm_squared) if norm_squared > 0 else np.inf
 
+    if achieved <= rel_error:
+      return motif_adj_mat, variance_mat
 
-def mam_Md(adj_mat, mam_weight_type):
+    sample_budget *= 1.2 * min((achieved / rel_error) ** 2, 100)
+
+
+def build_motif_adjacency_operator(adj_mat, motif_name, motif_type="struc",
+                                   mam_weight_type="unweighted"):
 
   """
-  Perform the motif adjacency matrix calculations for motif Md.
+  Build a motif adjacency matrix as an implicit linear operator.
+
+  The unmasked products in the sparse formula, such as the
+  `J @ J.T` in the collider motif Mcoll,
+  are applied to a vector as `J @ (J.T @ x)`,
+  so they are never formed.
+  Only the masked corrections, such as the diagonal of `J @ J.T`,
+  or its entries on the edges for structural motifs,
+  are held as a sparse matrix.
+  This is useful for the collider and expander motifs
+  Mcoll and Mexpa on graphs with popular vertices,
+  whose motif adjacency matrices are nearly dense.
+  For motifs without unmasked products,
+  the operator simply wraps the motif adjacency matrix.
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
   mam_weight_type : str
-    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
 
   Returns
   -------
-  sparse matrix
-    A motif adjacency matrix.
+  motif_adj_op : LinearOperator
+    The motif adjacency matrix as a symmetric linear operator.
+  degs : array
+    The row sums of the motif adjacency matrix.
+
+  Examples
+  --------
+  >>> adj_mat = np.array(range(1, 10)).reshape((3, 3))
+  >>> build_motif_adjacency_operator(adj_mat, "Mcoll", "func")
   """
 
-  if mam_weight_type == "unweighted":
-    Jd = mcin._build_Jd(adj_mat)
-    motif_adj_mat = Jd
+  # check args
+  assert motif_name in mcut.get_motif_names()
+  assert motif_type in ["struc", "func"]
+  assert mam_weight_type in ["unweighted", "mean", "product"]
+
+  adj_mat = mcin._as_bundle(adj_mat, "sparse")
+  plan, divisor = _plan_formula(motif_name, motif_type, mam_weight_type, "sparse")
+  parts = {part: sparse.csr_matrix(adj_mat.shape) for part in ("C", "Cprime", "Cprime.T")}
+  factors = []
 
-  if mam_weight_type == "mean":
-    Gd = mcin._build_Gd(adj_mat)
-    motif_adj_mat = Gd / 2
+  for part, coef, term, transposed in plan:
+    mask_name, a_name, b_name = term
 
-  if mam_weight_type == "product":
-    Gp = mcin._build_Gp(adj_mat)
-    motif_adj_mat = Gp
+    # keep unmasked products as factors
+    if mask_name is None and a_name is not None:
+      factors.append((part, coef, adj_mat.get(a_name), adj_mat.get(b_name), transposed))
+      continue
 
-  return motif_adj_mat
+    if a_name is None:
+      value = adj_mat.get(mask_name)
 
+    else:
+      value = _product(adj_mat, *term)
 
-def mam_M1(adj_mat, motif_type, mam_weight_type, mam_method):
+    if transposed:
+      part = "Cprime.T"
+
+    parts[part] = parts[part] + coef * value
+
+  explicit_mat = sparse.csr_matrix(_combine_parts(parts, divisor))
+
+  def matvec(x):
+    x = np.ravel(x)
+    ans = explicit_mat @ x
+
+    for part, coef, a_mat, b_mat, transposed in factors:
+      if part == "C" or not transposed:
+        ans = ans + coef / divisor * (a_mat @ (b_mat @ x))
+
+      if part == "C" or transposed:
+        ans = ans + coef / divisor * (b_mat.T @ (a_mat.T @ x))
+
+    return ans
+
+  motif_adj_op = spla.LinearOperator(adj_mat.shape, matvec=matvec, rmatvec=matvec,
+                                     dtype=float)
+  degs = matvec(np.ones(adj_mat.shape[0]))
+
+  return motif_adj_op, degs
+
+
+def build_motif_adjacency_matrix_out_of_core(adj_mat, motif_name, path, motif_type="struc",
+                                             mam_weight_type="unweighted", *,
+                                             panel_size=2**24):
 
   """
-  Perform the motif adjacency matrix calculations for motif M1.
+  Build a motif adjacency matrix on disk.
+
+  Build a motif adjacency matrix with the sparse formulation,
+  one panel of rows at a time, writing each finished panel to disk.
+  The result is returned memory-mapped, so it can be passed to
+  the spectral methods without being read into memory first.
+  The intermediate products of the formulas,
+  which are usually much larger than the graph,
+  are only held for one panel at a time,
+  so the peak memory use is of order `panel_size`
+  on top of the indicator matrices of the graph.
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix, IndicatorBundle or str
+    Adjacency matrix from which to build the motif adjacency matrix,
+    an indicator bundle holding it,
+    or a directory it was saved to with `save_csr`,
+    in which case it is memory-mapped rather than read.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  path : str
+    The directory to write the motif adjacency matrix to.
   motif_type : str
     Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
   mam_weight_type : str
-    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
-  mam_method : str
-    Which formulation to use. One of `"dense"` or `"sparse"`.
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  panel_size : int
+    Bound on the number of entries computed in each panel.
+    The rows are grouped into panels whose paths of length two,
+    which bound the sizes of the products, number at most `panel_size`.
 
   Returns
   -------
   sparse matrix
-    A motif adjacency matrix.
+    A motif adjacency matrix in CSR form,
+    with arrays memory-mapped from `path`.
+
+  Examples
+  --------
+  >>> adj_mat = np.array(range(1, 10)).reshape((3, 3))
+  >>> build_motif_adjacency_matrix_out_of_core(adj_mat, "M1", "mam_dir", "func", "mean")
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        C = J.transpose() * (J @ J)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        C = Js.transpose() * (Js @ Js)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J.transpose() * (J @ G) + J.transpose() * (G @ J)
-        C += G.transpose() * (J @ J)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = Js.transpose() * (Js @ Gs) + Js.transpose() * (Gs @ Js)
-        C += Gs.transpose() * (Js @ Js)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        C = G.transpose() * (G @ G)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        C = Gs.transpose() * (Gs @ Gs)
-        motif_adj_mat = C + C.transpose()
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        C = J.transpose().multiply(J * J)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        C = Js.transpose().multiply(Js * Js)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J.transpose().multiply(J * G) + J.transpose().multiply(G * J)
-        C += G.transpose().multiply(J * J)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = Js.transpose().multiply(Js * Gs) + Js.transpose().multiply(Gs * Js)
-        C += Gs.transpose().multiply(Js * Js)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        C = G.transpose().multiply(G * G)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        C = Gs.transpose().multiply(Gs * Gs)
-        motif_adj_mat = C + C.transpose()
+  # check args
+  assert motif_name in mcut.get_motif_names()
+  assert motif_type in ["struc", "func"]
+  assert mam_weight_type in ["unweighted", "mean", "product"]
+  assert panel_size > 0
+
+  # map a saved adjacency matrix from disk
+  if isinstance(adj_mat, str):
+    adj_mat = mcin.IndicatorBundle(mcoc.load_csr(adj_mat), "sparse")
 
-  return motif_adj_mat
+  adj_mat = mcin._as_bundle(adj_mat, "sparse")
+  panels = mcoc._get_panels(_get_row_costs(adj_mat), panel_size)
 
+  def compute_panels():
+    for row_start, row_stop in panels:
+      yield _evaluate_rows(adj_mat, motif_name, motif_type, mam_weight_type,
+                           row_start, row_stop)
 
-def mam_M2(adj_mat, motif_type, mam_weight_type, mam_method): # pylint: disable=too-many-statements
+  return mcoc._write_panels(compute_panels(), path, adj_mat.shape)
+
+
+def enumerate_motif_instances(adj_mat, motif_name, motif_type="struc",
+                              mam_weight_type="unweighted", batch_size=2**20):
 
   """
-  Perform the motif adjacency matrix calculations for motif M2.
+  Enumerate the instances of a motif.
+
+  List the motif instances of a graph in batches,
+  together with their weights.
+  The candidate vertex sets are also listed in chunks,
+  so the memory use is of order `batch_size`
+  on top of the indicator matrices of the graph,
+  however many instances there are,
+  and the batches can be written to disk or reduced as they arrive.
+  Entry (`i, j`) of the motif adjacency matrix is the sum of
+  the weights of the instances containing both `i` and `j`,
+  except for the motifs `"Mcoll"` and `"Mexpa"`,
+  whose instances only count towards the pair of their first two vertices.
+  As with the enumeration method of `build_motif_adjacency_matrix`,
+  self-loops do not form part of any instance.
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix whose motif instances to list,
+    or an indicator bundle holding it.
+  motif_name : str
+    Motif whose instances to list.
   motif_type : str
-    Type of motif adjacency matrix to build.
+    Type of motif instance.
+    One of `"func"` or `"struc"`.
   mam_weight_type : str
-    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
-  mam_method : str
-    Which formulation to use. One of `"dense"` or `"sparse"`.
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  batch_size : int
+    Maximum number of instances in each batch.
 
   Returns
   -------
-  sparse matrix
-    A motif adjacency matrix.
+  generator
+    A generator of tuples `(verts, weights)`, where `verts`
+    is an array of shape `(n_instances, 2)` for `"Ms"` and `"Md"`,
+    or `(n_instances, 3)` for the other motifs,
+    holding the vertices of each instance in the order of the motif,
+    and `weights` holds the weight of each instance.
+    The motifs on three vertices are ordered as follows,
+    where a double edge is written `<->`:
+
+    - M1: `0 -> 1 -> 2 -> 0`.
+    - M2 to M7: as the edges in `enumeration._MOTIF_EDGES`.
+    - M8: `1 <- 0 -> 2`.
+    - M9: `0 -> 1 -> 2`.
+    - M10: `1 -> 0 <- 2`.
+    - M11: `1 <-> 0 -> 2`.
+    - M12: `1 <-> 0 <- 2`.
+    - M13: `1 <-> 0 <-> 2`.
+    - Mcoll: `0 -> 2 <- 1`.
+    - Mexpa: `0 <- 2 -> 1`.
+
+  Examples
+  --------
+  >>> adj_mat = np.array(range(1, 10)).reshape((3, 3))
+  >>> for verts, weights in enumerate_motif_instances(adj_mat, "M1", "func", "mean"):
+  ...   print(verts, weights)
+  """
+
+  # check args
+  assert motif_name in mcut.get_motif_names()
+  assert motif_type in ["struc", "func"]
+  assert mam_weight_type in ["unweighted", "mean", "product"]
+  assert batch_size >= 1
+
+  adj_mat = mcin._as_bundle(adj_mat, "sparse")
+
+  return mcen._iter_instances(adj_mat, motif_name, motif_type, mam_weight_type, batch_size)
+
+
+def motif_degrees(adj_mat, motif_name, motif_type="struc", mam_weight_type="unweighted"):
+
+  """
+  Compute the motif degrees of the vertices of a graph.
+
+  The motif degree of a vertex is the row sum of the
+  motif adjacency matrix, as used by `spectral.build_laplacian`,
+  but is computed here without building the motif adjacency matrix.
+  Each term of the sparse formulation contributes its row sums
+  or its column sums, which are read off from masked products
+  on the sparsity patterns of the indicator matrices,
+  or from matrix-vector products for the unmasked products,
+  so the memory use is of order the number of vertices
+  plus the number of edges.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to compute the motif degrees,
+    or an indicator bundle holding it.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to use.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  array
+    The motif degree of each vertex.
+
+  Examples
+  --------
+  >>> adj_mat = np.array(range(1, 10)).reshape((3, 3))
+  >>> motif_degrees(adj_mat, "M1", "func", "mean")
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = J.transpose() * (Jd @ J) + J.transpose() * (J @ Jd)
-        C += Jd * (J @ J)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = Js.transpose() * (Jd @ Js) + Js.transpose() * (Js @ Jd)
-        C += Jd * (Js @ Js)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J.transpose() * (Jd @ G) + J.transpose() * (Gd @ J)
-        C += G.transpose() * (Jd @ J)
-        C = C + J.transpose() * (J @ Gd) + J.transpose() * (G @ Jd)
-        C += G.transpose() * (J @ Jd)
-        C = C + Jd * (J @ G) + Jd * (G @ J) + Gd * (J @ J)
-        motif_adj_mat = (C + C.transpose()) / 4
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Js.transpose() * (Jd @ Gs) + Js.transpose() * (Gd @ Js)
-        C += Gs.transpose() * (Jd @ Js)
-        C = C + Js.transpose() * (Js @ Gd)
-        C += Js.transpose() * (Gs @ Jd) + Gs.transpose() * (Js @ Jd)
-        C = C + Jd * (Js @ Gs) + Jd * (Gs @ Js) + Gd * (Js @ Js)
-        motif_adj_mat = (C + C.transpose()) / 4
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = G.transpose() * (Gp @ G) + G.transpose() * (G @ Gp)
-        C += Gp * (G @ G)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = Gs.transpose() * (Gp @ Gs) + Gs.transpose() * (Gs @ Gp)
-        C += Gp * (Gs @ Gs)
-        motif_adj_mat = C + C.transpose()
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = J.transpose().multiply(Jd * J) + J.transpose().multiply(J * Jd)
-        C += Jd.multiply(J * J)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = Js.transpose().multiply(Jd * Js) + Js.transpose().multiply(Js * Jd)
-        C += Jd.multiply(Js * Js)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J.transpose().multiply(Jd * G) + J.transpose().multiply(Gd * J)
-        C += G.transpose().multiply(Jd * J)
-        C = C + J.transpose().multiply(J * Gd) + J.transpose().multiply(G * Jd)
-        C += G.transpose().multiply(J * Jd)
-        C = C + Jd.multiply(J * G) + Jd.multiply(G * J) + Gd.multiply(J * J)
-        motif_adj_mat = (C + C.transpose()) / 4
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Js.transpose().multiply(Jd * Gs) + Js.transpose().multiply(Gd * Js)
-        C += Gs.transpose().multiply(Jd * Js)
-        C = C + Js.transpose().multiply(Js * Gd)
-        C += Js.transpose().multiply(Gs * Jd) + Gs.transpose().multiply(Js * Jd)
-        C = C + Jd.multiply(Js * Gs) + Jd.multiply(Gs * Js) + Gd.multiply(Js * Js)
-        motif_adj_mat = (C + C.transpose()) / 4
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = G.transpose().multiply(Gp * G) + G.transpose().multiply(G * Gp)
-        C += Gp.multiply(G * G)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = Gs.transpose().multiply(Gp * Gs) + Gs.transpose().multiply(Gs * Gp)
-        C += Gp.multiply(Gs * Gs)
-        motif_adj_mat = C + C.transpose()
+  # check args
+  assert motif_name in mcut.get_motif_names()
+  assert motif_type in ["struc", "func"]
+  assert mam_weight_type in ["unweighted", "mean", "product"]
 
-  return motif_adj_mat
+  adj_mat = mcin._as_bundle(adj_mat, "sparse")
+  plan, divisor = _plan_formula(motif_name, motif_type, mam_weight_type, "sparse")
+  degrees = np.zeros(adj_mat.shape[0])
 
+  # the row sums of C.T and Cprime.T.T are column sums
+  for part, coef, term, transposed in plan:
+    row_sums, col_sums = _term_sums(adj_mat, term)
 
-def mam_M3(adj_mat, motif_type, mam_weight_type, mam_method):
+    if part == "C":
+      degrees += coef * (row_sums + col_sums)
+
+    elif transposed:
+      degrees += coef * col_sums
+
+    else:
+      degrees += coef * row_sums
+
+  return degrees / divisor
+
+
+def motif_census(adj_mat):
 
   """
-  Perform the motif adjacency matrix calculations for motif M3.
+  Count the instances of every motif in a graph.
+
+  Get the total number of instances, and their total mean
+  and product weights, for every motif in `utils.get_motif_names`
+  and both motif types, in one shared pass over the graph.
+  The triangles of the graph are listed once as in the
+  enumeration method of `build_motif_adjacency_matrix`,
+  while the instances on open wedges are summed from
+  the neighbourhood of each vertex without being listed,
+  so the cost is close to that of one triangle enumeration.
+  The sum of the entries of a motif adjacency matrix is
+  twice the number of vertex pairs counted by each instance
+  times its total, so six times for the motifs M1 to M13,
+  and twice for the others.
+  As with the enumeration method, self-loops do not form part
+  of any instance.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix whose motif instances to count,
+    or an indicator bundle holding it.
+
+  Returns
+  -------
+  census : dict
+    A dictionary whose entry `census[motif_type][mam_weight_type]`
+    is a dictionary of the total weight of the instances of
+    each motif, keyed by motif name,
+    for `motif_type` one of `"func"` or `"struc"`,
+    and `mam_weight_type` one of `"unweighted"`, `"mean"` or `"product"`.
+    The unweighted totals are integer instance counts.
+
+  Examples
+  --------
+  >>> adj_mat = np.array(range(1, 10)).reshape((3, 3))
+  >>> motif_census(adj_mat)["struc"]["unweighted"]
+  """
+
+  adj_mat = mcin._as_bundle(adj_mat, "sparse")
+
+  return mcen._get_census(adj_mat)
+
+
+def motif_edge_participation(adj_mat, motif_name, motif_type="struc",
+                             mam_weight_type="unweighted", batch_size=2**20):
+
+  """
+  Count the motif instances using each edge of a graph.
+
+  Get the number of instances of a motif in which each directed edge
+  of the graph takes part, or the total weight of these instances.
+  The result is aligned with the stored entries of the
+  adjacency matrix in CSR form, so it can be used as the data array
+  of a matrix with the same `indices` and `indptr`,
+  without building a new matrix.
+  The instances are listed in one pass of `enumerate_motif_instances`,
+  so the memory use is of order the number of edges plus `batch_size`.
+  For a double edge, each direction counts the instances using it.
+  Self-loops, and explicitly stored zeros, take part in no instances.
+  Duplicate stored entries of the same edge
+  are counted in the first of them.
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix whose edges to count,
+    or an indicator bundle holding it.
+  motif_name : str
+    Motif whose instances to count.
   motif_type : str
-    Type of motif adjacency matrix to build.
+    Type of motif instance.
+    One of `"func"` or `"struc"`.
   mam_weight_type : str
-    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
-  mam_method : str
-    Which formulation to use. One of `"dense"` or `"sparse"`.
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  batch_size : int
+    Maximum number of instances to hold in memory at once.
 
   Returns
   -------
-  sparse matrix
-    A motif adjacency matrix.
+  array
+    An array of length `nnz` holding, for each stored entry of
+    `sparse.csr_matrix(adj_mat)` in the order of its `indices`,
+    the number of instances using that edge,
+    or their total weight for the weighted schemes.
+
+  Examples
+  --------
+  >>> adj_mat = sparse.csr_matrix(np.array(range(1, 10)).reshape((3, 3)))
+  >>> participation = motif_edge_participation(adj_mat, "M1", "func")
+  >>> sparse.csr_matrix((participation, adj_mat.indices, adj_mat.indptr))
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = J * (Jd @ Jd) + Jd * (Jd @ J) + Jd * (J @ Jd)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = Js * (Jd @ Jd) + Jd * (Jd @ Js) + Jd * (Js @ Jd)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J * (Jd @ Gd) + J * (Gd @ Jd) + G * (Jd @ Jd)
-        C = C + Jd * (Jd @ G) + Jd * (Gd @ J) + Gd * (Jd @ J)
-        C = C + Jd * (J @ Gd) + Jd * (G @ Jd) + Gd * (J @ Jd)
-        motif_adj_mat = (C + C.transpose()) / 5
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Js * (Jd @ Gd) + Js * (Gd @ Jd) + Gs * (Jd @ Jd)
-        C = C + Jd * (Jd @ Gs) + Jd * (Gd @ Js) + Gd * (Jd @ Js)
-        C = C + Jd * (Js @ Gd) + Jd * (Gs @ Jd) + Gd * (Js @ Jd)
-        motif_adj_mat = (C + C.transpose()) / 5
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = G * (Gp @ Gp) + Gp * (Gp @ G) + Gp * (G @ Gp)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = Gs * (Gp @ Gp) + Gp * (Gp @ Gs) + Gp * (Gs @ Gp)
-        motif_adj_mat = C + C.transpose()
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = J.multiply(Jd * Jd) + Jd.multiply(Jd * J) + Jd.multiply(J * Jd)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = Js.multiply(Jd * Jd) + Jd.multiply(Jd * Js) + Jd.multiply(Js * Jd)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J.multiply(Jd * Gd) + J.multiply(Gd * Jd) + G.multiply(Jd * Jd)
-        C = C + Jd.multiply(Jd * G) + Jd.multiply(Gd * J) + Gd.multiply(Jd * J)
-        C = C + Jd.multiply(J * Gd) + Jd.multiply(G * Jd) + Gd.multiply(J * Jd)
-        motif_adj_mat = (C + C.transpose()) / 5
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Js.multiply(Jd * Gd) + Js.multiply(Gd * Jd) + Gs.multiply(Jd * Jd)
-        C = C + Jd.multiply(Jd * Gs) + Jd.multiply(Gd * Js) + Gd.multiply(Jd * Js)
-        C = C + Jd.multiply(Js * Gd) + Jd.multiply(Gs * Jd) + Gd.multiply(Js * Jd)
-        motif_adj_mat = (C + C.transpose()) / 5
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = G.multiply(Gp * Gp) + Gp.multiply(Gp * G) + Gp.multiply(G * Gp)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = Gs.multiply(Gp * Gp) + Gp.multiply(Gp * Gs) + Gp.multiply(Gs * Gp)
-        motif_adj_mat = C + C.transpose()
+  # check args
+  assert motif_name in mcut.get_motif_names()
+  assert motif_type in ["struc", "func"]
+  assert mam_weight_type in ["unweighted", "mean", "product"]
+  assert batch_size >= 1
+
+  if isinstance(adj_mat, mcin.IndicatorBundle):
+    csr_mat = sparse.csr_matrix(adj_mat.adj_mat)
 
-  return motif_adj_mat
+  else:
+    csr_mat = sparse.csr_matrix(adj_mat)
 
+  # arithmetic on a matrix which is not in canonical form sorts it in place,
+  # so the instances are listed from a copy
+  if csr_mat.has_canonical_format:
+    bundle = mcin._as_bundle(adj_mat, "sparse")
 
-def mam_M4(adj_mat, mam_weight_type, mam_method):
+  else:
+    bundle = mcin._as_bundle(csr_mat.copy(), "sparse")
+
+  return mcen._get_edge_participation(bundle, csr_mat, motif_name, motif_type,
+                                      mam_weight_type, batch_size)
+
+
+def _get_formula(motif_name, motif_type, mam_weight_type):
 
   """
-  Perform the motif adjacency matrix calculations for motif M4.
+  Get the formula for a motif adjacency matrix.
+
+  Look up the formula in `_MOTIF_FORMULAS`, parse its terms,
+  and replace the functional indicator matrices by their
+  structural counterparts if required.
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
   mam_weight_type : str
-    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
-  mam_method : str
-    Which formulation to use. One of `"dense"` or `"sparse"`.
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
 
   Returns
   -------
-  sparse matrix
-    A motif adjacency matrix.
+  C_terms, Cprime_terms : list of tuple
+    The terms of `C` and `Cprime` as tuples of names `(mask, a, b)`
+    representing `mask * (a @ b)`.
+    A single matrix is represented as `(mask, None, None)`.
+  divisor : int
+    The divisor of the formula.
+  """
+
+  formula = _MOTIF_FORMULAS[motif_name][mam_weight_type]
+  C_terms = [_parse_term(term, motif_type) for term in formula["C"]]
+  Cprime_terms = [_parse_term(term, motif_type) for term in formula["Cprime"]]
+
+  return C_terms, Cprime_terms, formula["divisor"]
+
+
+def _parse_term(term, motif_type):
+
+  """
+  Parse a term of a motif adjacency matrix formula.
+
+  Parameters
+  ----------
+  term : str
+    A matrix name such as `"Jd"`,
+    or a masked product such as `"J.T * (J @ G)"`.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+
+  Returns
+  -------
+  tuple
+    The names `(mask, a, b)` in the term,
+    where `a` and `b` are `None` for a single matrix.
+  """
+
+  match = re.fullmatch(r"(\S+) \* \((\S+) @ (\S+)\)", term)
+
+  if match:
+    names = match.groups()
+
+  else:
+    names = (term, None, None)
+
+  if motif_type == "struc":
+    names = tuple(_struc_name(name) for name in names)
+
+  return names
+
+
+def _struc_name(name):
+
+  """
+  Get the structural counterpart of a matrix name.
+
+  Parameters
+  ----------
+  name : str
+    A matrix name, possibly with a trailing `".T"`, or `None`.
+
+  Returns
+  -------
+  str
+    The name with `J`, `G` and `Jn` replaced by
+    `Js`, `Gs` and `J0` respectively.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      Jd = mcin._build_Jd(adj_mat)
-      motif_adj_mat = Jd * (Jd @ Jd)
+  if name is None:
+    return None
 
-    if mam_weight_type == "mean":
-      Jd = mcin._build_Jd(adj_mat)
-      Gd = mcin._build_Gd(adj_mat)
-      motif_adj_mat = (Jd * (Jd @ Gd) + Jd * (Gd @ Jd) + Gd * (Jd @ Jd)) / 6
+  if name.endswith(".T"):
+    return _struc_name(name[:-2]) + ".T"
 
-    if mam_weight_type == "product":
-      Gp = mcin._build_Gp(adj_mat)
-      motif_adj_mat = Gp * (Gp @ Gp)
+  return _STRUC_NAMES.get(name, name)
 
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      Jd = mcin._build_Jd(adj_mat)
-      motif_adj_mat = Jd.multiply(Jd * Jd)
 
-    if mam_weight_type == "mean":
-      Jd = mcin._build_Jd(adj_mat)
-      Gd = mcin._build_Gd(adj_mat)
-      motif_adj_mat = (Jd.multiply(Jd * Gd) + Jd.multiply(Gd * Jd) + Gd.multiply(Jd * Jd)) / 6
+def _transpose_name(name):
+
+  """
+  Get the name of the transpose of a matrix.
+
+  Parameters
+  ----------
+  name : str
+    A matrix name, possibly with a trailing `".T"`, or `None`.
+
+  Returns
+  -------
+  str
+    The name of the transposed matrix.
+  """
+
+  if name is None or name in _SYMMETRIC_NAMES:
+    return name
+
+  if name.endswith(".T"):
+    return name[:-2]
+
+  return name + ".T"
+
+
+def _transpose_term(term):
+
+  """
+  Get the transpose of a term.
+
+  Parameters
+  ----------
+  term : tuple
+    The names `(mask, a, b)` in the term.
+
+  Returns
+  -------
+  tuple
+    The names `(mask.T, b.T, a.T)` in the transposed term,
+    or `(mask.T, None, None)` for a single matrix.
+  """
+
+  mask_name, a_name, b_name = term
+
+  if a_name is None:
+    return (_transpose_name(mask_name), None, None)
+
+  return (_transpose_name(mask_name), _transpose_name(b_name), _transpose_name(a_name))
+
+
+def _canonical_term(term):
+
+  """
+  Get the canonical orientation of a term.
+
+  A term `mask * (a @ b)` is equal to the transpose of
+  `mask.T * (b.T @ a.T)`.
+  The canonical orientation is the one of these two
+  using fewer transposed matrices,
+  so that both orientations share one computation.
+
+  Parameters
+  ----------
+  term : tuple
+    The names `(mask, a, b)` in the term.
+
+  Returns
+  -------
+  canonical_term : tuple
+    The names in the canonically oriented term.
+  transposed : bool
+    Whether `term` is the transpose of `canonical_term`.
+  """
+
+  transposed_term = _transpose_term(term)
+
+  def sort_key(some_term):
+    names = [name for name in some_term if name is not None]
+    return (sum(name.endswith(".T") for name in names), ["" if name is None else name
+                                                        for name in some_term])
+
+  if sort_key(transposed_term) < sort_key(term):
+    return transposed_term, True
+
+  return term, False
+
+
+def _expand_term(term):
+
+  """
+  Expand the complement matrices in a term.
+
+  The sparse formulation avoids the dense matrices `Jn` and `J0`
+  by writing them as `1 - Id` and `1 - Je`,
+  where `1` is the all-ones matrix.
+  Products with `1` are then computed as row or column sums.
+
+  Parameters
+  ----------
+  term : tuple
+    The names `(mask, a, b)` in the term.
+
+  Returns
+  -------
+  list of tuple
+    Tuples `(coef, term)` whose sum is equal to `term`.
+    The all-ones mask is represented by `None`.
+  """
+
+  for i, name in enumerate(term):
+    if name in _COMPLEMENT_NAMES and term[1] is not None:
+      ones_term = list(term)
+      ones_term[i] = None if i == 0 else "1"
+      complement_term = list(term)
+      complement_term[i] = _COMPLEMENT_NAMES[name]
+
+      return [(1, tuple(ones_term)), (-1, tuple(complement_term))]
+
+  return [(1, term)]
+
+
+def _plan_formula(motif_name, motif_type, mam_weight_type, mam_method):
+
+  """
+  Plan the evaluation of a motif adjacency matrix formula.
+
+  Expand the complement matrices for the sparse formulation,
+  orient each term canonically, collect like terms,
+  and put the unmasked products first,
+  so that masked products can be read off from them.
+  Since `C` only appears in `C + C.T`,
+  its terms can be replaced by their transposes,
+  and a term appearing in `Cprime` along with its transpose
+  can be moved to `C`.
+
+  Parameters
+  ----------
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  mam_method : str
+    Which formulation to use.
+    One of `"dense"` or `"sparse"`.
+
+  Returns
+  -------
+  plan : list of tuple
+    Tuples `(part, coef, term, transposed)`, where `part` is
+    `"C"` or `"Cprime"`, and `coef` times the term,
+    transposed if `transposed` is true, is added to that part.
+  divisor : int
+    The divisor of the formula.
+  """
+
+  C_terms, Cprime_terms, divisor = _get_formula(motif_name, motif_type, mam_weight_type)
+  coefs = {}
+
+  for part, terms in (("C", C_terms), ("Cprime", Cprime_terms)):
+    for term in terms:
+      if mam_method == "sparse":
+        expanded_terms = _expand_term(term)
+
+      else:
+        expanded_terms = [(1, term)]
+
+      for coef, expanded_term in expanded_terms:
+        expanded_term, transposed = _canonical_term(expanded_term)
+        transposed = transposed and part == "Cprime"
+        key = (part, expanded_term, transposed)
+        coefs[key] = coefs.get(key, 0) + coef
+
+  # terms of Cprime appearing in both orientations belong to C
+  for (part, term, transposed), coef in list(coefs.items()):
+    if part == "Cprime" and transposed and coefs.get((part, term, False)) == coef:
+      coefs[("C", term, False)] = coefs.get(("C", term, False), 0) + coef
+      coefs[(part, term, False)] = 0
+      coefs[(part, term, True)] = 0
+
+  plan = [(part, coef, term, transposed)
+          for (part, term, transposed), coef in coefs.items() if coef != 0]
+  plan.sort(key=lambda x: x[2][0] is not None or x[2][1] is None)
+
+  return plan, divisor
+
+
+def _has_full_products(motif_name, motif_type, mam_weight_type, mam_method):
+
+  """
+  Check whether a motif adjacency matrix formula has unmasked products.
+
+  Parameters
+  ----------
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  mam_method : str
+    Which formulation to use.
+    One of `"dense"` or `"sparse"`.
+
+  Returns
+  -------
+  bool
+    Whether the planned formula contains an unmasked product.
+  """
+
+  plan = _plan_formula(motif_name, motif_type, mam_weight_type, mam_method)[0]
+
+  return any(term[0] is None and term[1] is not None for _, _, term, _ in plan)
+
+
+def _evaluate_formula(adj_mat, motif_name, motif_type, mam_weight_type):
+
+  """
+  Evaluate a motif adjacency matrix formula.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  matrix
+    A motif adjacency matrix.
+  """
+
+  parts, divisor = _evaluate_parts(adj_mat, motif_name, motif_type, mam_weight_type)
+  motif_adj_mat = _combine_parts(parts, divisor)
+
+  return motif_adj_mat
+
+
+def _evaluate_parts(adj_mat, motif_name, # pylint: disable=too-many-positional-arguments
+                    motif_type, mam_weight_type, row_start=None, row_stop=None,
+                    centre_weights=None):
+
+  """
+  Evaluate the parts of a motif adjacency matrix formula.
+
+  The terms of `Cprime` which are evaluated in transposed orientation
+  are collected in a separate part, so that they can be
+  transposed together.
+  The parts can be restricted to a block of rows,
+  so that different blocks can be computed independently.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  row_start, row_stop : int
+    The first row of the block, and one past its last row,
+    or `None` for all of the rows.
+  centre_weights : array
+    If given, the weight of each vertex as the middle vertex
+    of the matrix products, for estimating the formula
+    over sampled wedge centres.
+
+  Returns
+  -------
+  parts : dict
+    The parts `"C"`, `"Cprime"` and `"Cprime.T"`,
+    where the motif adjacency matrix is
+    `(C + C.T + Cprime + Cprime.T.T) / divisor`.
+  divisor : int
+    The divisor of the formula.
+  """
+
+  plan, divisor = _plan_formula(motif_name, motif_type, mam_weight_type, adj_mat.mam_method)
+
+  if row_start is None:
+    shape = adj_mat.shape
+
+  else:
+    rows = slice(row_start, row_stop)
+    shape = (row_stop - row_start, adj_mat.shape[1])
+    full_products = {}
+
+  if adj_mat.is_sparse():
+    parts = {part: sparse.csr_matrix(shape, dtype=adj_mat.dtype)
+             for part in ("C", "Cprime", "Cprime.T")}
+
+  else:
+    parts = {part: np.zeros(shape, dtype=adj_mat.dtype) for part in ("C", "Cprime", "Cprime.T")}
+
+  for part, coef, term, transposed in plan:
+    if transposed:
+      part = "Cprime.T"
+
+    if row_start is not None:
+      value = _product_rows(adj_mat, term, rows, full_products)
+
+    elif term[1] is None:
+      value = adj_mat.get(term[0])
+
+    elif centre_weights is not None:
+      value = _sampled_product(adj_mat, term, centre_weights)
+
+    else:
+      value = _product(adj_mat, *term)
+
+    if coef != 1:
+      value = coef * value
+
+    parts[part] = parts[part] + value
+
+  return parts, divisor
+
+
+def _combine_parts(parts, divisor, upper=False):
+
+  """
+  Combine the parts of a motif adjacency matrix formula.
+
+  In the upper triangle of the motif adjacency matrix,
+  entry (`i, j`) of `C + C.T` gathers both `C[i, j]` and `C[j, i]`,
+  so in sparse form the entries of `C` are moved into
+  the upper triangle and summed there,
+  together with the upper triangle of `Cprime`
+  and the transposed lower triangle of `Cprime.T`,
+  without forming any transposes.
+
+  Parameters
+  ----------
+  parts : dict
+    The parts `"C"`, `"Cprime"` and `"Cprime.T"` of the formula.
+  divisor : int
+    The divisor of the formula.
+  upper : bool
+    Whether to build only the upper triangle,
+    including the diagonal.
+
+  Returns
+  -------
+  matrix
+    The motif adjacency matrix
+    `(C + C.T + Cprime + Cprime.T.T) / divisor`,
+    or its upper triangle.
+  """
+
+  C = parts["C"]
+
+  if upper and sparse.issparse(C):
+    C = C.tocoo()
+    Cprime = parts["Cprime"].tocoo()
+    Cprime_T = parts["Cprime.T"].tocoo()
+    diag = C.row == C.col
+    keep = Cprime.row <= Cprime.col
+    keep_T = Cprime_T.row >= Cprime_T.col
+    rows = np.concatenate([np.minimum(C.row, C.col), C.row[diag],
+                           Cprime.row[keep], Cprime_T.col[keep_T]])
+    cols = np.concatenate([np.maximum(C.row, C.col), C.col[diag],
+                           Cprime.col[keep], Cprime_T.row[keep_T]])
+    data = np.concatenate([C.data, C.data[diag], Cprime.data[keep], Cprime_T.data[keep_T]])
+    motif_adj_mat = sparse.csr_matrix((data, (rows, cols)), shape=C.shape)
+
+  elif upper:
+    motif_adj_mat = np.triu(C + C.transpose() + parts["Cprime"] + parts["Cprime.T"].transpose())
+
+  else:
+    motif_adj_mat = C + C.transpose() + parts["Cprime"] + parts["Cprime.T"].transpose()
+
+  # divide in place, as sparse division promotes to double precision
+  if divisor != 1 and sparse.issparse(motif_adj_mat):
+    motif_adj_mat.data /= divisor
+
+  elif divisor != 1:
+    motif_adj_mat = motif_adj_mat / divisor
+
+  return motif_adj_mat
+
+
+def _product_rows(adj_mat, term, rows, full_products):
+
+  """
+  Compute a block of rows of a term.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+  term : tuple
+    The names `(mask, a, b)` in the term.
+  rows : slice
+    The rows of the block.
+  full_products : dict
+    The blocks of full products computed so far,
+    from which masked products are read off.
+
+  Returns
+  -------
+  matrix
+    The rows `rows` of `mask * (a @ b)`.
+  """
+
+  mask_name, a_name, b_name = term
+
+  def get_rows(name):
+    some_mat = adj_mat.get(name)
+
+    if adj_mat.is_sparse():
+      some_mat = sparse.csr_matrix(some_mat)
+
+    return some_mat[rows]
+
+  if a_name is None:
+    return get_rows(mask_name)
+
+  # full product
+  if mask_name is None or not adj_mat.is_sparse():
+    if (a_name, b_name) not in full_products:
+      full_products[(a_name, b_name)] = adj_mat.backend.product(get_rows(a_name),
+                                                                adj_mat.get(b_name))
+
+    if mask_name is None:
+      return full_products[(a_name, b_name)]
+
+  # row and column sums
+  if a_name == "1":
+    return adj_mat.backend.a_one_b(get_rows(mask_name), adj_mat.get(b_name))
+
+  if b_name == "1":
+    return adj_mat.backend.a_b_one(get_rows(mask_name), get_rows(a_name))
+
+  # masked product read off from the full product
+  if (a_name, b_name) in full_products:
+    if adj_mat.is_sparse():
+      return sparse.csr_matrix(get_rows(mask_name).multiply(full_products[(a_name, b_name)]))
+
+    return get_rows(mask_name) * full_products[(a_name, b_name)]
+
+  # masked product
+  if a_name == "Id":
+    return sparse.csr_matrix(get_rows(mask_name).multiply(get_rows(b_name)))
+
+  if b_name == "Id":
+    return sparse.csr_matrix(get_rows(mask_name).multiply(get_rows(a_name)))
+
+  return adj_mat.backend.masked_product(get_rows(mask_name), get_rows(a_name),
+                                        adj_mat.get(b_name))
+
+
+def _build_in_row_blocks(adj_mat, motif_names, motif_type, mam_weight_type, n_jobs, *,
+                         upper=False):
+
+  """
+  Build motif adjacency matrices in blocks of rows over a process pool.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the adjacency matrix.
+  motif_names : list of str
+    Motifs for which to build motif adjacency matrices.
+  motif_type : str
+    Type of motif adjacency matrices to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  n_jobs : int
+    Number of worker processes.
+  upper : bool
+    Whether to build only the upper triangles.
+
+  Returns
+  -------
+  dict
+    The motif adjacency matrices as sparse matrices,
+    keyed by motif name.
+  """
+
+  # several blocks per worker of similar cost,
+  # so that rows near hubs do not hold up one worker
+  if adj_mat.is_sparse():
+    row_costs = _get_row_costs(adj_mat)
+
+  else:
+    row_costs = None
+
+  blocks = mcpa._get_row_blocks(adj_mat.shape[0], 4 * n_jobs, row_costs)
+  tasks = [(motif_name, motif_type, mam_weight_type, row_start, row_stop)
+           for motif_name in motif_names for row_start, row_stop in blocks]
+  results = mcpa._map_row_blocks(adj_mat, _evaluate_parts, tasks, n_jobs)
+  motif_adj_mats = {}
+
+  for i, motif_name in enumerate(motif_names):
+    motif_results = results[i * len(blocks):(i + 1) * len(blocks)]
+    divisor = _plan_formula(motif_name, motif_type, mam_weight_type, adj_mat.mam_method)[1]
+
+    # stitch the blocks of each part together
+    parts = {}
+
+    for part in ("C", "Cprime", "Cprime.T"):
+      part_blocks = [block_parts[part] for block_parts, _ in motif_results]
+
+      if adj_mat.is_sparse():
+        parts[part] = sparse.vstack(part_blocks, format="csr")
+
+      else:
+        parts[part] = np.vstack(part_blocks)
+
+    motif_adj_mats[motif_name] = sparse.csr_matrix(_combine_parts(parts, divisor, upper))
+
+  return motif_adj_mats
+
+
+def _evaluate_rows(adj_mat, motif_name, # pylint: disable=too-many-positional-arguments
+                   motif_type, mam_weight_type, row_start, row_stop):
+
+  """
+  Evaluate a block of rows of a motif adjacency matrix formula.
+
+  Unlike `_evaluate_parts`, the rows of the transposed parts
+  are computed directly, by evaluating the transposed terms,
+  so that the block is complete without the rest of the matrix.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  row_start, row_stop : int
+    The first row of the block, and one past its last row.
+
+  Returns
+  -------
+  sparse matrix
+    The rows of the motif adjacency matrix in CSR form.
+  """
+
+  plan, divisor = _plan_formula(motif_name, motif_type, mam_weight_type, adj_mat.mam_method)
+  rows = slice(row_start, row_stop)
+  full_products = {}
+  motif_adj_mat = sparse.csr_matrix((row_stop - row_start, adj_mat.shape[1]),
+                                    dtype=adj_mat.dtype)
+
+  for part, coef, term, transposed in plan:
+    if part == "C":
+      terms = [term, _transpose_term(term)]
+
+    elif transposed:
+      terms = [_transpose_term(term)]
+
+    else:
+      terms = [term]
+
+    for some_term in terms:
+      value = _product_rows(adj_mat, some_term, rows, full_products)
+
+      if coef != 1:
+        value = coef * value
+
+      motif_adj_mat = motif_adj_mat + value
+
+  if divisor != 1:
+    motif_adj_mat.data /= divisor
+
+  return sparse.csr_matrix(motif_adj_mat)
+
+
+def _choose_mam_method(adj_mat, motif_names, motif_type, mam_weight_type):
+
+  """
+  Choose a formulation for building motif adjacency matrices.
+
+  Each product of the dense formulation costs of order `n^3`,
+  while the products of the sparse formulation cost of order
+  the number of paths of length two in the graph,
+  which also bounds the number of entries of its unmasked products.
+  The dense formulation is chosen when it is estimated to be cheaper
+  and its matrices fit in memory,
+  unless the graph has self-loops, since the structural formulas
+  of some motifs then differ between the dense and sparse formulations.
+  Otherwise the sparse formulation is chosen,
+  computing the products in panels of rows if
+  the unmasked products would not fit in memory.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+  motif_names : list of str
+    Motifs for which to build motif adjacency matrices.
+  motif_type : str
+    Type of motif adjacency matrices to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  str
+    The chosen formulation.
+    One of `"dense"`, `"sparse"` or `"chunked"`.
+  """
+
+  n = adj_mat.shape[0]
+  n_paths = int(_get_row_costs(adj_mat).sum())
+  dense_bytes = _DENSE_MATRICES * n ** 2 * np.dtype(adj_mat.dtype or np.float64).itemsize
+  has_full_products = any(_has_full_products(motif_name, motif_type, mam_weight_type, "sparse")
+                          for motif_name in motif_names)
+
+  is_dense_cheaper = n ** 3 < _DENSE_COST_RATIO * n_paths and dense_bytes <= _AUTO_MEMORY_BYTES
+  has_self_loops = mcut._has_self_loops(adj_mat.adj_mat)
+
+  names = ", ".join(motif_names)
+
+  if is_dense_cheaper and not has_self_loops:
+    mam_method = "dense"
+    _logger.info("mam_method='auto' chose the dense formulation for %s: "
+                 "n^3 = %.3g is below %d times the %.3g paths of length two, "
+                 "and the dense matrices need about %.3g bytes",
+                 names, n ** 3, _DENSE_COST_RATIO, n_paths, dense_bytes)
+
+  elif has_full_products and n_paths > _get_panel_size(adj_mat):
+    mam_method = "chunked"
+    _logger.info("mam_method='auto' chose the sparse formulation in panels of rows for %s: "
+                 "the unmasked products may have up to %.3g entries, "
+                 "more than the %.3g which fit in %.3g bytes",
+                 names, n_paths, _get_panel_size(adj_mat), _AUTO_MEMORY_BYTES)
+
+  elif is_dense_cheaper:
+    mam_method = "sparse"
+    _logger.info("mam_method='auto' chose the sparse formulation for %s: "
+                 "the graph has self-loops, with which the dense formulation "
+                 "gives different structural motif adjacency matrices", names)
+
+  else:
+    mam_method = "sparse"
+    _logger.info("mam_method='auto' chose the sparse formulation for %s: "
+                 "the %.3g paths of length two are few compared with n^3 / %d = %.3g",
+                 names, n_paths, _DENSE_COST_RATIO, n ** 3 / _DENSE_COST_RATIO)
+
+  return mam_method
+
+
+def _get_panel_size(adj_mat):
+
+  """
+  Get the number of product entries which fit in the memory budget.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+
+  Returns
+  -------
+  int
+    The number of entries of the sparse products,
+    allowing for three products held at once,
+    which fit in `_AUTO_MEMORY_BYTES`.
+  """
+
+  # each entry holds a value and a column index
+  entry_bytes = np.dtype(adj_mat.dtype or np.float64).itemsize + np.dtype(np.int32).itemsize
+
+  return _AUTO_MEMORY_BYTES // (3 * entry_bytes)
+
+
+def _build_in_panels(adj_mat, motif_name, motif_type, mam_weight_type, upper=False):
+
+  """
+  Build a motif adjacency matrix in panels of rows.
+
+  The rows are grouped into panels whose unmasked products fit in
+  the memory budget, as in `build_motif_adjacency_matrix_out_of_core`,
+  and the finished panels are stacked in memory.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  upper : bool
+    Whether to build only the upper triangle.
+
+  Returns
+  -------
+  sparse matrix
+    A motif adjacency matrix, or its upper triangle.
+  """
+
+  panels = mcoc._get_panels(_get_row_costs(adj_mat), _get_panel_size(adj_mat))
+  motif_adj_mat = []
+
+  for row_start, row_stop in panels:
+    panel = _evaluate_rows(adj_mat, motif_name, motif_type, mam_weight_type,
+                           row_start, row_stop)
+
+    # the diagonal of the panel starts at column `row_start`
+    motif_adj_mat.append(sparse.triu(panel, k=row_start) if upper else panel)
+
+  return sparse.vstack(motif_adj_mat, format="csr")
+
+
+def _get_row_costs(adj_mat):
+
+  """
+  Bound the number of entries in each row of the products of a formula.
+
+  Each product of indicator matrices has its entries among the
+  paths of length at most two in the undirected graph with self-loops,
+  so the number of these paths starting at each vertex
+  bounds the size of each row of the products.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+
+  Returns
+  -------
+  array
+    The bound for each row.
+  """
+
+  Je = sparse.csr_matrix(adj_mat.get("Je"))
+  degs = np.diff(Je.indptr)
+
+  return Je @ degs
+
+
+def _get_wedge_counts(adj_mat):
+
+  """
+  Count the wedges at each vertex of a graph.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+
+  Returns
+  -------
+  array
+    The number of paths of length two through each vertex
+    in the undirected graph, which bounds the work done
+    at that vertex by a matrix product of indicator matrices.
+  """
+
+  degs = np.diff(sparse.csr_matrix(adj_mat.get("Je")).indptr)
+
+  return degs.astype(float) ** 2
+
+
+def _sample_formula(adj_mat, motif_name, # pylint: disable=too-many-positional-arguments
+                    motif_type, mam_weight_type, sample_prob, n_replicates, rng):
+
+  """
+  Estimate a motif adjacency matrix formula from sampled wedge centres.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+    One of `"func"` or `"struc"`.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  sample_prob : float
+    The probability of keeping each wedge centre, less than one.
+  n_replicates : int
+    Number of independent estimates to average.
+  rng : Generator
+    Random number generator for sampling the wedge centres.
+
+  Returns
+  -------
+  motif_adj_mat : sparse matrix
+    The mean of the estimates.
+  variance_mat : sparse matrix
+    The unbiased estimate of the variance of the mean.
+  """
+
+  total = sparse.csr_matrix(adj_mat.shape)
+  total_squares = sparse.csr_matrix(adj_mat.shape)
+
+  for _ in range(n_replicates):
+    centre_weights = (rng.random(adj_mat.shape[0]) < sample_prob) / sample_prob
+    estimate = sparse.csr_matrix(_combine_parts(*_evaluate_parts(
+      adj_mat, motif_name, motif_type, mam_weight_type, centre_weights=centre_weights)))
+    total = total + estimate
+    total_squares = total_squares + estimate.power(2)
+
+  motif_adj_mat = total / n_replicates
+  variance_mat = (total_squares - total.power(2) / n_replicates) / (n_replicates * (n_replicates - 1))
+  variance_mat = sparse.csr_matrix(variance_mat)
+  variance_mat.data = np.maximum(variance_mat.data, 0)
+  variance_mat.eliminate_zeros()
+
+  return sparse.csr_matrix(motif_adj_mat), variance_mat
+
+
+def _sampled_product(adj_mat, term, centre_weights):
+
+  """
+  Compute a masked product over weighted wedge centres.
+
+  Compute `mask * (a @ diag(centre_weights) @ b)`,
+  skipping the centres of weight zero.
+  Products with `"1"` or `"Id"` do not sum over centres,
+  so they are computed exactly.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+  term : tuple
+    The names `(mask, a, b)` in the term.
+  centre_weights : array
+    The weight of each vertex as a wedge centre.
+
+  Returns
+  -------
+  sparse matrix
+    The weighted masked product.
+  """
+
+  mask_name, a_name, b_name = term
+
+  if a_name in ["1", "Id"] or b_name in ["1", "Id"]:
+    return _product(adj_mat, *term)
+
+  a_mat = sparse.csr_matrix(adj_mat.get(a_name) @ sparse.diags(centre_weights))
+  a_mat.eliminate_zeros()
+
+  if mask_name is None:
+    return sparse.csr_matrix(a_mat @ adj_mat.get(b_name))
+
+  return adj_mat.backend.masked_product(adj_mat.get(mask_name), a_mat, adj_mat.get(b_name))
+
+
+def _product(adj_mat, mask_name, a_name, b_name):
+
+  """
+  Compute a masked product of indicator matrices.
+
+  Compute `mask * (a @ b)` for indicator matrices held in a bundle,
+  where the product `*` is an entry-wise (Hadamard) product
+  and `@` represents matrix multiplication.
+  The results are kept in the bundle, so a product appearing in the
+  formulas of several motifs or weighting schemes is computed once,
+  and a product and its transpose share one computation.
+  In the dense formulation the full product `a @ b` is kept
+  and shared between different masks.
+  In the sparse formulation only the masked entries are computed,
+  unless the full product has already been computed.
+  Products with the all-ones matrix `"1"` are computed as
+  row or column sums, and products with `"Id"` as entry-wise products.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the indicator matrices.
+  mask_name : str
+    Name of the mask matrix, or `None` for the unmasked product.
+  a_name, b_name : str
+    Names of the matrices to multiply.
+    A trailing `".T"` denotes a transpose.
+
+  Returns
+  -------
+  matrix
+    The matrix `mask * (a @ b)`.
+  """
+
+  term, transposed = _canonical_term((mask_name, a_name, b_name))
+
+  if transposed:
+    return _product(adj_mat, *term).transpose()
+
+  key = ("product",) + term
+
+  if key in adj_mat.cache:
+    return adj_mat.cache[key]
+
+  full_term = _canonical_term((None, a_name, b_name))[0]
+
+  # full product
+  if mask_name is None:
+    ans = adj_mat.backend.product(adj_mat.get(a_name), adj_mat.get(b_name))
+
+  # row and column sums
+  elif a_name == "1":
+    ans = adj_mat.backend.a_one_b(adj_mat.get(mask_name), adj_mat.get(b_name))
+
+  elif b_name == "1":
+    ans = adj_mat.backend.a_b_one(adj_mat.get(mask_name), adj_mat.get(a_name))
+
+  # masked product
+  elif adj_mat.is_sparse() and ("product",) + full_term not in adj_mat.cache:
+    if a_name == "Id":
+      ans = sparse.csr_matrix(adj_mat.get(mask_name).multiply(adj_mat.get(b_name)))
+
+    elif b_name == "Id":
+      ans = sparse.csr_matrix(adj_mat.get(mask_name).multiply(adj_mat.get(a_name)))
+
+    else:
+      ans = _product_from_pattern(adj_mat, mask_name, a_name, b_name)
+
+    if ans is None:
+      ans = _product_from_func(adj_mat, mask_name, a_name, b_name)
+
+    if ans is None:
+      ans = adj_mat.backend.masked_product(adj_mat.get(mask_name), adj_mat.get(a_name),
+                                           adj_mat.get(b_name))
+
+  # masked product read off from the full product
+  else:
+    full_product = _product(adj_mat, None, a_name, b_name)
+
+    if adj_mat.is_sparse():
+      ans = sparse.csr_matrix(adj_mat.get(mask_name).multiply(full_product))
+
+    else:
+      ans = adj_mat.get(mask_name) * full_product
+
+  # dense masked products are cheap to recompute from the full product
+  if mask_name is None or adj_mat.is_sparse():
+    adj_mat.cache[key] = ans
+
+  return ans
+
+
+def _term_sums(adj_mat, term):
+
+  """
+  Compute the row and column sums of a term.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+  term : tuple
+    The names `(mask, a, b)` in the term.
+
+  Returns
+  -------
+  row_sums, col_sums : array
+    The row and column sums of `mask * (a @ b)`.
+  """
+
+  mask_name, a_name, b_name = term
+
+  # unmasked product, summed by matrix-vector products
+  if mask_name is None:
+    a_mat = adj_mat.get(a_name)
+    b_mat = adj_mat.get(b_name)
+    row_sums = a_mat @ (b_mat @ np.ones(b_mat.shape[1]))
+    col_sums = (np.ones(a_mat.shape[0]) @ a_mat) @ b_mat
+
+    return np.asarray(row_sums).ravel(), np.asarray(col_sums).ravel()
+
+  if a_name is None:
+    value = adj_mat.get(mask_name)
+
+  else:
+    value = _product(adj_mat, *term)
+
+  row_sums = np.asarray(value.sum(axis=1)).ravel()
+  col_sums = np.asarray(value.sum(axis=0)).ravel()
+
+  return row_sums, col_sums
+
+
+def _product_from_pattern(adj_mat, mask_name, a_name, b_name):
+
+  """
+  Read off a product with a weighted mask from one with an indicator mask.
+
+  A weighted mask such as `G` is zero off the diagonal wherever
+  its indicator `J` is zero, so `G * (a @ b)` is equal to
+  `G * (J * (a @ b))` off the diagonal.
+  If the product masked by the indicator has already been computed,
+  as when the unweighted and mean motif adjacency matrices
+  are built from the same bundle,
+  the weighted one is read off from it,
+  and the diagonal, on which the indicators are zero,
+  is added from the diagonal of `a @ b`.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+  mask_name : str
+    Name of the mask matrix.
+  a_name, b_name : str
+    Names of the matrices to multiply.
+
+  Returns
+  -------
+  sparse matrix
+    The matrix `mask * (a @ b)`,
+    or `None` if it cannot be read off.
+  """
+
+  name = mask_name[:-2] if mask_name.endswith(".T") else mask_name
+
+  if name not in _PATTERN_NAMES:
+    return None
+
+  pattern_name = _PATTERN_NAMES[name] + mask_name[len(name):]
+  pattern_term, transposed = _canonical_term((pattern_name, a_name, b_name))
+
+  if ("product",) + pattern_term not in adj_mat.cache:
+    return None
+
+  # negative weights can lie outside the indicator patterns
+  key = ("pattern", name)
+
+  if key not in adj_mat.cache:
+    weighted_mat = mcut._drop0_killdiag(adj_mat.get(name))
+    weighted_mat.eliminate_zeros()
+    masked_mat = sparse.csr_matrix(weighted_mat.multiply(adj_mat.get(_PATTERN_NAMES[name])))
+    masked_mat.eliminate_zeros()
+    adj_mat.cache[key] = masked_mat.nnz == weighted_mat.nnz
+
+  if not adj_mat.cache[key]:
+    return None
+
+  pattern_product = adj_mat.cache[("product",) + pattern_term]
+  mask_mat = adj_mat.get(mask_name)
+  ans = sparse.csr_matrix(mask_mat.multiply(pattern_product.transpose() if transposed
+                                            else pattern_product))
+
+  # the diagonal of a @ b, where the mask may hold self-loops
+  diag = mask_mat.diagonal()
+
+  if np.any(diag != 0):
+    a_mat = adj_mat.get(a_name)
+    b_mat = adj_mat.get(_transpose_name(b_name))
+    ans = ans + sparse.diags(diag * np.asarray(a_mat.multiply(b_mat).sum(axis=1)).ravel())
+
+  return sparse.csr_matrix(ans)
+
+
+def _product_from_func(adj_mat, mask_name, a_name, b_name):
+
+  """
+  Derive a structural product from a functional one.
+
+  The single-edge indicator `Js` is `J - Jd`,
+  so a product of structural indicators expands into
+  the corresponding product of functional indicators,
+  less corrections in which a factor is the double-edge indicator `Jd`.
+  If the functional product has already been computed,
+  as when the functional and structural motif adjacency matrices
+  are built from the same bundle,
+  and there are few double edges,
+  the structural one is derived from it,
+  with the corrections expanded in full and masked.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the sparse indicator matrices.
+  mask_name : str
+    Name of the mask matrix.
+  a_name, b_name : str
+    Names of the matrices to multiply.
+
+  Returns
+  -------
+  sparse matrix
+    The matrix `mask * (a @ b)`,
+    or `None` if it cannot be derived.
+  """
+
+  if not adj_mat.is_sparse() or mask_name is None or \
+     (a_name not in _FUNC_EXPANSIONS and b_name not in _FUNC_EXPANSIONS):
+    return None
+
+  if adj_mat.get("Jd").nnz > _DERIVE_DOUBLE_FRACTION * adj_mat.get("J").nnz:
+    return None
+
+  a_terms = _FUNC_EXPANSIONS.get(a_name, [(1, a_name)])
+  b_terms = _FUNC_EXPANSIONS.get(b_name, [(1, b_name)])
+
+  # the functional product, or one its mask can be read off from
+  name = mask_name[:-2] if mask_name.endswith(".T") else mask_name
+  mask_names = [mask_name]
+
+  if name in _PATTERN_NAMES:
+    mask_names.append(_PATTERN_NAMES[name] + mask_name[len(name):])
+
+  if not any(("product",) + _canonical_term((name, a_terms[0][1], b_terms[0][1]))[0]
+             in adj_mat.cache for name in mask_names):
+    return None
+
+  ans = _product(adj_mat, mask_name, a_terms[0][1], b_terms[0][1])
+
+  # corrections through double edges, expanded in full and masked
+  for a_coef, a_func_name in a_terms:
+    for b_coef, b_func_name in b_terms:
+      if (a_func_name, b_func_name) != (a_terms[0][1], b_terms[0][1]):
+        value = adj_mat.backend.product(adj_mat.get(a_func_name), adj_mat.get(b_func_name))
+        ans = ans + a_coef * b_coef * adj_mat.get(mask_name).multiply(value)
+
+  return sparse.csr_matrix(ans)
+
+
+def mam_Ms(adj_mat, motif_type, mam_weight_type):
+
+  """
+  Perform the motif adjacency matrix calculations for motif Ms.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+  mam_weight_type : str
+    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  sparse matrix
+    A motif adjacency matrix.
+  """
+
+  adj_mat = mcin._as_bundle(adj_mat)
+  motif_adj_mat = _evaluate_formula(adj_mat, "Ms", motif_type, mam_weight_type)
+
+  return motif_adj_mat
+
+
+def mam_Md(adj_mat, mam_weight_type):
+
+  """
+  Perform the motif adjacency matrix calculations for motif Md.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  mam_weight_type : str
+    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
+
+  Returns
+  -------
+  sparse matrix
+    A motif adjacency matrix.
+  """
+
+  adj_mat = mcin._as_bundle(adj_mat)
+  motif_adj_mat = _evaluate_formula(adj_mat, "Md", "func", mam_weight_type)
+
+  return motif_adj_mat
+
+
+def mam_M1(adj_mat, motif_type, mam_weight_type, mam_method):
+
+  """
+  Perform the motif adjacency matrix calculations for motif M1.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+  mam_weight_type : str
+    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
+  mam_method : str
+    Which formulation to use. One of `"dense"` or `"sparse"`.
+
+  Returns
+  -------
+  sparse matrix
+    A motif adjacency matrix.
+  """
+
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M1", motif_type, mam_weight_type)
+
+  return motif_adj_mat
+
+
+def mam_M2(adj_mat, motif_type, mam_weight_type, mam_method):
+
+  """
+  Perform the motif adjacency matrix calculations for motif M2.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+  mam_weight_type : str
+    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
+  mam_method : str
+    Which formulation to use. One of `"dense"` or `"sparse"`.
+
+  Returns
+  -------
+  sparse matrix
+    A motif adjacency matrix.
+  """
+
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M2", motif_type, mam_weight_type)
+
+  return motif_adj_mat
+
+
+def mam_M3(adj_mat, motif_type, mam_weight_type, mam_method):
+
+  """
+  Perform the motif adjacency matrix calculations for motif M3.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+  mam_weight_type : str
+    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
+  mam_method : str
+    Which formulation to use. One of `"dense"` or `"sparse"`.
+
+  Returns
+  -------
+  sparse matrix
+    A motif adjacency matrix.
+  """
+
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M3", motif_type, mam_weight_type)
+
+  return motif_adj_mat
+
+
+def mam_M4(adj_mat, mam_weight_type, mam_method):
+
+  """
+  Perform the motif adjacency matrix calculations for motif M4.
+
+  Parameters
+  ----------
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
+  mam_weight_type : str
+    The weighting scheme to use. One of `"unweighted"`, `"mean"` or `"product"`.
+  mam_method : str
+    Which formulation to use. One of `"dense"` or `"sparse"`.
+
+  Returns
+  -------
+  sparse matrix
+    A motif adjacency matrix.
+  """
 
-    if mam_weight_type == "product":
-      Gp = mcin._build_Gp(adj_mat)
-      motif_adj_mat = Gp.multiply(Gp * Gp)
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M4", "func", mam_weight_type)
 
   return motif_adj_mat
 
@@ -630,8 +2607,9 @@ def mam_M5(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -645,99 +2623,8 @@ def mam_M5(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        C = J * (J @ J) + J * (J @ J.transpose()) + J * (J.transpose() @ J)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        C = Js * (Js @ Js) + Js * (Js @ Js.transpose())
-        C += Js * (Js.transpose() @ Js)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J * (J @ G) + J * (G @ J) + G * (J @ J)
-        C = C + J * (J @ G.transpose()) + J * (G @ J.transpose())
-        C += G * (J @ J.transpose())
-        C = C + J * (J.transpose() @ G) + J * (G.transpose() @ J)
-        C += G * (J.transpose() @ J)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = Js * (Js @ Gs) + Js * (Gs @ Js) + Gs * (Js @ Js)
-        C = C + Js * (Js @ Gs.transpose())
-        C += Js * (Gs @ Js.transpose()) + Gs * (Js @ Js.transpose())
-        C = C + Js * (Js.transpose() @ Gs)
-        C += Js * (Gs.transpose() @ Js) + Gs * (Js.transpose() @ Js)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        C = G * (G @ G) + G * (G @ G.transpose())
-        C += G * (G.transpose() @ G)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        C = Gs * (Gs @ Gs) + Gs * (Gs @ Gs.transpose())
-        C += Gs * (Gs.transpose() @ Gs)
-        motif_adj_mat = C + C.transpose()
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        C = J.multiply(J * J) + J.multiply(J * J.transpose()) + J.multiply(J.transpose() * J)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        C = Js.multiply(Js * Js) + Js.multiply(Js * Js.transpose())
-        C += Js.multiply(Js.transpose() * Js)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J.multiply(J * G) + J.multiply(G * J) + G.multiply(J * J)
-        C = C + J.multiply(J * G.transpose()) + J.multiply(G * J.transpose())
-        C += G.multiply(J * J.transpose())
-        C = C + J.multiply(J.transpose() * G) + J.multiply(G.transpose() * J)
-        C += G.multiply(J.transpose() * J)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = Js.multiply(Js * Gs) + Js.multiply(Gs * Js) + Gs.multiply(Js * Js)
-        C = C + Js.multiply(Js * Gs.transpose())
-        C += Js.multiply(Gs * Js.transpose()) + Gs.multiply(Js * Js.transpose())
-        C = C + Js.multiply(Js.transpose() * Gs)
-        C += Js.multiply(Gs.transpose() * Js) + Gs.multiply(Js.transpose() * Js)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        C = G.multiply(G * G) + G.multiply(G * G.transpose())
-        C += G.multiply(G.transpose() * G)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        C = Gs.multiply(Gs * Gs) + Gs.multiply(Gs * Gs.transpose())
-        C += Gs.multiply(Gs.transpose() * Gs)
-        motif_adj_mat = C + C.transpose()
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M5", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
@@ -749,8 +2636,9 @@ def mam_M6(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -764,109 +2652,8 @@ def mam_M6(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = J * (J @ Jd)
-        Cprime = Jd * (J.transpose() @ J)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = Js * (Js @ Jd)
-        Cprime = Jd * (Js.transpose() @ Js)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J * (J @ Gd) + J * (G @ Jd) + G * (J @ Jd)
-        Cprime = Jd * (J.transpose() @ G) + Jd * (G.transpose() @ J)
-        Cprime += Gd * (J.transpose() @ J)
-        motif_adj_mat = (C + C.transpose() + Cprime) / 4
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Js * (Js @ Gd) + Js * (Gs @ Jd) + Gs * (Js @ Jd)
-        Cprime = Jd * (Js.transpose() @ Gs)
-        Cprime += Jd * (Gs.transpose() @ Js) + Gd * (Js.transpose() @ Js)
-        motif_adj_mat = (C + C.transpose() + Cprime) / 4
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = G * (G @ Gp)
-        Cprime = Gp * (G.transpose() @ G)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = Gs * (Gs @ Gp)
-        Cprime = Gp * (Gs.transpose() @ Gs)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = J.multiply(J * Jd)
-        Cprime = Jd.multiply(J.transpose() * J)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = Js.multiply(Js * Jd)
-        Cprime = Jd.multiply(Js.transpose() * Js)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J.multiply(J * Gd) + J.multiply(G * Jd) + G.multiply(J * Jd)
-        Cprime = Jd.multiply(J.transpose() * G) + Jd.multiply(G.transpose() * J)
-        Cprime += Gd.multiply(J.transpose() * J)
-        motif_adj_mat = (C + C.transpose() + Cprime) / 4
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Js.multiply(Js * Gd) + Js.multiply(Gs * Jd) + Gs.multiply(Js * Jd)
-        Cprime = Jd.multiply(Js.transpose() * Gs)
-        Cprime += Jd.multiply(Gs.transpose() * Js) + Gd.multiply(Js.transpose() * Js)
-        motif_adj_mat = (C + C.transpose() + Cprime) / 4
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = G.multiply(G * Gp)
-        Cprime = Gp.multiply(G.transpose() * G)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = Gs.multiply(Gs * Gp)
-        Cprime = Gp.multiply(Gs.transpose() * Gs)
-        motif_adj_mat = C + C.transpose() + Cprime
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M6", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
@@ -878,8 +2665,9 @@ def mam_M7(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -893,109 +2681,8 @@ def mam_M7(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = J * (Jd @ J)
-        Cprime = Jd * (J @ J.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = Js * (Jd @ Js)
-        Cprime = Jd * (Js @ Js.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J * (Jd @ G) + J * (Gd @ J) + G * (Jd @ J)
-        Cprime = Jd * (J @ G.transpose()) + Jd * (G @ J.transpose())
-        Cprime += Gd * (J @ J.transpose())
-        motif_adj_mat = (C + C.transpose() + Cprime) / 4
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Js * (Jd @ Gs) + Js * (Gd @ Js) + Gs * (Jd @ Js)
-        Cprime = Jd * (Js @ Gs.transpose()) + Jd * (Gs @ Js.transpose())
-        Cprime += Gd * (Js @ Js.transpose())
-        motif_adj_mat = (C + C.transpose() + Cprime) / 4
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = G * (Gp @ G)
-        Cprime = Gp * (G @ G.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = Gs * (Gp @ Gs)
-        Cprime = Gp * (Gs @ Gs.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = J.multiply(Jd * J)
-        Cprime = Jd.multiply(J * J.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        C = Js.multiply(Jd * Js)
-        Cprime = Jd.multiply(Js * Js.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J.multiply(Jd * G) + J.multiply(Gd * J) + G.multiply(Jd * J)
-        Cprime = Jd.multiply(J * G.transpose()) + Jd.multiply(G * J.transpose())
-        Cprime += Gd.multiply(J * J.transpose())
-        motif_adj_mat = (C + C.transpose() + Cprime) / 4
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Js.multiply(Jd * Gs) + Js.multiply(Gd * Js) + Gs.multiply(Jd * Js)
-        Cprime = Jd.multiply(Js * Gs.transpose()) + Jd.multiply(Gs * Js.transpose())
-        Cprime += Gd.multiply(Js * Js.transpose())
-        motif_adj_mat = (C + C.transpose() + Cprime) / 4
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = G.multiply(Gp * G)
-        Cprime = Gp.multiply(G * G.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Gp = mcin._build_Gp(adj_mat)
-        C = Gs.multiply(Gp * Gs)
-        Cprime = Gp.multiply(Gs * Gs.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M7", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
@@ -1007,8 +2694,9 @@ def mam_M8(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -1022,104 +2710,8 @@ def mam_M8(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = J * (J @ Jn)
-        Cprime = Jn * (J.transpose() @ J)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Js * (Js @ J0)
-        Cprime = J0 * (Js.transpose() @ Js)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J * (G @ Jn) + G * (J @ Jn)
-        Cprime = Jn * (J.transpose() @ G) + Jn * (G.transpose() @ J)
-        motif_adj_mat = (C + C.transpose() + Cprime) / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Js * (Gs @ J0) + Gs * (Js @ J0)
-        Cprime = J0 * (Js.transpose() @ Gs) + J0 * (Gs.transpose() @ Js)
-        motif_adj_mat = (C + C.transpose() + Cprime) / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = G * (G @ Jn)
-        Cprime = Jn * (G.transpose() @ G)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Gs * (Gs @ J0)
-        Cprime = J0 * (Gs.transpose() @ Gs)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_b_one(J, J) - J.multiply(J)
-        Cprime = J.transpose() * J - Id.multiply(J.transpose() * J)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_b_one(Js, Js) - Js.multiply(Js * Je)
-        Cprime = Js.transpose() * Js - Je.multiply(Js.transpose() * Js)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_b_one(J, G) - J.multiply(G) + mcut._a_b_one(G, J) - G.multiply(J)
-        Cprime = J.transpose() * G - Id.multiply(J.transpose() * G)
-        Cprime = Cprime + G.transpose() * J - Id.multiply(G.transpose() * J)
-        motif_adj_mat = (C + C.transpose() + Cprime) / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_b_one(Js, Gs) - Js.multiply(Gs * Je)
-        C = C + mcut._a_b_one(Gs, Js) - Gs.multiply(Js * Je)
-        Cprime = Js.transpose() * Gs - Je.multiply(Js.transpose() * Gs)
-        Cprime = Cprime + Gs.transpose() * Js - Je.multiply(Gs.transpose() * Js)
-        motif_adj_mat = (C + C.transpose() + Cprime) / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_b_one(G, G) - G.multiply(G)
-        Cprime = G.transpose() * G - Id.multiply(G.transpose() * G)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_b_one(Gs, Gs) - Gs.multiply(Gs * Je)
-        Cprime = Gs.transpose() * Gs - Je.multiply(Gs.transpose() * Gs)
-        motif_adj_mat = C + C.transpose() + Cprime
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M8", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
@@ -1131,8 +2723,9 @@ def mam_M9(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -1146,110 +2739,8 @@ def mam_M9(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = J * (Jn @ J.transpose()) + Jn * (J @ J)
-        C += J * (J.transpose() @ Jn)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Js * (J0 @ Js.transpose()) + J0 * (Js @ Js)
-        C += Js * (Js.transpose() @ J0)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J * (Jn @ G.transpose()) + G * (Jn @ J.transpose())
-        C = C + Jn * (J @ G) + Jn * (G @ J)
-        C = C + J * (G.transpose() @ Jn) + G * (J.transpose() @ Jn)
-        motif_adj_mat = (C + C.transpose()) / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Js * (J0 @ Gs.transpose()) + Gs * (J0 @ Js.transpose())
-        C = C + J0 * (Js @ Gs) + J0 * (Gs @ Js)
-        C = C + Js * (Gs.transpose() @ J0) + Gs * (Js.transpose() @ J0)
-        motif_adj_mat = (C + C.transpose()) / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = G * (Jn @ G.transpose()) + Jn * (G @ G) + G * (G.transpose() @ Jn)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Gs * (J0 @ Gs.transpose()) + J0 * (Gs @ Gs)
-        C += Gs * (Gs.transpose() @ J0)
-        motif_adj_mat = C + C.transpose()
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_one_b(J, J.transpose()) - 2 * J.multiply(J.transpose()) + J * J
-        C = C - Id.multiply(J * J) + mcut._a_b_one(J, J.transpose())
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_one_b(Js, Js.transpose()) - Js.multiply(Je * Js.transpose())
-        C = C + Js * Js - Je.multiply(Js * Js)
-        C = C + mcut._a_b_one(Js, Js.transpose()) - Js.multiply(Js.transpose() * Je)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_one_b(J, G.transpose()) - 2 * J.multiply(G.transpose()) + J * G
-        C = C + mcut._a_one_b(G, J.transpose()) - 2 * G.multiply(J.transpose()) + G * J
-        C = C - Id.multiply(J * G) + mcut._a_b_one(J, G.transpose())
-        C = C - Id.multiply(G * J) + mcut._a_b_one(G, J.transpose())
-        motif_adj_mat = (C + C.transpose()) / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_one_b(Js, Gs.transpose()) - Js.multiply(Je * Gs.transpose())
-        C = C + mcut._a_one_b(Gs, Js.transpose()) - Gs.multiply(Je * Js.transpose())
-        C = C + Js * Gs - Je.multiply(Js * Gs)
-        C = C + mcut._a_b_one(Js, Gs.transpose()) - Js.multiply(Gs.transpose() * Je)
-        C = C + Gs * Js - Je.multiply(Gs * Js)
-        C = C + mcut._a_b_one(Gs, Js.transpose()) - Gs.multiply(Js.transpose() * Je)
-        motif_adj_mat = (C + C.transpose()) / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_one_b(G, G.transpose()) - 2 * G.multiply(G.transpose()) + G * G
-        C = C - Id.multiply(G * G) + mcut._a_b_one(G, G.transpose())
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_one_b(Gs, Gs.transpose()) - Gs.multiply(Je * Gs.transpose())
-        C = C + Gs * Gs - Je.multiply(Gs * Gs)
-        C = C + mcut._a_b_one(Gs, Gs.transpose()) - Gs.multiply(Gs.transpose() * Je)
-        motif_adj_mat = C + C.transpose()
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M9", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
@@ -1261,8 +2752,9 @@ def mam_M10(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -1276,117 +2768,22 @@ def mam_M10(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = J * (Jn @ J)
-        Cprime = Jn * (J @ J.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Js * (J0 @ Js)
-        Cprime = J0 * (Js @ Js.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = J * (Jn @ G) + G * (Jn @ J)
-        Cprime = Jn * (J @ G.transpose()) + Jn * (G @ J.transpose())
-        motif_adj_mat = (C + C.transpose() + Cprime) / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Js * (J0 @ Gs) + Gs * (J0 @ Js)
-        Cprime = J0 * (Js @ Gs.transpose()) + J0 * (Gs @ Js.transpose())
-        motif_adj_mat = (C + C.transpose() + Cprime) / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = G * (Jn @ G)
-        Cprime = Jn * (G @ G.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Gs * (J0 @ Gs)
-        Cprime = J0 * (Gs @ Gs.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_one_b(J, J) - J.multiply(J)
-        Cprime = J * J.transpose() - Id.multiply(J * J.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_one_b(Js, Js) - Js.multiply(Je * Js)
-        Cprime = Js * Js.transpose() - Je.multiply(Js * Js.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_one_b(J, G) - J.multiply(G) + mcut._a_one_b(G, J) - G.multiply(J)
-        Cprime = J * G.transpose() - Id.multiply(J * G.transpose())
-        Cprime = Cprime + G * J.transpose() - Id.multiply(G * J.transpose())
-        motif_adj_mat = (C + C.transpose() + Cprime) / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_one_b(Js, Gs) - Js.multiply(Je * Gs)
-        C = C + mcut._a_one_b(Gs, Js) - Gs.multiply(Je * Js)
-        Cprime = Js * Gs.transpose() - Je.multiply(Js * Gs.transpose())
-        Cprime = Cprime + Gs * Js.transpose() - Je.multiply(Gs * Js.transpose())
-        motif_adj_mat = (C + C.transpose() + Cprime) / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_one_b(G, G) - G.multiply(G)
-        Cprime = G * G.transpose() - Id.multiply(G * G.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_one_b(Gs, Gs) - Gs.multiply(Je * Gs)
-        Cprime = Gs * Gs.transpose() - Je.multiply(Gs * Gs.transpose())
-        motif_adj_mat = C + C.transpose() + Cprime
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M10", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
 
-def mam_M11(adj_mat, motif_type, mam_weight_type, mam_method): # pylint: disable=too-many-statements
+def mam_M11(adj_mat, motif_type, mam_weight_type, mam_method):
 
   """
   Perform the motif adjacency matrix calculations for motif M11.
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -1400,136 +2797,22 @@ def mam_M11(adj_mat, motif_type, mam_weight_type, mam_method): # pylint: disable
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        J = mcin._build_J(adj_mat)
-        C = Jd * (J @ Jn) + Jn * (Jd @ J) + J * (Jd @ Jn)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        Js = mcin._build_Js(adj_mat)
-        C = Jd * (Js @ J0) + J0 * (Jd @ Js) + Js * (Jd @ J0)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = Jd * (G @ Jn) + Gd * (J @ Jn)
-        C = C + Jn * (Jd @ G) + Jn * (Gd @ J)
-        C = C + J * (Gd @ Jn) + G * (Jd @ Jn)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = Jd * (Gs @ J0) + Gd * (Js @ J0)
-        C = C + J0 * (Jd @ Gs) + J0 * (Gd @ Js)
-        C = C + Js * (Gd @ J0) + Gs * (Jd @ J0)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        Gp = mcin._build_Gp(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = Gp * (G @ Jn) + Jn * (Gp @ G) + G * (Gp @ Jn)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gp = mcin._build_Gp(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = Gp * (Gs @ J0) + J0 * (Gp @ Gs) + Gs * (Gp @ J0)
-        motif_adj_mat = C + C.transpose()
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        J = mcin._build_J(adj_mat)
-        C = mcut._a_b_one(Jd, J) - Jd.multiply(J)
-        C = C + Jd * J - Id.multiply(Jd * J)
-        C = C + mcut._a_b_one(J, Jd) - J.multiply(Jd)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        Js = mcin._build_Js(adj_mat)
-        C = mcut._a_b_one(Jd, Js) - Jd.multiply(Js * Je)
-        C = C + Jd * Js - Je.multiply(Jd * Js)
-        C = C + mcut._a_b_one(Js, Jd) - Js.multiply(Jd * Je)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = mcut._a_b_one(Jd, G) - Jd.multiply(G) + mcut._a_b_one(Gd, J) - Gd.multiply(J)
-        C = C + Jd * G - Id.multiply(Jd * G) + Gd * J - Id.multiply(Gd * J)
-        C = C + mcut._a_b_one(J, Gd) - J.multiply(Gd) + mcut._a_b_one(G, Jd) - G.multiply(Jd)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = mcut._a_b_one(Jd, Gs) - Jd.multiply(Gs * Je)
-        C = C + mcut._a_b_one(Gd, Js) - Gd.multiply(Js * Je)
-        C = C + Jd * Gs - Je.multiply(Jd * Gs) + Gd * Js - Je.multiply(Gd * Js)
-        C = C + mcut._a_b_one(Js, Gd) - Js.multiply(Gd * Je)
-        C = C + mcut._a_b_one(Gs, Jd) - Gs.multiply(Jd * Je)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        Gp = mcin._build_Gp(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = mcut._a_b_one(Gp, G) - Gp.multiply(G)
-        C = C + Gp * G - Id.multiply(Gp * G)
-        C = C + mcut._a_b_one(G, Gp) - G.multiply(Gp)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gp = mcin._build_Gp(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = mcut._a_b_one(Gp, Gs) - Gp.multiply(Gs * Je)
-        C = C + Gp * Gs - Je.multiply(Gp * Gs)
-        C = C + mcut._a_b_one(Gs, Gp) - Gs.multiply(Gp * Je)
-        motif_adj_mat = C + C.transpose()
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M11", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
 
-def mam_M12(adj_mat, motif_type, mam_weight_type, mam_method): # pylint: disable=too-many-statements
+def mam_M12(adj_mat, motif_type, mam_weight_type, mam_method):
 
   """
   Perform the motif adjacency matrix calculations for motif M12.
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -1543,123 +2826,8 @@ def mam_M12(adj_mat, motif_type, mam_weight_type, mam_method): # pylint: disable
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        J = mcin._build_J(adj_mat)
-        C = Jd * (Jn @ J) + Jn * (J @ Jd) + J * (Jn @ Jd)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        Js = mcin._build_Js(adj_mat)
-        C = Jd * (J0 @ Js) + J0 * (Js @ Jd) + Js * (J0 @ Jd)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        G = mcin._build_G(adj_mat)
-        J = mcin._build_J(adj_mat)
-        C = Jd * (Jn @ G) + Gd * (Jn @ J)
-        C = C + Jn * (J @ Gd) + Jn * (G @ Jd)
-        C = C + J * (Jn @ Gd) + G * (Jn @ Jd)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = Jd * (J0 @ Gs) + Gd * (J0 @ Js)
-        C = C + J0 * (Js @ Gd) + J0 * (Gs @ Jd)
-        C = C + Js * (J0 @ Gd) + Gs * (J0 @ Jd)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        Gp = mcin._build_Gp(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = Gp * (Jn @ G) + Jn * (G @ Gp) + G * (Jn @ Gp)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gp = mcin._build_Gp(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = Gp * (J0 @ Gs) + J0 * (Gs @ Gp) + Gs * (J0 @ Gp)
-        motif_adj_mat = C + C.transpose()
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        J = mcin._build_J(adj_mat)
-        C = mcut._a_one_b(Jd, J) - Jd.multiply(J)
-        C = C + J * Jd - Id.multiply(J * Jd)
-        C = C + mcut._a_one_b(J, Jd) - J.multiply(Jd)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        Js = mcin._build_Js(adj_mat)
-        C = mcut._a_one_b(Jd, Js) - Jd.multiply(Je * Js)
-        C = C + Js * Jd - Je.multiply(Js * Jd)
-        C = C + mcut._a_one_b(Js, Jd) - Js.multiply(Je * Jd)
-        motif_adj_mat = C + C.transpose()
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = mcut._a_one_b(Jd, G) - Jd.multiply(G) + mcut._a_one_b(Gd, J) - Gd.multiply(J)
-        C = C + J * Gd - Id.multiply(J * Gd) + G * Jd - Id.multiply(G * Jd)
-        C = C + mcut._a_one_b(J, Gd) - J.multiply(Gd) + mcut._a_one_b(G, Jd) - G.multiply(Jd)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = mcut._a_one_b(Jd, Gs) - Jd.multiply(Je * Gs)
-        C = C + mcut._a_one_b(Gd, Js) - Gd.multiply(Je * Js)
-        C = C + Js * Gd - Je.multiply(Js * Gd) + Gs * Jd - Je.multiply(Gs * Jd)
-        C = C + mcut._a_one_b(Js, Gd) - Js.multiply(Je * Gd)
-        C = C + mcut._a_one_b(Gs, Jd) - Gs.multiply(Je * Jd)
-        motif_adj_mat = (C + C.transpose()) / 3
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        Gp = mcin._build_Gp(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = mcut._a_one_b(Gp, G) - Gp.multiply(G)
-        C = C + G * Gp - Id.multiply(G * Gp)
-        C = C + mcut._a_one_b(G, Gp) - G.multiply(Gp)
-        motif_adj_mat = C + C.transpose()
-
-      if motif_type == "struc":
-        Gp = mcin._build_Gp(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        C = mcut._a_one_b(Gp, Gs) - Gp.multiply(Je * Gs)
-        C = C + Gs * Gp - Je.multiply(Gs * Gp)
-        C = C + mcut._a_one_b(Gs, Gp) - Gs.multiply(Je * Gp)
-        motif_adj_mat = C + C.transpose()
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M12", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
@@ -1671,8 +2839,9 @@ def mam_M13(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -1686,100 +2855,8 @@ def mam_M13(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = Jd * (Jd @ Jn)
-        Cprime = Jn * (Jd @ Jd)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Jd * (Jd @ J0)
-        Cprime = J0 * (Jd @ Jd)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Jd * (Gd @ Jn) + Gd * (Jd @ Jn) + Jn * (Jd @ Gd)
-        motif_adj_mat = (C + C.transpose()) / 4
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        C = Jd * (Gd @ J0) + Gd * (Jd @ J0) + J0 * (Jd @ Gd)
-        motif_adj_mat = (C + C.transpose()) / 4
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        Gp = mcin._build_Gp(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = Gp * (Gp @ Jn)
-        Cprime = Jn * (Gp @ Gp)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gp = mcin._build_Gp(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = Gp * (Gp @ J0)
-        Cprime = J0 * (Gp @ Gp)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_b_one(Jd, Jd) - Jd.multiply(Jd)
-        Cprime = Jd * Jd - Id.multiply(Jd * Jd)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_b_one(Jd, Jd) - Jd.multiply(Jd * Je)
-        Cprime = Jd * Jd - Je.multiply(Jd * Jd)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_b_one(Jd, Gd) - Jd.multiply(Gd) + mcut._a_b_one(Gd, Jd) - Gd.multiply(Jd)
-        C = C + Jd * Gd - Id.multiply(Jd * Gd)
-        motif_adj_mat = (C + C.transpose()) / 4
-
-      if motif_type == "struc":
-        Jd = mcin._build_Jd(adj_mat)
-        Gd = mcin._build_Gd(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_b_one(Jd, Gd) - Jd.multiply(Gd * Je)
-        C = C + mcut._a_b_one(Gd, Jd) - Gd.multiply(Jd * Je)
-        C = C + Jd * Gd - Je.multiply(Jd * Gd)
-        motif_adj_mat = (C + C.transpose()) / 4
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        Gp = mcin._build_Gp(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = mcut._a_b_one(Gp, Gp) - Gp.multiply(Gp)
-        Cprime = Gp * Gp - Id.multiply(Gp * Gp)
-        motif_adj_mat = C + C.transpose() + Cprime
-
-      if motif_type == "struc":
-        Gp = mcin._build_Gp(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = mcut._a_b_one(Gp, Gp) - Gp.multiply(Gp * Je)
-        Cprime = Gp * Gp - Je.multiply(Gp * Gp)
-        motif_adj_mat = C + C.transpose() + Cprime
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "M13", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
@@ -1791,8 +2868,9 @@ def mam_Mcoll(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -1806,91 +2884,8 @@ def mam_Mcoll(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = Jn * (J @ J.transpose())
-        motif_adj_mat = C
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = J0 * (Js @ Js.transpose())
-        motif_adj_mat = C
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = Jn * (J @ G.transpose()) + Jn * (G @ J.transpose())
-        motif_adj_mat = C / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = J0 * (Js @ Gs.transpose()) + J0 * (Gs @ Js.transpose())
-        motif_adj_mat = C / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = Jn * (G @ G.transpose())
-        motif_adj_mat = C
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = J0 * (Gs @ Gs.transpose())
-        motif_adj_mat = C
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = J * J.transpose() - Id.multiply(J * J.transpose())
-        motif_adj_mat = C
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = Js * Js.transpose() - Je.multiply(Js * Js.transpose())
-        motif_adj_mat = C
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = J * G.transpose() - Id.multiply(J * G.transpose())
-        C = C + G * J.transpose() - Id.multiply(G * J.transpose())
-        motif_adj_mat = C / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = Js * Gs.transpose() - Je.multiply(Js * Gs.transpose())
-        C = C + Gs * Js.transpose() - Je.multiply(Gs * Js.transpose())
-        motif_adj_mat = C / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = G * G.transpose() - Id.multiply(G * G.transpose())
-        motif_adj_mat = C
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = Gs * Gs.transpose() - Je.multiply(Gs * Gs.transpose())
-        motif_adj_mat = C
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "Mcoll", motif_type, mam_weight_type)
 
   return motif_adj_mat
 
@@ -1902,8 +2897,9 @@ def mam_Mexpa(adj_mat, motif_type, mam_weight_type, mam_method):
 
   Parameters
   ----------
-  adj_mat : matrix
-    Adjacency matrix from which to build the motif adjacency matrix.
+  adj_mat : matrix or IndicatorBundle
+    Adjacency matrix from which to build the motif adjacency matrix,
+    or an indicator bundle holding it.
   motif_type : str
     Type of motif adjacency matrix to build.
   mam_weight_type : str
@@ -1917,90 +2913,7 @@ def mam_Mexpa(adj_mat, motif_type, mam_weight_type, mam_method):
     A motif adjacency matrix.
   """
 
-  if mam_method == "dense":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = Jn * (J.transpose() @ J)
-        motif_adj_mat = C
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = J0 * (Js.transpose() @ Js)
-        motif_adj_mat = C
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        G = mcin._build_G(adj_mat)
-        C = Jn * (J.transpose() @ G) + Jn * (G.transpose() @ J)
-        motif_adj_mat = C / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = J0 * (Js.transpose() @ Gs) + J0 * (Gs.transpose() @ Js)
-        motif_adj_mat = C / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Jn = mcin._build_Jn(adj_mat)
-        C = Jn * (G.transpose() @ G)
-        motif_adj_mat = C
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        J0 = mcin._build_J0(adj_mat)
-        C = J0 * (Gs.transpose() @ Gs)
-        motif_adj_mat = C
-
-  if mam_method == "sparse":
-    if mam_weight_type == "unweighted":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = J.transpose() * J - Id.multiply(J.transpose() * J)
-        motif_adj_mat = C
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = Js.transpose() * Js - Je.multiply(Js.transpose() * Js)
-        motif_adj_mat = C
-
-    if mam_weight_type == "mean":
-      if motif_type == "func":
-        J = mcin._build_J(adj_mat)
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = J.transpose() * G - Id.multiply(J.transpose() * G)
-        C = C + G.transpose() * J - Id.multiply(G.transpose() * J)
-        motif_adj_mat = C / 2
-
-      if motif_type == "struc":
-        Js = mcin._build_Js(adj_mat)
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = Js.transpose() * Gs - Je.multiply(Js.transpose() * Gs)
-        C = C + Gs.transpose() * Js - Je.multiply(Gs.transpose() * Js)
-        motif_adj_mat = C / 2
-
-    if mam_weight_type == "product":
-      if motif_type == "func":
-        G = mcin._build_G(adj_mat)
-        Id = mcin._build_Id(adj_mat)
-        C = G.transpose() * G - Id.multiply(G.transpose() * G)
-        motif_adj_mat = C
-
-      if motif_type == "struc":
-        Gs = mcin._build_Gs(adj_mat)
-        Je = mcin._build_Je(adj_mat)
-        C = Gs.transpose() * Gs - Je.multiply(Gs.transpose() * Gs)
-        motif_adj_mat = C
+  adj_mat = mcin._as_bundle(adj_mat, mam_method)
+  motif_adj_mat = _evaluate_formula(adj_mat, "Mexpa", motif_type, mam_weight_type)
 
   return motif_adj_mat
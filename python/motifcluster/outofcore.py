@@ -0,0 +1,226 @@
+"""
+Functions for storing sparse matrices on disk
+are in `motifcluster.outofcore`.
+"""
+
+import json
+import os
+import numpy as np
+from scipy import sparse
+
+# largest value held by the 32-bit index arrays used by scipy
+_INT32_MAX = np.iinfo(np.int32).max
+
+
+def save_csr(some_mat, path):
+
+  """
+  Save a sparse matrix to disk in memory-mappable form.
+
+  The three arrays of the CSR form of the matrix are written
+  as raw binary files to a directory,
+  along with a small JSON file describing them,
+  so that `load_csr` can map them into memory without reading them.
+
+  Parameters
+  ----------
+  some_mat : matrix
+    The matrix to save.
+  path : str
+    The directory to save the matrix to.
+    It is created if it does not exist.
+
+  Returns
+  -------
+  sparse matrix
+    The saved matrix, loaded with `load_csr`.
+  """
+
+  some_mat = sparse.csr_matrix(some_mat)
+
+  return _write_panels([some_mat], path, some_mat.shape, some_mat.dtype)
+
+
+def load_csr(path):
+
+  """
+  Load a sparse matrix saved with `save_csr`.
+
+  The arrays of the matrix are memory-mapped read-only,
+  so the operating system reads the parts which are used
+  on demand, and can drop them again under memory pressure.
+
+  Parameters
+  ----------
+  path : str
+    The directory the matrix was saved to.
+
+  Returns
+  -------
+  sparse matrix
+    The matrix in CSR form, with arrays mapped from disk.
+  """
+
+  with open(os.path.join(path, "meta.json"), encoding="utf-8") as meta_file:
+    meta = json.load(meta_file)
+
+  n_rows = meta["shape"][0]
+  nnz = meta["nnz"]
+  data = _map_array(path, "data", meta["data_dtype"], nnz)
+  indices = _map_array(path, "indices", meta["index_dtype"], nnz)
+  indptr = _map_array(path, "indptr", meta["index_dtype"], n_rows + 1)
+
+  return sparse.csr_matrix((data, indices, indptr), shape=tuple(meta["shape"]), copy=False)
+
+
+def _map_array(path, name, dtype, size):
+
+  """
+  Map an array saved by `_write_panels` into memory.
+
+  Parameters
+  ----------
+  path : str
+    The directory the array was saved to.
+  name : str
+    The name of the array.
+  dtype : str
+    The data type of the array.
+  size : int
+    The number of entries in the array.
+
+  Returns
+  -------
+  array
+    A read-only memory-mapped array,
+    or an empty in-memory array if `size` is zero.
+  """
+
+  if size == 0:
+    return np.zeros(0, dtype=dtype)
+
+  return np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=(size,))
+
+
+def _get_panels(row_costs, panel_size):
+
+  """
+  Split the rows of a matrix into panels of bounded cost.
+
+  Parameters
+  ----------
+  row_costs : array
+    The cost of each row, such as a bound on
+    the number of entries computed for it.
+  panel_size : int
+    The largest total cost of a panel.
+    A single row costing more than this forms its own panel.
+
+  Returns
+  -------
+  list of tuple
+    The `(start, stop)` rows of each panel, in order.
+    There is at least one panel.
+  """
+
+  n = len(row_costs)
+  cum_costs = np.cumsum(row_costs)
+  panels = []
+  start = 0
+
+  while start < n:
+    offset = cum_costs[start] - row_costs[start]
+    stop = max(np.searchsorted(cum_costs, offset + panel_size, side="right"), start + 1)
+    panels.append((start, int(stop)))
+    start = int(stop)
+
+  return panels or [(0, 0)]
+
+
+def _write_panels(panels, path, shape, dtype=np.float64):
+
+  """
+  Write a sparse matrix to disk one panel of rows at a time.
+
+  Only one panel is held in memory at once.
+  Column indices are written as 32-bit integers where possible,
+  matching scipy, so that the arrays can be mapped without conversion.
+
+  Parameters
+  ----------
+  panels : iterable of sparse matrix
+    Consecutive panels of rows of the matrix, in CSR form.
+  path : str
+    The directory to write the matrix to.
+    It is created if it does not exist.
+  shape : tuple
+    The shape of the matrix.
+  dtype : dtype
+    The data type in which to write the entries.
+
+  Returns
+  -------
+  sparse matrix
+    The written matrix, loaded with `load_csr`.
+  """
+
+  os.makedirs(path, exist_ok=True)
+  index_dtype = np.int32 if max(shape) <= _INT32_MAX else np.int64
+  row_nnzs = [np.zeros(1, dtype=np.int64)]
+
+  with open(os.path.join(path, "data"), "wb") as data_file, \
+       open(os.path.join(path, "indices"), "wb") as indices_file:
+
+    for panel in panels:
+      panel = sparse.csr_matrix(panel)
+      panel.sort_indices()
+      data_file.write(np.ascontiguousarray(panel.data, dtype=dtype).tobytes())
+      indices_file.write(np.ascontiguousarray(panel.indices, dtype=index_dtype).tobytes())
+      row_nnzs.append(np.diff(panel.indptr).astype(np.int64))
+
+  indptr = np.cumsum(np.concatenate(row_nnzs))
+  assert len(indptr) == shape[0] + 1
+  nnz = int(indptr[-1])
+
+  # too many entries for 32-bit row pointers
+  if nnz > _INT32_MAX and index_dtype == np.int32:
+    _widen_indices(path, nnz)
+    index_dtype = np.int64
+
+  with open(os.path.join(path, "indptr"), "wb") as indptr_file:
+    indptr_file.write(indptr.astype(index_dtype).tobytes())
+
+  meta = {"shape": [int(shape[0]), int(shape[1])], "nnz": nnz,
+          "data_dtype": np.dtype(dtype).str, "index_dtype": np.dtype(index_dtype).str}
+
+  with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as meta_file:
+    json.dump(meta, meta_file)
+
+  return load_csr(path)
+
+
+def _widen_indices(path, nnz, max_chunk=2**24):
+
+  """
+  Convert saved column indices from 32-bit to 64-bit integers.
+
+  Parameters
+  ----------
+  path : str
+    The directory holding the indices.
+  nnz : int
+    The number of saved indices.
+  max_chunk : int
+    Maximum number of indices to hold in memory at once.
+  """
+
+  old_name = os.path.join(path, "indices")
+  new_name = os.path.join(path, "indices.tmp")
+  old_indices = np.memmap(old_name, dtype=np.int32, mode="r", shape=(nnz,))
+
+  with open(new_name, "wb") as new_file:
+    for start in range(0, nnz, max_chunk):
+      new_file.write(old_indices[start:start + max_chunk].astype(np.int64).tobytes())
+
+  del old_indices
+  os.replace(new_name, old_name)
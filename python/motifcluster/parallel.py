@@ -0,0 +1,252 @@
+"""
+Functions for building motif adjacency matrices in parallel
+are in `motifcluster.parallel`.
+"""
+
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from scipy import sparse
+
+from motifcluster import indicators as mcin
+
+# state of a worker process, set up once by `_init_worker`
+_WORKER_STATE = {}
+
+
+def _get_n_jobs(n_jobs):
+
+  """
+  Get the number of worker processes to use.
+
+  Parameters
+  ----------
+  n_jobs : int
+    Number of worker processes.
+    `None` or `1` means no parallelism,
+    and negative values count back from the number of CPUs,
+    so that `-1` uses all of them.
+
+  Returns
+  -------
+  int
+    The number of worker processes, at least one.
+  """
+
+  if n_jobs is None:
+    return 1
+
+  assert isinstance(n_jobs, int) and n_jobs != 0
+
+  if n_jobs < 0:
+    n_jobs = (os.cpu_count() or 1) + 1 + n_jobs
+
+  return max(n_jobs, 1)
+
+
+def _get_row_blocks(n, n_blocks, row_costs=None):
+
+  """
+  Split the rows of a matrix into contiguous blocks.
+
+  Parameters
+  ----------
+  n : int
+    Number of rows.
+  n_blocks : int
+    Number of blocks.
+  row_costs : array
+    If given, the cost of each row, and the blocks are chosen
+    to have roughly equal total cost rather than equal numbers of rows.
+    A row costing more than a block forms its own block,
+    so there may be fewer blocks than requested.
+
+  Returns
+  -------
+  list of tuple
+    The `(start, stop)` rows of each block, in order.
+    There are no more blocks than rows, but at least one block.
+  """
+
+  if row_costs is None or n == 0 or np.sum(row_costs) <= 0:
+    bounds = np.linspace(0, n, min(n_blocks, max(n, 1)) + 1).astype(int)
+
+  else:
+    cum_costs = np.cumsum(row_costs)
+    targets = cum_costs[-1] * np.arange(1, n_blocks) / n_blocks
+    cuts = np.minimum(np.searchsorted(cum_costs, targets) + 1, n)
+    bounds = np.unique(np.concatenate([[0], cuts, [n]]))
+
+  return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def _share_matrix(adj_mat):
+
+  """
+  Copy a matrix into shared memory.
+
+  A dense matrix is shared as one array,
+  and a sparse matrix as the three arrays of its CSR form.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    The matrix to share.
+
+  Returns
+  -------
+  shms : list
+    The shared memory blocks, which must be
+    closed and unlinked by the caller.
+  spec : dict
+    A picklable description of the shared matrix,
+    from which `_attach_matrix` rebuilds it.
+  """
+
+  if sparse.issparse(adj_mat):
+    adj_mat = sparse.csr_matrix(adj_mat)
+    arrays = [adj_mat.data, adj_mat.indices, adj_mat.indptr]
+
+  else:
+    arrays = [np.asarray(adj_mat)]
+
+  shms = []
+  array_specs = []
+
+  for array in arrays:
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared_array[...] = array
+    shms.append(shm)
+    array_specs.append((shm.name, array.shape, array.dtype.str))
+
+  spec = {"sparse": sparse.issparse(adj_mat), "shape": adj_mat.shape, "arrays": array_specs}
+
+  return shms, spec
+
+
+def _attach_matrix(spec):
+
+  """
+  Rebuild a matrix from shared memory without copying.
+
+  Parameters
+  ----------
+  spec : dict
+    A description of the shared matrix from `_share_matrix`.
+
+  Returns
+  -------
+  adj_mat : matrix
+    The matrix, whose arrays are views of the shared memory.
+  shms : list
+    The attached shared memory blocks,
+    which must be kept open while the matrix is in use.
+  """
+
+  shms = []
+  arrays = []
+
+  for name, shape, dtype in spec["arrays"]:
+    shm = shared_memory.SharedMemory(name=name)
+    shms.append(shm)
+    arrays.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+  if spec["sparse"]:
+    adj_mat = sparse.csr_matrix(tuple(arrays), shape=spec["shape"], copy=False)
+
+  else:
+    adj_mat = arrays[0]
+
+  return adj_mat, shms
+
+
+def _init_worker(spec, mam_method, backend, dtype):
+
+  """
+  Set up a worker process.
+
+  Attach the shared adjacency matrix and wrap it in an indicator
+  bundle, which is then reused by all tasks run by the worker.
+
+  Parameters
+  ----------
+  spec : dict
+    A description of the shared adjacency matrix.
+  mam_method : str
+    Which formulation the indicators are for.
+    One of `"dense"` or `"sparse"`.
+  backend : backend
+    The backend for the sparse matrix products.
+  dtype : dtype
+    The data type of the indicator matrices, or `None`.
+  """
+
+  adj_mat, shms = _attach_matrix(spec)
+  _WORKER_STATE["shms"] = shms
+  _WORKER_STATE["bundle"] = mcin.IndicatorBundle(adj_mat, mam_method, backend, dtype)
+
+
+def _run_task(task):
+
+  """
+  Run a task in a worker process.
+
+  Parameters
+  ----------
+  task : tuple
+    A function and its arguments other than the indicator bundle.
+
+  Returns
+  -------
+  The result of calling the function with the worker's bundle
+  followed by the arguments.
+  """
+
+  block_function, args = task
+
+  return block_function(_WORKER_STATE["bundle"], *args)
+
+
+def _map_row_blocks(adj_mat, block_function, tasks, n_jobs):
+
+  """
+  Compute blocks of rows in a pool of worker processes.
+
+  The adjacency matrix is placed in shared memory once,
+  and each worker builds its indicator matrices from
+  views of it rather than from a pickled copy.
+
+  Parameters
+  ----------
+  adj_mat : IndicatorBundle
+    The bundle holding the adjacency matrix.
+  block_function : function
+    A module-level function taking an indicator bundle
+    followed by the arguments in a task.
+  tasks : list of tuple
+    The arguments for each call of `block_function`.
+  n_jobs : int
+    Number of worker processes.
+
+  Returns
+  -------
+  list
+    The result of each task, in order.
+  """
+
+  shms, spec = _share_matrix(adj_mat.adj_mat)
+
+  try:
+    with multiprocessing.get_context().Pool(n_jobs, _init_worker,
+                                            (spec, adj_mat.mam_method,
+                                             adj_mat.backend, adj_mat.dtype)) as pool:
+      results = pool.map(_run_task, [(block_function, args) for args in tasks], chunksize=1)
+
+  finally:
+    for shm in shms:
+      shm.close()
+      shm.unlink()
+
+  return results
@@ -9,6 +9,7 @@ from scipy import linalg
 
 from motifcluster import utils as mcut
 from motifcluster import motifadjacency as mcmo
+from motifcluster import cache as mcca
 
 def _get_first_eigs(some_mat, num_eigs):
 
@@ -74,7 +75,7 @@ def _get_first_eigs(some_mat, num_eigs):
   return spectrum
 
 
-def build_laplacian(adj_mat, type_lap="rw"):
+def build_laplacian(adj_mat, type_lap="rw", dtype=None):
 
   """
   Build a Laplacian matrix.
@@ -89,6 +90,9 @@ def build_laplacian(adj_mat, type_lap="rw"):
   type_lap : str
     Type of Laplacian to build.
     One of `"comb"` (combinatorial) or `"rw"` (random-walk).
+  dtype : dtype
+    The floating type in which to build the Laplacian,
+    or `None` to follow the type of `adj_mat`.
 
   Returns
   -------
@@ -105,8 +109,8 @@ def build_laplacian(adj_mat, type_lap="rw"):
   assert type_lap in ["comb", "rw"]
   n = adj_mat.shape[0]
 
-  if not sparse.issparse(adj_mat):
-    adj_mat = sparse.csr_matrix(adj_mat)
+  if not sparse.issparse(adj_mat) or dtype is not None:
+    adj_mat = sparse.csr_matrix(adj_mat, dtype=dtype)
 
   # initialize parameters
   degs_adj_mat = adj_mat.sum(axis=0).reshape(n)
@@ -120,30 +124,41 @@ def build_laplacian(adj_mat, type_lap="rw"):
   elif type_lap == "rw":
     assert (degs_adj_mat > 0).all()
     inv_degs_matrix = sparse.diags(1 / degs_adj_mat, offsets=[0], shape=(n, n))
-    L = sparse.identity(n) - inv_degs_matrix * adj_mat
+    L = sparse.identity(n, dtype=inv_degs_matrix.dtype) - inv_degs_matrix * adj_mat
 
-  L = sparse.csr_matrix(L)
+  L = sparse.csr_matrix(L, dtype=dtype)
 
   return L
 
 
-def run_laplace_embedding(adj_mat, num_eigs, type_lap="rw"):
+def run_laplace_embedding(adj_mat, num_eigs, type_lap="rw", degs=None, dtype=None):
 
   """
   Run Laplace embedding.
 
   Run Laplace embedding on a symmetric (weighted) adjacency matrix
   with a specified number of eigenvalues and eigenvectors.
+  The adjacency matrix can also be given as a linear operator,
+  such as from `motifadjacency.build_motif_adjacency_operator`,
+  in which case the Laplacian is only applied to vectors,
+  and never formed.
 
   Parameters
   ----------
-  adj_mat : matrix
+  adj_mat : matrix or LinearOperator
     Symmetric adjacency matrix to be embedded.
   num_eigs : int
     Number of eigenvalues and eigenvectors for the embedding.
   type_lap : str
     Type of Laplacian for the embedding.
     One of `"comb"` (combinatorial) or `"rw"` (random-walk).
+  degs : array
+    The row sums of `adj_mat`, if it is a linear operator.
+    Computed from it if not given.
+  dtype : dtype
+    The floating type in which to build the Laplacian
+    and compute its eigenvectors, if `adj_mat` is a matrix,
+    or `None` to follow the type of `adj_mat`.
 
   Returns
   -------
@@ -165,21 +180,242 @@ def run_laplace_embedding(adj_mat, num_eigs, type_lap="rw"):
   assert num_eigs >= 1
   assert type_lap in ["comb", "rw"]
 
+  # embed implicit Laplacian
+  if isinstance(adj_mat, sparse.linalg.LinearOperator):
+    return _get_first_eigs_implicit(adj_mat, num_eigs, type_lap, degs)
+
   # build and embed Laplacian
-  laplacian = build_laplacian(adj_mat, type_lap)
+  laplacian = build_laplacian(adj_mat, type_lap, dtype)
   spectrum = _get_first_eigs(laplacian, num_eigs)
 
   return spectrum
 
 
-def run_motif_embedding(adj_mat, motif_name,
+def _get_symmetric_operator(half_mat):
+
+  """
+  Get a symmetric matrix stored in half as a linear operator.
+
+  Parameters
+  ----------
+  half_mat : sparse matrix
+    A matrix holding each entry of a symmetric matrix once,
+    at either its own position or its transposed position,
+    such as an upper triangle, or a permutation of one.
+
+  Returns
+  -------
+  LinearOperator
+    The symmetric matrix `half + half.T - diag(half)`,
+    applied to vectors using only `half`,
+    in the type of `half_mat`, or the floating type
+    of the same size if it holds integer counts.
+  """
+
+  dtype = half_mat.dtype
+
+  if not np.issubdtype(dtype, np.floating):
+    dtype = np.dtype(f"float{8 * dtype.itemsize}")
+
+  half_mat = sparse.csr_matrix(half_mat, dtype=dtype)
+  diag = half_mat.diagonal()
+
+  def matvec(x):
+    x = np.ravel(x)
+    return half_mat @ x + half_mat.T @ x - diag * x
+
+  return sparse.linalg.LinearOperator(half_mat.shape, matvec=matvec, rmatvec=matvec,
+                                      dtype=dtype)
+
+
+def _build_motif_adjacency_matrix_cached(adj_mat, motif_name, # pylint: disable=too-many-positional-arguments
+                                         motif_type, mam_weight_type, mam_method,
+                                         backend, cache, dtype, upper=False):
+
+  """
+  Build a motif adjacency matrix, cached in memory if requested.
+
+  Parameters
+  ----------
+  adj_mat : sparse matrix
+    Adjacency matrix from which to build the motif adjacency matrix.
+  motif_name : str
+    Motif used for the motif adjacency matrix.
+  motif_type : str
+    Type of motif adjacency matrix to build.
+  mam_weight_type : str
+    The weighting scheme to use.
+  mam_method : str
+    The method to use for building the motif adjacency matrix.
+  backend : str or backend
+    The backend for the sparse matrix products.
+  cache : str, MotifAdjacencyCache or EmbeddingCache
+    The cache to use, as in `run_motif_embedding`, or `None`.
+  dtype : dtype
+    The precision of the motif adjacency matrix, or `None`.
+  upper : bool
+    Whether to build only the upper triangle.
+
+  Returns
+  -------
+  motif_adj_mat : sparse matrix
+    The motif adjacency matrix, or its upper triangle.
+  key : tuple
+    The key of the motif adjacency matrix in an `EmbeddingCache`,
+    or `None` if it is not held in one.
+  """
+
+  if not isinstance(cache, mcca.EmbeddingCache) or mam_method == "approx":
+    return mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, motif_type,
+                                             mam_weight_type, mam_method, backend=backend,
+                                             cache=cache, dtype=dtype, upper=upper), None
+
+  key = mcca._get_mam_key(adj_mat, motif_name, motif_type, mam_weight_type, mam_method,
+                          dtype=mcut._get_mam_dtype(dtype, mam_weight_type, mam_method),
+                          upper=upper)
+  motif_adj_mat = mcca._memoize(cache.mams, key, lambda: mcmo.build_motif_adjacency_matrix(
+    adj_mat, motif_name, motif_type, mam_weight_type, mam_method, backend=backend,
+    cache=cache.disk, dtype=dtype, upper=upper))
+
+  return motif_adj_mat, key
+
+
+def _run_laplace_embedding_cached(adj_mat, num_eigs, # pylint: disable=too-many-positional-arguments
+                                  type_lap, dtype, cache, key):
+
+  """
+  Run Laplace embedding with its stages cached in memory.
+
+  Parameters
+  ----------
+  adj_mat : matrix or LinearOperator
+    Symmetric adjacency matrix to be embedded.
+    The Laplacian of a linear operator is never formed,
+    so only its spectrum is cached.
+  num_eigs : int
+    Number of eigenvalues and eigenvectors for the embedding.
+  type_lap : str
+    Type of Laplacian for the embedding.
+    One of `"comb"` or `"rw"`.
+  dtype : dtype
+    The floating type of the Laplacian, or `None`.
+  cache : EmbeddingCache
+    The cache holding the Laplacians and spectra.
+  key : tuple
+    The key of the Laplacian of `adj_mat` in `cache`,
+    identifying the graph and the parameters used to build it.
+
+  Returns
+  -------
+  vals : list
+    A length-`num_eigs` list of the first few eigenvalues
+    of the Laplacian matrix.
+  vects : matrix
+    A `adj_mat.shape[0]` by `num_eigs` matrix
+    of the associated eigenvectors.
+  """
+
+  if isinstance(adj_mat, sparse.linalg.LinearOperator):
+    return mcca._memoize(cache.spectra, key + (num_eigs,), lambda: _get_first_eigs_implicit(
+      adj_mat, num_eigs, type_lap))
+
+  return mcca._memoize(cache.spectra, key + (num_eigs,), lambda: _get_first_eigs(
+    mcca._memoize(cache.laplacians, key, lambda: build_laplacian(adj_mat, type_lap, dtype)),
+    num_eigs))
+
+
+def _get_first_eigs_implicit(adj_op, num_eigs, type_lap, degs=None):
+
+  """
+  Compute the first few eigenvalues and eigenvectors of an implicit Laplacian.
+
+  The random-walk Laplacian `I - D^-1 A` shares its eigenvalues with
+  the symmetric `I - D^-1/2 A D^-1/2`, whose smallest eigenvalues are
+  found as the largest of `D^-1/2 A D^-1/2`.
+  The smallest eigenvalues of the combinatorial Laplacian `D - A`
+  are found as the largest of `c I - (D - A)`,
+  where `c` is twice the largest degree,
+  which bounds the spectrum of `D - A`.
+  Both only need products of `A` with vectors.
+
+  Parameters
+  ----------
+  adj_op : LinearOperator
+    Symmetric adjacency matrix as a linear operator.
+  num_eigs : int
+    Number of eigenvalues and eigenvectors to calculate.
+  type_lap : str
+    Type of Laplacian.
+    One of `"comb"` (combinatorial) or `"rw"` (random-walk).
+  degs : array
+    The row sums of `adj_op`.
+    Computed from it if not given.
+
+  Returns
+  -------
+  vals : list
+    A length-`num_eigs` list of the first few eigenvalues.
+  vects : matrix
+    A `adj_op.shape[0]` by `num_eigs` matrix
+    of the associated eigenvectors.
+  """
+
+  n = adj_op.shape[0]
+  dtype = adj_op.dtype
+
+  if degs is None:
+    degs = adj_op @ np.ones(n, dtype=dtype)
+
+  degs = np.asarray(degs, dtype=dtype)
+
+  # too many eigs for Lanczos, so form the matrix
+  if num_eigs >= n - 1:
+    adj_mat = adj_op @ np.identity(n, dtype=dtype)
+    return _get_first_eigs(build_laplacian(adj_mat, type_lap, dtype), num_eigs)
+
+  if type_lap == "rw":
+    assert (degs > 0).all()
+    scale = 1 / np.sqrt(degs)
+    sym_op = sparse.linalg.LinearOperator(
+      (n, n), matvec=lambda x: scale * (adj_op @ (scale * np.ravel(x))), dtype=dtype)
+    vals, vects = sparse.linalg.eigsh(sym_op, k=num_eigs, which="LA")
+    vals = 1 - vals
+    vects = scale.reshape((n, 1)) * vects
+    vects = vects / np.linalg.norm(vects, axis=0)
+
+  else:
+    shift = 2 * degs.max()
+    shifted_op = sparse.linalg.LinearOperator(
+      (n, n), matvec=lambda x: (shift - degs) * np.ravel(x) + adj_op @ np.ravel(x),
+      dtype=dtype)
+    vals, vects = sparse.linalg.eigsh(shifted_op, k=num_eigs, which="LA")
+    vals = shift - vals
+
+  ordering = np.argsort(vals)
+
+  # return a list
+  spectrum = {
+    "vects": vects[:, ordering],
+    "vals": vals[ordering]
+  }
+
+  return spectrum
+
+
+def run_motif_embedding(adj_mat, motif_name, # pylint: disable=too-many-arguments,too-many-locals
                         motif_type="struc",
                         mam_weight_type="unweighted",
                         mam_method="sparse",
                         num_eigs=2,
                         type_lap="rw",
                         restrict=True,
-                        gr_method="sparse"):
+                        gr_method="sparse",
+                        *,
+                        reorder=None,
+                        backend=None,
+                        cache=None,
+                        dtype=None,
+                        upper=False):
   """
   Run motif embedding.
 
@@ -202,7 +438,7 @@ def run_motif_embedding(adj_mat, motif_name,
     One of `"unweighted"`, `"mean"` or `"product"`.
   mam_method : str
     The method to use for building the motif adjacency matrix.
-    One of `"sparse"` or `"dense"`.
+    One of `"sparse"`, `"dense"`, `"enumerate"`, `"approx"` or `"auto"`.
   num_eigs : int
     Number of eigenvalues and eigenvectors for the embedding.
   type_lap : str
@@ -214,13 +450,45 @@ def run_motif_embedding(adj_mat, motif_name,
   gr_method : str
     Format to use for getting largest component.
     One of `"sparse"` or `"dense"`.
+  reorder : str
+    If given, the vertices are relabelled for better locality
+    while building the motif adjacency matrix and computing
+    the embedding, as in `build_motif_adjacency_matrix`.
+    All of the results are returned in the original order.
+    One of `"degree"`, `"rcm"` or `"bfs"`.
+  backend : str or backend
+    The backend for the sparse matrix products,
+    as in `build_motif_adjacency_matrix`.
+    One of `"scipy"` or `"graphblas"`.
+  cache : str, MotifAdjacencyCache or EmbeddingCache
+    If given, a persistent cache for the motif adjacency matrix,
+    as in `build_motif_adjacency_matrix`,
+    or a `cache.EmbeddingCache` holding the motif adjacency matrix,
+    Laplacian and spectrum in memory,
+    so that repeated runs on the same graph reuse the stages
+    whose parameters have not changed.
+    Cached arrays are returned read-only.
+  dtype : dtype
+    The precision of the motif adjacency matrix, Laplacian
+    and eigenvectors.
+    One of `np.float32` or `np.float64`,
+    or `None` for the default types.
+    Unweighted motif adjacency matrices hold exact counts,
+    as in `build_motif_adjacency_matrix`.
+  upper : bool
+    Whether to build and return only the upper triangle
+    of the motif adjacency matrix,
+    as in `build_motif_adjacency_matrix`.
+    The embedding then applies the symmetric matrix
+    to vectors from its upper triangle,
+    without forming the full matrix or its Laplacian.
 
   Returns
   -------
   adj_mat : sparse matrix
     The original adjacency matrix.
   motif_adj_mat : sparse matrix
-    The motif adjacency matrix.
+    The motif adjacency matrix, or its upper triangle.
   comps : list
     The indices of the largest connected component
     of the motif adjacency matrix
@@ -254,18 +522,32 @@ def run_motif_embedding(adj_mat, motif_name,
   assert num_eigs == np.floor(num_eigs)
   assert num_eigs >= 1
   assert mam_weight_type in ["unweighted", "mean", "product"]
-  assert mam_method in ["sparse", "dense"]
+  assert mam_method in ["sparse", "dense", "enumerate", "approx", "auto"]
   assert type_lap in ["comb", "rw"]
   assert isinstance(restrict, bool)
   assert gr_method in ["sparse", "dense"]
+  assert reorder in [None, "degree", "rcm", "bfs"]
+  assert isinstance(upper, bool)
 
   if not sparse.issparse(adj_mat):
     adj_mat = sparse.csr_matrix(adj_mat)
 
+  # relabel the vertices for locality
+  order = None if reorder is None else mcut._get_vertex_order(adj_mat, reorder)
+
   # build motif adjacency matrix
-  motif_adj_mat = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name,
-                                                    motif_type, mam_weight_type,
-                                                    mam_method)
+  perm_motif_adj_mat, key = _build_motif_adjacency_matrix_cached(
+    adj_mat if order is None else mcut._permute_matrix(adj_mat, order),
+    motif_name, motif_type, mam_weight_type, mam_method, backend, cache, dtype, upper)
+
+  if reorder is None:
+    motif_adj_mat = perm_motif_adj_mat
+
+  else:
+    motif_adj_mat = mcut._permute_matrix(perm_motif_adj_mat, np.argsort(order))
+
+    if upper:
+      motif_adj_mat = mcut._fold_upper(motif_adj_mat)
 
   if restrict:
 
@@ -277,18 +559,36 @@ def run_motif_embedding(adj_mat, motif_name,
 
     motif_adj_mat_comps = motif_adj_mat[comps, :].tocsc()[:, comps]
     motif_adj_mat_comps = sparse.csr_matrix(motif_adj_mat_comps)
-
-    # Laplace embedding restricted
-    spect = run_laplace_embedding(motif_adj_mat_comps, num_eigs, type_lap)
+    verts = np.array(comps, dtype=int)
 
   else:
     comps = None
     adj_mat_comps = None
     motif_adj_mat_comps = None
+    verts = np.arange(adj_mat.shape[0])
 
-    # Laplace embedding unrestricted
-    spect = run_laplace_embedding(motif_adj_mat, num_eigs, type_lap)
+  # Laplace embedding (restricted)
+  if reorder is None:
+    lap_adj_mat = motif_adj_mat_comps if restrict else motif_adj_mat
+
+  # Laplace embedding in the new order
+  else:
+    perm_verts = np.argsort(np.argsort(order)[verts])
+    lap_adj_mat = mcut._permute_matrix(motif_adj_mat, verts[perm_verts])
+
+  # embed the symmetric matrix from its upper triangle
+  lap_adj_op = _get_symmetric_operator(lap_adj_mat) if upper else lap_adj_mat
+
+  if key is None:
+    spect = run_laplace_embedding(lap_adj_op, num_eigs, type_lap, dtype=dtype)
+
+  else:
+    key += (restrict, gr_method, reorder, type_lap)
+    spect = _run_laplace_embedding_cached(lap_adj_op, num_eigs, type_lap, dtype, cache, key)
 
+  # restore the original order
+  if reorder is not None:
+    spect = {"vals": spect["vals"], "vects": spect["vects"][np.argsort(perm_verts)]}
 
   # return list
   embedding = {
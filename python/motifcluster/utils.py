@@ -8,6 +8,11 @@ import numpy as np
 from numpy import random as rd
 import networkx as nx
 from scipy import sparse
+from scipy.sparse import csgraph
+
+# rows of a masked product are expanded in full when this costs
+# at most this many times the look-ups of their masked entries
+_EXPAND_RATIO = 10
 
 def _a_b_one(a_mat, b_mat):
 
@@ -15,7 +20,7 @@ def _a_b_one(a_mat, b_mat):
   Compute a right-multiplication with the ones matrix.
 
   Compute `a * (b @ one_mat)` where `a`, `b`,
-  `ones_mat` are square matrices of the same size,
+  `ones_mat` are matrices of compatible sizes,
   and `ones_mat` contains all entries equal to one.
   The product `*` is an entry-wise (Hadamard) product,
   while `@` represents matrix multiplication.
@@ -25,12 +30,14 @@ def _a_b_one(a_mat, b_mat):
   Parameters
   ----------
   a, b : matrix
-    Square matrices of the same size.
+    Matrices of compatible sizes,
+    such as square matrices of the same size,
+    or blocks of rows of them.
 
   Returns
   -------
   sparse matrix
-    The sparse square matrix `a * (b @ one_mat)`.
+    The sparse matrix `a * (b @ one_mat)`.
   """
 
   if not sparse.issparse(a_mat):
@@ -39,8 +46,7 @@ def _a_b_one(a_mat, b_mat):
   if not sparse.issparse(b_mat):
     b_mat = sparse.csr_matrix(b_mat)
 
-  n = a_mat.shape[0]
-  ones_vec = np.ones(n)
+  ones_vec = np.ones(b_mat.shape[1], dtype=b_mat.dtype)
   ans = (a_mat.T.multiply(b_mat @ ones_vec)).T
 
   return ans
@@ -52,7 +58,7 @@ def _a_one_b(a_mat, b_mat):
   Compute a left-multiplication with the ones matrix.
 
   Compute `a * (one_mat @ b)` where `a`, `b`,
-  `ones_mat` are square matrices of the same size,
+  `ones_mat` are matrices of compatible sizes,
   and `ones_mat` contains all entries equal to one.
   The product `*` is an entry-wise (Hadamard) product,
   while `@` represents matrix multiplication.
@@ -62,12 +68,14 @@ def _a_one_b(a_mat, b_mat):
   Parameters
   ----------
   a, b : matrix
-    Square matrices of the same size.
+    Matrices of compatible sizes,
+    such as square matrices of the same size,
+    or blocks of rows of them.
 
   Returns
   -------
   sparse matrix
-    The sparse square matrix `a * (one_mat @ b)`.
+    The sparse matrix `a * (one_mat @ b)`.
   """
 
   if not sparse.issparse(a_mat):
@@ -76,13 +84,338 @@ def _a_one_b(a_mat, b_mat):
   if not sparse.issparse(b_mat):
     b_mat = sparse.csr_matrix(b_mat)
 
-  n = a_mat.shape[0]
-  ones_vec = np.ones(n)
+  ones_vec = np.ones(b_mat.shape[0], dtype=b_mat.dtype)
   ans = (a_mat.multiply(ones_vec @ b_mat))
 
   return ans
 
 
+def _masked_product(mask_mat, a_mat, b_mat, max_chunk=2**22):
+
+  """
+  Compute a matrix product restricted to a sparsity mask.
+
+  Compute `mask * (a @ b)` where `mask`, `a` and `b` are
+  matrices of compatible sizes.
+  The product `*` is an entry-wise (Hadamard) product,
+  while `@` represents matrix multiplication.
+  Only the entries of `a @ b` lying on the non-zero pattern of `mask`
+  are evaluated, each as a sparse dot product between a row of `a`
+  and a column of `b`, iterating over whichever of the two is shorter.
+  The cost therefore scales with the number of non-zero entries of
+  `mask` rather than with the number of non-zero entries of `a @ b`.
+  Each look-up is a binary search, however, so rows of `a @ b`
+  whose full expansion is cheap are instead computed by sparse
+  matrix multiplication and then masked.
+  The expansion of a row costs the sum of the degrees of its
+  neighbours, so this applies to rows away from hubs,
+  while rows next to hubs, whose expansion would be large,
+  are left to the look-ups.
+  This keeps the memory used by the expansion proportional to
+  the work of the look-ups it replaces.
+
+  Parameters
+  ----------
+  mask_mat, a_mat, b_mat : matrix
+    Matrices such that `a @ b` has the same size as `mask`.
+  max_chunk : int
+    Maximum number of scalar products to hold in memory at once.
+
+  Returns
+  -------
+  sparse matrix
+    The sparse matrix `mask * (a @ b)`,
+    with the sparsity pattern of `mask`.
+  """
+
+  mask_mat = sparse.csr_matrix(mask_mat, copy=True)
+  mask_mat.sum_duplicates()
+  mask_mat.eliminate_zeros()
+  a_csr = sparse.csr_matrix(a_mat)
+  a_csr.sum_duplicates()
+  b_csr = sparse.csr_matrix(b_mat)
+  b_csr.sum_duplicates()
+  b_csc = b_csr.tocsc()
+  b_csc.sum_duplicates()
+
+  n_rows, n_cols = mask_mat.shape
+  n_inner = a_csr.shape[1]
+  assert a_csr.shape[0] == n_rows
+  assert b_csr.shape == (n_inner, n_cols)
+
+  # positions of the mask entries
+  rows = np.repeat(np.arange(n_rows), np.diff(mask_mat.indptr))
+  cols = mask_mat.indices
+
+  # sorted keys for looking up single entries of a and b
+  a_keys = _csr_keys(a_csr)
+  b_keys = _csr_keys(b_csr)
+
+  # iterate over the shorter of each row of a and column of b
+  a_lens = np.diff(a_csr.indptr)[rows]
+  b_lens = np.diff(b_csc.indptr)[cols]
+  use_a = a_lens <= b_lens
+  vals = np.zeros(len(rows), dtype=np.result_type(mask_mat.dtype, a_csr.dtype, b_csr.dtype))
+
+  # expand the rows whose expansion is cheap compared to their look-ups
+  lookup_costs = np.bincount(rows, weights=np.minimum(a_lens, b_lens), minlength=n_rows)
+  expand_costs = _get_expand_costs(a_csr, b_csr)
+  expand = (expand_costs <= _EXPAND_RATIO * lookup_costs) & (np.diff(mask_mat.indptr) > 0)
+  expand_rows = np.flatnonzero(expand)
+  expanded = expand[rows]
+
+  inds = np.flatnonzero(use_a & ~expanded)
+  vals[inds] = _sparse_dots(a_csr, rows[inds], cols[inds],
+                            b_keys, b_csr.data, n_cols, True, max_chunk)
+
+  inds = np.flatnonzero(~use_a & ~expanded)
+  vals[inds] = _sparse_dots(b_csc, cols[inds], rows[inds],
+                            a_keys, a_csr.data, n_inner, False, max_chunk)
+
+  ans = sparse.csr_matrix((vals * mask_mat.data, mask_mat.indices, mask_mat.indptr),
+                          shape=mask_mat.shape)
+
+  if len(expand_rows) > 0:
+    ans = ans + _expand_rows(mask_mat, a_csr, b_csr, expand_rows,
+                             expand_costs[expand_rows], max_chunk)
+
+  ans.eliminate_zeros()
+
+  return ans
+
+
+def _get_expand_costs(a_mat, b_mat):
+
+  """
+  Get the cost of expanding each row of a sparse matrix product.
+
+  Parameters
+  ----------
+  a_mat, b_mat : sparse matrix
+    Canonical CSR matrices such that `a @ b` is defined.
+
+  Returns
+  -------
+  array
+    The number of scalar products needed for each row of `a @ b`,
+    which bounds the number of its non-zero entries.
+  """
+
+  a_pattern = sparse.csr_matrix((np.ones(a_mat.nnz), a_mat.indices, a_mat.indptr),
+                                shape=a_mat.shape)
+
+  return a_pattern @ np.diff(b_mat.indptr).astype(float)
+
+
+def _expand_rows(mask_mat, a_mat, # pylint: disable=too-many-positional-arguments
+                 b_mat, expand_rows, costs, max_chunk):
+
+  """
+  Compute rows of a masked product by sparse matrix multiplication.
+
+  Parameters
+  ----------
+  mask_mat, a_mat, b_mat : sparse matrix
+    Canonical CSR matrices such that `a @ b` has the same size as `mask`.
+  expand_rows : array
+    The rows to compute.
+  costs : array
+    The cost of expanding each row, from `_get_expand_costs`.
+  max_chunk : int
+    Maximum number of scalar products to hold in memory at once,
+    unless a single row needs more.
+
+  Returns
+  -------
+  sparse matrix
+    The matrix `mask * (a @ b)` restricted to the rows `expand_rows`,
+    and zero elsewhere.
+  """
+
+  cum_costs = np.cumsum(costs)
+  chunks = []
+  first = 0
+
+  while first < len(expand_rows):
+
+    # chunk of rows whose expansion fits in memory
+    offset = cum_costs[first] - costs[first]
+    last = max(np.searchsorted(cum_costs, offset + max_chunk, side="right"), first + 1)
+    chunk_rows = expand_rows[first:last]
+    chunk_mat = sparse.coo_matrix(mask_mat[chunk_rows].multiply(a_mat[chunk_rows] @ b_mat))
+    chunks.append((chunk_mat.data, chunk_rows[chunk_mat.row], chunk_mat.col))
+    first = last
+
+  data, row_inds, col_inds = (np.concatenate(arrays) for arrays in zip(*chunks))
+
+  return sparse.csr_matrix((data, (row_inds, col_inds)), shape=mask_mat.shape)
+
+
+def _csr_keys(some_mat):
+
+  """
+  Get sorted linear keys of a CSR matrix.
+
+  Get the linear index `row * n_cols + col` of each stored entry
+  of a canonical CSR matrix.
+  These are sorted, so single entries can be found by binary search.
+
+  Parameters
+  ----------
+  some_mat : sparse matrix
+    A canonical CSR matrix.
+
+  Returns
+  -------
+  keys : array
+    The linear index of each stored entry.
+  """
+
+  n_rows, n_cols = some_mat.shape
+  rows = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(some_mat.indptr))
+  keys = rows * n_cols + some_mat.indices
+
+  return keys
+
+
+def _sparse_dots(seg_mat, segs, # pylint: disable=too-many-positional-arguments
+                 others, keys, data, n_cols, seg_is_row, max_chunk):
+
+  """
+  Compute sparse dot products by expansion and binary search.
+
+  For each pair (`segs[e]`, `others[e]`), expand the compressed
+  segment `segs[e]` of `seg_mat` and look up the matching entries
+  in the other factor, given by its sorted linear `keys` and `data`.
+
+  Parameters
+  ----------
+  seg_mat : sparse matrix
+    The compressed (CSR or CSC) factor to expand.
+  segs : array
+    The segments of `seg_mat` to expand.
+  others : array
+    The rows or columns of the other factor to look up.
+  keys, data : array
+    Sorted linear keys and values of the other factor in CSR form.
+  n_cols : int
+    Number of columns of the other factor.
+  seg_is_row : bool
+    Whether `seg_mat` is the left factor, so that the segments
+    index its rows and `others` index columns of the right factor.
+  max_chunk : int
+    Maximum number of scalar products to hold in memory at once.
+
+  Returns
+  -------
+  vals : array
+    The dot product for each pair.
+  """
+
+  vals = np.zeros(len(segs))
+
+  if len(keys) == 0:
+    return vals
+
+  starts = seg_mat.indptr[segs]
+  lens = seg_mat.indptr[segs + 1] - starts
+  cum_lens = np.cumsum(lens)
+  first = 0
+
+  while first < len(segs):
+
+    # chunk of pairs whose expansion fits in memory
+    offset = cum_lens[first] - lens[first]
+    last = max(np.searchsorted(cum_lens, offset + max_chunk, side="right"), first + 1)
+    chunk_lens = lens[first:last]
+
+    # expand the segments
+    pairs, pos = _segment_positions(starts[first:last], chunk_lens)
+    inner = seg_mat.indices[pos].astype(np.int64)
+
+    # look up matching entries of the other factor
+    if seg_is_row:
+      query = inner * n_cols + np.repeat(others[first:last], chunk_lens)
+    else:
+      query = np.repeat(others[first:last].astype(np.int64), chunk_lens) * n_cols + inner
+
+    found = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+    prods = np.where(keys[found] == query, seg_mat.data[pos] * data[found], 0)
+    vals[first:last] = np.bincount(pairs, weights=prods, minlength=last - first)
+    first = last
+
+  return vals
+
+
+def _segment_positions(starts, lens):
+
+  """
+  Expand segments of a compressed array into positions.
+
+  Parameters
+  ----------
+  starts : array
+    The first position of each segment.
+  lens : array
+    The length of each segment.
+
+  Returns
+  -------
+  segs : array
+    The index of the segment containing each position.
+  pos : array
+    The positions in all of the segments, in order.
+  """
+
+  total = lens.sum()
+  segs = np.repeat(np.arange(len(lens)), lens)
+  pos = np.arange(total) - np.repeat(np.cumsum(lens) - lens, lens)
+  pos += np.repeat(starts, lens)
+
+  return segs, pos
+
+
+def _lookup(some_mat, rows, cols, keys=None):
+
+  """
+  Look up entries of a sparse matrix.
+
+  Parameters
+  ----------
+  some_mat : matrix
+    The matrix in which to look up entries.
+  rows, cols : array
+    The row and column indices of the entries.
+  keys : array
+    The linear keys of `some_mat` from `_csr_keys`,
+    if it is already in canonical CSR form,
+    so that repeated lookups need not recompute them.
+
+  Returns
+  -------
+  vals : array
+    The entries `some_mat[rows[e], cols[e]]`,
+    which are zero where no entry is stored.
+  """
+
+  if keys is None:
+    some_mat = sparse.csr_matrix(some_mat, copy=True)
+    some_mat.sum_duplicates()
+    keys = _csr_keys(some_mat)
+
+  query = np.asarray(rows, dtype=np.int64) * some_mat.shape[1] + cols
+  vals = np.zeros(len(query), dtype=some_mat.dtype)
+
+  if len(keys) == 0:
+    return vals
+
+  found = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+  hits = keys[found] == query
+  vals[hits] = some_mat.data[found[hits]]
+
+  return vals
+
+
 def _drop0_killdiag(some_mat):
 
   """
@@ -115,6 +448,69 @@ def _drop0_killdiag(some_mat):
   return ans
 
 
+def _has_self_loops(adj_mat):
+
+  """
+  Check whether a graph has any self-loops.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    Adjacency matrix of the graph.
+
+  Returns
+  -------
+  bool
+    Whether any diagonal entry of `adj_mat` is non-zero.
+  """
+
+  if not sparse.issparse(adj_mat):
+    adj_mat = np.asarray(adj_mat)
+
+  return bool(np.any(adj_mat.diagonal() != 0))
+
+
+def _get_mam_dtype(dtype, mam_weight_type, mam_method):
+
+  """
+  Get the data type in which to build a motif adjacency matrix.
+
+  Unweighted motif adjacency matrices count motif instances,
+  so unless they are estimated by sampling, they are built exactly
+  in the signed integer type of the same size as the requested
+  floating type.
+
+  Parameters
+  ----------
+  dtype : dtype
+    The requested precision.
+    One of `np.float32` or `np.float64`,
+    or `None` to use the default types.
+  mam_weight_type : str
+    The weighting scheme to use.
+    One of `"unweighted"`, `"mean"` or `"product"`.
+  mam_method : str
+    The method used to build the motif adjacency matrix.
+
+  Returns
+  -------
+  dtype
+    The data type of the indicator matrices and the
+    motif adjacency matrix, or `None` for the default types.
+  """
+
+  if dtype is None:
+    return None
+
+  dtype = np.dtype(dtype)
+  assert dtype in [np.float32, np.float64]
+
+  if mam_weight_type == "unweighted" and mam_method != "approx":
+    return np.dtype(f"int{8 * dtype.itemsize}")
+
+  return dtype
+
+
 def get_largest_component(adj_mat, gr_method):
 
   """
@@ -164,6 +560,119 @@ def get_largest_component(adj_mat, gr_method):
   return verts_to_keep
 
 
+def _get_vertex_order(adj_mat, reorder):
+
+  """
+  Get an ordering of the vertices of a graph with good locality.
+
+  Relabelling the vertices so that neighbours have nearby labels
+  makes the sparse matrix products and matrix-vector products
+  on the graph access memory in a more cache-friendly order.
+
+  - The ordering method can be one of:
+
+    - Degree: vertices by decreasing degree,
+      so that the rows of hubs are stored together.
+    - RCM: the reverse Cuthill-McKee ordering,
+      which reduces the bandwidth of the adjacency matrix.
+    - BFS: a breadth-first search of each connected component,
+      starting from its vertex of highest degree.
+
+  Parameters
+  ----------
+  adj_mat : matrix
+    An adjacency matrix of a graph.
+    The directions and weights of its edges are ignored.
+  reorder : str
+    The ordering method to use.
+    One of `"degree"`, `"rcm"` or `"bfs"`.
+
+  Returns
+  -------
+  order : array
+    The vertices in their new order,
+    so that new vertex `i` is old vertex `order[i]`.
+  """
+
+  assert reorder in ["degree", "rcm", "bfs"]
+
+  adj_mat = sparse.csr_matrix(adj_mat)
+  und_mat = sparse.csr_matrix(((adj_mat + adj_mat.transpose()) != 0).astype(float))
+  n = und_mat.shape[0]
+  degs = np.diff(und_mat.indptr)
+
+  if reorder == "degree":
+    return np.argsort(-degs, kind="stable")
+
+  if reorder == "rcm":
+    return csgraph.reverse_cuthill_mckee(und_mat, symmetric_mode=True).astype(np.int64)
+
+  # one search from an extra vertex joined to the root of each component
+  _, labels = csgraph.connected_components(und_mat, directed=False)
+  by_comp = np.lexsort((-degs, labels))
+  roots = by_comp[np.r_[True, labels[by_comp][1:] != labels[by_comp][:-1]]]
+  root_mat = sparse.csr_matrix((np.ones(len(roots)), (np.zeros(len(roots), dtype=np.int64), roots)),
+                               shape=(1, n + 1))
+  ext_mat = sparse.vstack([sparse.hstack([und_mat, sparse.csr_matrix((n, 1))]), root_mat],
+                          format="csr")
+  order = csgraph.breadth_first_order(ext_mat, n, return_predecessors=False)[1:]
+
+  return order.astype(np.int64)
+
+
+def _permute_matrix(some_mat, order):
+
+  """
+  Permute the rows and columns of a square matrix.
+
+  Parameters
+  ----------
+  some_mat : matrix
+    The matrix to permute.
+  order : array
+    The rows and columns in their new order.
+    This can also be a subset of them,
+    to take a principal submatrix.
+
+  Returns
+  -------
+  matrix
+    The matrix `some_mat[order, :][:, order]`,
+    as a CSR matrix if `some_mat` is sparse.
+  """
+
+  if sparse.issparse(some_mat):
+    return sparse.csr_matrix(sparse.csr_matrix(some_mat)[order, :].tocsc()[:, order])
+
+  return np.asarray(some_mat)[np.ix_(order, order)]
+
+
+def _fold_upper(some_mat):
+
+  """
+  Fold a matrix holding half of a symmetric matrix into its upper triangle.
+
+  Parameters
+  ----------
+  some_mat : sparse matrix
+    A matrix holding each entry of a symmetric matrix
+    on or above the diagonal at either its own position
+    or its transposed position, and zeros elsewhere,
+    such as a permuted upper triangle.
+
+  Returns
+  -------
+  sparse matrix
+    The upper triangle of the symmetric matrix in CSR form.
+  """
+
+  some_coo = sparse.coo_matrix(some_mat)
+  rows = np.minimum(some_coo.row, some_coo.col)
+  cols = np.maximum(some_coo.row, some_coo.col)
+
+  return sparse.csr_matrix((some_coo.data, (rows, cols)), shape=some_coo.shape)
+
+
 def get_motif_names():
 
   """
@@ -20,4 +20,7 @@ setuptools.setup(
     "scipy>=1.4.1",
     "scikit-learn>=0.22.2"
   ],
+  extras_require={
+    "graphblas": ["python-graphblas>=2023.1.0"]
+  },
 )
@@ -0,0 +1,85 @@
+from motifcluster import backends as mcbe
+from motifcluster import indicators as mcin
+from motifcluster import motifadjacency as mcmo
+from motifcluster import sampling as mcsa
+from motifcluster import utils as mcut
+
+import numpy as np
+import pytest
+
+
+class CountingBackend(mcbe.ScipyBackend):
+
+  name = "counting"
+
+  def __init__(self):
+    self.n_calls = 0
+
+  def masked_product(self, mask_mat, a_mat, b_mat):
+    self.n_calls += 1
+    return super().masked_product(mask_mat, a_mat, b_mat)
+
+
+def test_get_backend():
+
+  assert isinstance(mcbe._get_backend("scipy"), mcbe.ScipyBackend)
+
+  backend = CountingBackend()
+
+  assert mcbe._get_backend(backend) is backend
+
+  with pytest.raises(AssertionError):
+    mcbe._get_backend("cusparse")
+
+
+def test_as_bundle_backend():
+
+  adj_mat = mcsa.demonstration_graph()["adj_mat_sparse"]
+  bundle = mcin.IndicatorBundle(adj_mat, "sparse")
+
+  assert bundle.backend.name == "scipy"
+  assert mcin._as_bundle(bundle, "sparse") is bundle
+  assert mcin._as_bundle(bundle, "sparse", "scipy") is bundle
+
+  backend = CountingBackend()
+  other_bundle = mcin._as_bundle(bundle, "sparse", backend)
+
+  assert other_bundle is not bundle
+  assert other_bundle.backend is backend
+  assert mcin._as_bundle(other_bundle) is other_bundle
+
+  # dense bundles always use numpy
+  assert mcin.IndicatorBundle(adj_mat, "dense", backend).backend.name == "scipy"
+
+
+def test_build_motif_adjacency_matrix_backend():
+
+  adj_mat = mcsa.demonstration_graph()["adj_mat_sparse"]
+  backend = CountingBackend()
+
+  for motif_name in mcut.get_motif_names():
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        mam_backend = mcmo.build_motif_adjacency_matrix(
+          adj_mat, motif_name, motif_type, mam_weight_type, backend=backend)
+        mam = mcmo.build_motif_adjacency_matrix(
+          adj_mat, motif_name, motif_type, mam_weight_type)
+
+        assert np.allclose(mam_backend.toarray(), mam.toarray())
+
+  assert backend.n_calls > 0
+
+
+def test_graphblas_backend():
+
+  pytest.importorskip("graphblas")
+
+  adj_mat = mcsa.demonstration_graph()["adj_mat_sparse"]
+  mams_graphblas = mcmo.build_motif_adjacency_matrices(adj_mat, motif_type="func",
+                                                       mam_weight_type="mean",
+                                                       backend="graphblas")
+  mams = mcmo.build_motif_adjacency_matrices(adj_mat, motif_type="func",
+                                             mam_weight_type="mean")
+
+  for motif_name, mam in mams.items():
+    assert np.allclose(mams_graphblas[motif_name].toarray(), mam.toarray())
@@ -0,0 +1,255 @@
+from motifcluster import cache as mcca
+from motifcluster import clustering as mccl
+from motifcluster import indicators as mcin
+from motifcluster import motifadjacency as mcmo
+from motifcluster import spectral as mcsp
+from motifcluster import utils as mcut
+
+import os
+import numpy as np
+from scipy import sparse
+
+
+def test_fingerprint():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.2, "poisson", 3))
+  fingerprint = mcca._fingerprint(adj_mat)
+
+  # independent of format
+  assert mcca._fingerprint(adj_mat.toarray()) == fingerprint
+  assert mcca._fingerprint(adj_mat.tocoo()) == fingerprint
+  assert mcca._fingerprint(mcin.IndicatorBundle(adj_mat)) == fingerprint
+
+  # sensitive to entries and shape
+  changed_mat = adj_mat.copy()
+  changed_mat.data[0] += 1
+  assert mcca._fingerprint(changed_mat) != fingerprint
+
+  padded_mat = sparse.csr_matrix((adj_mat.data, adj_mat.indices, np.append(adj_mat.indptr,
+                                  adj_mat.nnz)), shape=(31, 30))
+  assert mcca._fingerprint(padded_mat) != fingerprint
+
+
+def test_build_motif_adjacency_matrix_cache(tmp_path):
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(40, 40, 0.15, "poisson", 3))
+  adj_mat.setdiag(0)
+  adj_mat.eliminate_zeros()
+  cache = mcca.MotifAdjacencyCache(str(tmp_path))
+  ans = mcmo.build_motif_adjacency_matrix(adj_mat, "M1", "func", "mean")
+
+  for mam_method in ["sparse", "dense", "enumerate"]:
+    mam = mcmo.build_motif_adjacency_matrix(adj_mat, "M1", "func", "mean", mam_method,
+                                            cache=cache)
+    assert np.allclose(mam.toarray(), ans.toarray())
+
+  # dense and sparse share an entry, enumeration has its own
+  assert len(os.listdir(str(tmp_path))) == 2
+
+  key = cache.get_key(adj_mat, "M1", "func", "mean", "sparse")
+  assert not cache.get(key).data.flags.writeable
+
+  # repeat runs load from the cache
+  mam = mcmo.build_motif_adjacency_matrix(adj_mat, "M1", "func", "mean", cache=str(tmp_path))
+  assert not mam.data.flags.writeable
+  assert np.allclose(mam.toarray(), ans.toarray())
+  assert len(os.listdir(str(tmp_path))) == 2
+
+  # other settings are keyed separately
+  mam = mcmo.build_motif_adjacency_matrix(adj_mat, "M1", "struc", "mean", cache=cache)
+  assert np.allclose(mam.toarray(),
+                     mcmo.build_motif_adjacency_matrix(adj_mat, "M1", "struc", "mean").toarray())
+
+  # approximations are not cached
+  n_entries = len(os.listdir(str(tmp_path)))
+  mcmo.build_motif_adjacency_matrix(adj_mat, "M1", mam_method="approx", cache=cache)
+  assert len(os.listdir(str(tmp_path))) == n_entries
+
+  cache.clear()
+  assert not os.listdir(str(tmp_path))
+
+
+def test_get_mam_key_self_loops():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(20, 20, 0.3))
+  adj_mat.setdiag(0)
+  adj_mat.eliminate_zeros()
+  sparse_key = mcca._get_mam_key(adj_mat, "Mcoll", "struc", "mean", "sparse")
+
+  # without self-loops the formulations give the same matrices and share a key
+  for mam_method in ["dense", "enumerate", "auto"]:
+    assert mcca._get_mam_key(adj_mat, "Mcoll", "struc", "mean", mam_method) == sparse_key
+
+  # with self-loops the dense formulation differs, so is keyed separately
+  adj_mat.setdiag(1)
+  sparse_key = mcca._get_mam_key(adj_mat, "Mcoll", "struc", "mean", "sparse")
+  dense_key = mcca._get_mam_key(adj_mat, "Mcoll", "struc", "mean", "dense")
+  assert dense_key != sparse_key
+  assert mcca._get_mam_key(adj_mat, "Mcoll", "struc", "mean", "auto") == sparse_key
+  assert mcca._get_mam_key(mcin.IndicatorBundle(adj_mat), "Mcoll", "struc", "mean",
+                           "dense") == dense_key
+
+  cache = mcca.EmbeddingCache()
+  sparse_mam = mcmo.build_motif_adjacency_matrix(adj_mat, "Mcoll", "struc", "mean",
+                                                 "sparse", cache=cache)
+  dense_mam = mcmo.build_motif_adjacency_matrix(adj_mat, "Mcoll", "struc", "mean",
+                                                "dense", cache=cache)
+  assert len(cache.mams) == 2
+  assert not np.allclose(dense_mam.toarray(), sparse_mam.toarray())
+  assert np.allclose(dense_mam.toarray(), mcmo.build_motif_adjacency_matrix(
+    adj_mat, "Mcoll", "struc", "mean", "dense").toarray())
+  assert np.allclose(sparse_mam.toarray(), mcmo.build_motif_adjacency_matrix(
+    adj_mat, "Mcoll", "struc", "mean", "sparse").toarray())
+
+
+def test_cache_eviction(tmp_path):
+
+  adj_mats = [sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.2))
+              for _ in range(3)]
+  cache = mcca.MotifAdjacencyCache(str(tmp_path))
+  keys = []
+
+  for adj_mat in adj_mats:
+    keys.append(cache.get_key(adj_mat, "M1", "struc", "unweighted", "sparse"))
+    cache.put(keys[-1], mcmo.build_motif_adjacency_matrix(adj_mat, "M1"))
+    os.utime(os.path.join(str(tmp_path), keys[-1]), (len(keys), len(keys)))
+
+  sizes = [mcca._get_size(os.path.join(str(tmp_path), key)) for key in keys]
+
+  # reading an entry marks it as recently used
+  assert cache.get(keys[0]) is not None
+
+  # evict the least recently used entry
+  small_cache = mcca.MotifAdjacencyCache(str(tmp_path), max_bytes=sum(sizes) - 1)
+  small_cache._evict()
+  assert small_cache.get(keys[0]) is not None
+  assert small_cache.get(keys[1]) is None
+  assert small_cache.get(keys[2]) is not None
+
+  # matrices larger than the cache are returned uncached
+  tiny_cache = mcca.MotifAdjacencyCache(str(tmp_path), max_bytes=0)
+  mam = mcmo.build_motif_adjacency_matrix(adj_mats[1], "M1", cache=tiny_cache)
+  assert mam.data.flags.writeable
+  assert tiny_cache.get(keys[1]) is None
+
+
+def test_run_motif_clustering_cache(tmp_path):
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(40, 40, 0.2))
+  ans = mccl.run_motif_clustering(adj_mat, "M1", type_lap="comb")
+  cached_ans = mccl.run_motif_clustering(adj_mat, "M1", type_lap="comb", cache=str(tmp_path))
+
+  assert len(os.listdir(str(tmp_path))) == 1
+  assert np.allclose(cached_ans["motif_adj_mat"].toarray(), ans["motif_adj_mat"].toarray())
+  assert np.allclose(cached_ans["vals"], ans["vals"])
+
+
+def test_memory_cache():
+
+  cache = mcca.MemoryCache(max_bytes=3 * 800)
+  arrays = [np.ones(100) * i for i in range(4)]
+
+  for i in range(3):
+    assert cache.put(i, arrays[i]) is arrays[i]
+
+  assert not arrays[0].flags.writeable
+  assert cache.n_bytes == 3 * 800
+
+  # evict the least recently used value
+  assert cache.get(0) is arrays[0]
+  cache.put(3, arrays[3])
+  assert len(cache) == 3
+  assert cache.get(1) is None
+  assert cache.get(0) is arrays[0]
+
+  # values larger than the cache are not cached
+  big_array = np.ones(1000)
+  assert cache.put(4, big_array) is big_array
+  assert cache.get(4) is None
+  assert big_array.flags.writeable
+
+  assert mcca._get_nbytes({"a": sparse.csr_matrix(np.eye(3)), "b": (np.ones(2), None)}) \
+    == 3 * 8 + 3 * 4 + 4 * 4 + 2 * 8
+
+  cache.clear()
+  assert len(cache) == 0
+  assert cache.n_bytes == 0
+
+
+def test_run_motif_clustering_embedding_cache(tmp_path, monkeypatch):
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(40, 40, 0.2))
+  cache = mcca.EmbeddingCache(disk=str(tmp_path))
+  ans = mccl.run_motif_clustering(adj_mat, "M1", type_lap="comb", num_eigs=3)
+
+  calls = {"mam": 0, "lap": 0, "eigs": 0}
+
+  def count(name, func):
+    def counted(*args, **kwargs):
+      calls[name] += 1
+      return func(*args, **kwargs)
+    return counted
+
+  monkeypatch.setattr(mcmo, "mam_M1", count("mam", mcmo.mam_M1))
+  monkeypatch.setattr(mcsp, "build_laplacian", count("lap", mcsp.build_laplacian))
+  monkeypatch.setattr(mcsp, "_get_first_eigs", count("eigs", mcsp._get_first_eigs))
+
+  cached_ans = mccl.run_motif_clustering(adj_mat, "M1", type_lap="comb", num_eigs=3,
+                                         cache=cache)
+  assert calls == {"mam": 1, "lap": 1, "eigs": 1}
+  assert np.allclose(cached_ans["motif_adj_mat"].toarray(), ans["motif_adj_mat"].toarray())
+  assert np.allclose(cached_ans["vals"], ans["vals"])
+  assert len(os.listdir(str(tmp_path))) == 1
+
+  # changing the number of clusters reuses the spectrum
+  mccl.run_motif_clustering(adj_mat.copy(), "M1", type_lap="comb", num_eigs=3,
+                            num_clusts=3, cache=cache)
+  assert calls == {"mam": 1, "lap": 1, "eigs": 1}
+
+  # changing the number of eigenvectors reuses the Laplacian
+  mccl.run_motif_clustering(adj_mat, "M1", type_lap="comb", num_eigs=2, cache=cache)
+  assert calls == {"mam": 1, "lap": 1, "eigs": 2}
+
+  # changing the Laplacian reuses the motif adjacency matrix
+  mccl.run_motif_clustering(adj_mat, "M1", type_lap="rw", num_eigs=2, cache=cache)
+  assert calls == {"mam": 1, "lap": 2, "eigs": 3}
+
+  # reordering gives the same results
+  reordered_ans = mccl.run_motif_clustering(adj_mat, "M1", type_lap="comb", num_eigs=3,
+                                            reorder="rcm", cache=cache)
+  assert np.allclose(reordered_ans["vals"], ans["vals"])
+  assert np.allclose(np.abs(reordered_ans["vects"]), np.abs(ans["vects"]))
+
+  # upper triangles are keyed separately, and only their spectra are cached
+  sizes = (len(cache.mams), len(cache.laplacians), len(cache.spectra))
+  upper_ans = mccl.run_motif_clustering(adj_mat, "M1", type_lap="comb", num_eigs=3,
+                                        cache=cache, upper=True)
+  assert (len(cache.mams), len(cache.laplacians), len(cache.spectra)) \
+    == (sizes[0] + 1, sizes[1], sizes[2] + 1)
+  assert np.allclose(upper_ans["motif_adj_mat"].toarray(),
+                     np.triu(ans["motif_adj_mat"].toarray()))
+  assert np.allclose(upper_ans["vals"], ans["vals"])
+
+  assert mccl.run_motif_clustering(adj_mat, "M1", type_lap="comb", num_eigs=3, num_clusts=3,
+                                   cache=cache, upper=True)["vals"] is upper_ans["vals"]
+
+  # a changed graph is keyed separately
+  changed_mat = adj_mat.copy()
+  changed_mat.data[0] += 1
+  mccl.run_motif_clustering(changed_mat, "M1", type_lap="comb", num_eigs=3, cache=cache)
+  assert calls["mam"] == 3
+
+
+def test_run_motif_clustering_embedding_cache_unsorted():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(40, 40, 0.2))
+
+  # these motif adjacency matrices come back with unsorted indices
+  for motif_name in ["M8", "Mcoll"]:
+    ans = mccl.run_motif_clustering(adj_mat, motif_name, "func", "mean", num_clusts=2)
+    cached_ans = mccl.run_motif_clustering(adj_mat, motif_name, "func", "mean",
+                                           num_clusts=2, cache=mcca.EmbeddingCache())
+    assert cached_ans["motif_adj_mat"].has_sorted_indices
+    assert not cached_ans["motif_adj_mat"].data.flags.writeable
+    assert np.allclose(cached_ans["motif_adj_mat"].toarray(), ans["motif_adj_mat"].toarray())
+    assert np.allclose(cached_ans["vals"], ans["vals"])
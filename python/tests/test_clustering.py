@@ -79,3 +79,35 @@ def test_run_motif_clustering():
           ari_score = adjusted_rand_score(clusts, ans_clusts)
 
           assert ari_score == 1
+
+
+def test_run_motif_clustering_reorder():
+
+  rd.seed(3957)
+  random.seed(3957)
+
+  n = 50
+  block_sizes = 3 * [n]
+
+  connection_matrix = np.array([
+    0.9, 0.4, 0.4,
+    0.4, 0.9, 0.4,
+    0.4, 0.4, 0.9
+  ]).reshape((3, 3))
+
+  # shuffle the vertices of a sampled graph
+  adj_mat = mcsa.sample_dsbm(block_sizes, connection_matrix)
+  shuffle = rd.permutation(3 * n)
+  adj_mat = adj_mat[shuffle, :][:, shuffle]
+
+  for reorder in ["degree", "rcm", "bfs"]:
+    motif_clust_list = mccl.run_motif_clustering(adj_mat, "M1", "func", "unweighted",
+                                                 "sparse", 3, "rw", 3, reorder=reorder)
+
+    clusts = motif_clust_list["clusts"]
+    comps = motif_clust_list["comps"]
+
+    # answers in the shuffled order
+    ans_clusts = np.take(np.repeat([0, 1, 2], n)[shuffle], comps)
+
+    assert adjusted_rand_score(clusts, ans_clusts) == 1
@@ -0,0 +1,169 @@
+from motifcluster import enumeration as mcen
+from motifcluster import motifadjacency as mcmo
+from motifcluster import sampling as mcsa
+from motifcluster import utils as mcut
+
+import itertools
+import networkx as nx
+import numpy as np
+from scipy import sparse
+
+def test_list_triangles():
+
+  adj_mat = mcut._random_sparse_matrix(50, 50, 0.2)
+  adj_mat = sparse.csr_matrix(adj_mat)
+  verts = mcen._list_triangles(adj_mat, max_chunk=7)
+
+  # compare with networkx
+  gr = nx.from_scipy_sparse_array(adj_mat + adj_mat.T)
+  gr.remove_edges_from(nx.selfloop_edges(gr))
+  ans = sorted(tuple(sorted(c)) for c in nx.enumerate_all_cliques(gr) if len(c) == 3)
+
+  assert sorted(tuple(sorted(v)) for v in verts) == ans
+
+
+def test_mam_enumerate():
+
+  adj_mat_dense = mcsa.demonstration_graph()["adj_mat_dense"]
+  adj_mat_random = sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.3, "poisson", 3))
+  adj_mat_random.setdiag(0)
+  adj_mat_random.eliminate_zeros()
+  motifs = ["M" + str(i) for i in range(1, 8)]
+
+  for adj_mat in [adj_mat_dense, adj_mat_random]:
+    for motif_name in motifs:
+      for motif_type in ["func", "struc"]:
+        for mam_weight_type in ["unweighted", "mean", "product"]:
+          mam_enumerate = mcmo.build_motif_adjacency_matrix(
+            adj_mat, motif_name, motif_type, mam_weight_type, "enumerate")
+          mam_sparse = mcmo.build_motif_adjacency_matrix(
+            adj_mat, motif_name, motif_type, mam_weight_type, "sparse")
+
+          assert np.allclose(mam_enumerate.toarray(), mam_sparse.toarray())
+
+  # other motifs use the sparse formulation
+  mam_enumerate = mcmo.build_motif_adjacency_matrix(adj_mat_dense, "M8", "func",
+                                                    "mean", "enumerate")
+  mam_sparse = mcmo.build_motif_adjacency_matrix(adj_mat_dense, "M8", "func",
+                                                 "mean", "sparse")
+
+  assert np.allclose(mam_enumerate.toarray(), mam_sparse.toarray())
+
+
+def test_get_instance_table():
+
+  # a directed 3-cycle with one double edge
+  pattern = 1 + 2 + 8 + 16
+
+  assert mcen._get_instance_table("M1", "func")[pattern] == [[0, 3, 4]]
+  assert mcen._get_instance_table("M2", "struc")[pattern] == [[0, 1, 3, 4]]
+  assert mcen._get_instance_table("M1", "struc")[pattern] == []
+
+
+def test_iter_open_wedges():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(40, 40, 0.1))
+  und_mat = sparse.csr_matrix(((adj_mat + adj_mat.T) > 0).astype(float))
+  und_mat.setdiag(0)
+  und_mat.eliminate_zeros()
+  und_mat.sort_indices()
+  verts = np.concatenate([verts for verts, _ in mcen._iter_open_wedges(und_mat, max_chunk=7)])
+
+  # compare with all pairs of neighbours
+  und_dense = und_mat.toarray()
+  ans = sorted((c, u, w) for c in range(40) for u in range(40) for w in range(u + 1, 40)
+               if und_dense[c, u] and und_dense[c, w] and not und_dense[u, w])
+
+  assert sorted(tuple(v) for v in verts) == ans
+
+
+def test_enumerate_motif_instances():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.2, "poisson", 3))
+  adj_mat.setdiag(0)
+  adj_mat.eliminate_zeros()
+
+  for motif_name in mcut.get_motif_names():
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        batches = list(mcmo.enumerate_motif_instances(adj_mat, motif_name, motif_type,
+                                                      mam_weight_type, batch_size=5))
+        assert all(len(weights) <= 5 for _, weights in batches)
+
+        # rebuild the motif adjacency matrix from the instances
+        anchors = mcen._MOTIF_ANCHORS.get(motif_name)
+        mam = np.zeros((30, 30))
+
+        for verts, weights in batches:
+          for i, j in [anchors] if anchors else mcen._LOCAL_PAIRS[verts.shape[1]]:
+            np.add.at(mam, (verts[:, i], verts[:, j]), weights)
+            np.add.at(mam, (verts[:, j], verts[:, i]), weights)
+
+        ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, motif_type,
+                                                mam_weight_type)
+
+        assert np.allclose(mam, ans.toarray())
+
+  # vertices in the order of the motif
+  adj_mat = sparse.csr_matrix(([1, 2, 3], ([2, 2, 1], [0, 1, 1])), shape=(3, 3))
+  verts, weights = next(mcmo.enumerate_motif_instances(adj_mat, "M8", "func", "product"))
+  assert verts.tolist() == [[2, 0, 1]]
+  assert weights.tolist() == [2]
+
+
+def test_motif_edge_participation():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(12, 12, 0.3, "poisson", 3))
+  adj_mat.setdiag(1)
+  dense_mat = adj_mat.toarray()
+  rows = np.repeat(np.arange(12), np.diff(adj_mat.indptr))
+
+  for motif_name in mcut.get_motif_names():
+    motif_edges = mcen._ALL_MOTIF_EDGES[motif_name]
+    n_verts = 2 if motif_name in ["Ms", "Md"] else 3
+
+    for motif_type in ["func", "struc"]:
+
+      # instances found by brute force
+      ans_counts = {}
+      ans_weights = {}
+
+      for verts in itertools.combinations(range(12), n_verts):
+        present = {(i, j) for i in verts for j in verts if i != j and dense_mat[i, j] != 0}
+        instances = {frozenset((perm[u], perm[v]) for u, v in motif_edges)
+                     for perm in itertools.permutations(verts)}
+
+        for instance in instances:
+          if instance <= present and (motif_type == "func" or instance == present):
+            weight = np.prod([dense_mat[edge] for edge in instance])
+
+            for edge in instance:
+              ans_counts[edge] = ans_counts.get(edge, 0) + 1
+              ans_weights[edge] = ans_weights.get(edge, 0) + weight
+
+      counts = mcmo.motif_edge_participation(adj_mat, motif_name, motif_type,
+                                             batch_size=5)
+      weights = mcmo.motif_edge_participation(adj_mat, motif_name, motif_type, "product")
+
+      edges = list(zip(rows, adj_mat.indices))
+
+      assert counts.dtype == np.int64
+      assert np.array_equal(counts, [ans_counts.get(edge, 0) for edge in edges])
+      assert np.allclose(weights, [ans_weights.get(edge, 0) for edge in edges])
+
+  # aligned with unsorted indices, which are left unsorted
+  unsorted_mat = adj_mat.copy()
+
+  for i in range(12):
+    row = slice(unsorted_mat.indptr[i], unsorted_mat.indptr[i + 1])
+    unsorted_mat.indices[row] = unsorted_mat.indices[row][::-1]
+    unsorted_mat.data[row] = unsorted_mat.data[row][::-1]
+
+  unsorted_mat.has_sorted_indices = False
+  indices = unsorted_mat.indices.copy()
+  counts = mcmo.motif_edge_participation(unsorted_mat, "M9", "func")
+
+  assert np.array_equal(unsorted_mat.indices, indices)
+  assert np.array_equal(sparse.csr_matrix((counts, indices, unsorted_mat.indptr)).toarray(),
+                        sparse.csr_matrix((mcmo.motif_edge_participation(adj_mat, "M9", "func"),
+                                           adj_mat.indices, adj_mat.indptr)).toarray())
@@ -0,0 +1,171 @@
+from motifcluster import incremental as mcic
+from motifcluster import motifadjacency as mcmo
+from motifcluster import utils as mcut
+
+import numpy as np
+from scipy import sparse
+
+def test_motif_adjacency_state():
+
+  rng = np.random.default_rng(4)
+
+  for motif_name in mcut.get_motif_names():
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(20, 20, 0.2, "poisson", 3))
+        state = mcic.MotifAdjacencyState(adj_mat, motif_name, motif_type, mam_weight_type)
+
+        # insertions, deletions and weight changes
+        for _ in range(3):
+          rows = rng.integers(0, 20, 25)
+          cols = rng.integers(0, 20, 25)
+          keep = rows != cols
+          weights = rng.integers(0, 4, 25)
+          state.update(rows[keep], cols[keep], weights[keep])
+
+          ans = mcmo.build_motif_adjacency_matrix(state.adj_mat, motif_name,
+                                                  motif_type, mam_weight_type)
+
+          assert np.allclose(state.motif_adj_mat.toarray(), ans.toarray())
+
+
+def test_motif_adjacency_state_pattern():
+
+  rng = np.random.default_rng(7)
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(100, 100, 0.1, "poisson", 3)) * 0.1
+
+  for mam_weight_type in ["mean", "product"]:
+    state = mcic.MotifAdjacencyState(adj_mat, "M1", "func", mam_weight_type)
+
+    # weighted insertions and deletions, merged only at the end
+    for _ in range(10):
+      rows = rng.integers(0, 100, 200)
+      cols = rng.integers(0, 100, 200)
+      keep = rows != cols
+      weights = rng.integers(0, 3, 200) * rng.random(200)
+      state.update(rows[keep], cols[keep], weights[keep])
+
+    ans = mcmo.build_motif_adjacency_matrix(state.adj_mat, "M1", "func", mam_weight_type)
+    motif_adj_mat = state.motif_adj_mat
+    motif_adj_mat.sort_indices()
+    ans.sort_indices()
+
+    # no entries are left over from deleted instances
+    assert np.array_equal(motif_adj_mat.indptr, ans.indptr)
+    assert np.array_equal(motif_adj_mat.indices, ans.indices)
+    assert np.allclose(motif_adj_mat.data, ans.data)
+
+
+def test_get_local_table():
+
+  # a directed 3-cycle with one double edge
+  pattern = 1 + 2 + 8 + 16
+
+  assert mcic._get_local_table("M1", "func")[pattern] == [([0, 3, 4], [0, 1, 2])]
+  assert mcic._get_local_table("M1", "struc")[pattern] == []
+
+  # colliders count only the pair of sources
+  pattern = 4 + 16
+
+  assert mcic._get_local_table("Mcoll", "func")[pattern] == [([2, 4], [0])]
+  assert mcic._get_local_table("Ms", "func")[3] == [([0], [0]), ([1], [0])]
+
+
+def test_build_motif_adjacency_matrix_series(monkeypatch):
+
+  # derive every snapshot, however small the graph
+  monkeypatch.setattr(mcic, "_DERIVE_COST_RATIO", 0)
+  rng = np.random.default_rng(5)
+  adj_mats = [sparse.csr_matrix(mcut._random_sparse_matrix(20, 20, 0.2, "poisson", 3))]
+
+  # each snapshot changes some of the edges of the previous one
+  for _ in range(4):
+    adj_mat = adj_mats[-1].tolil()
+    rows = rng.integers(0, 20, 15)
+    cols = rng.integers(0, 20, 15)
+    adj_mat[rows, cols] = rng.integers(0, 4, 15)
+    adj_mats.append(sparse.csr_matrix(adj_mat))
+
+  for motif_name in ["Ms", "M1", "M8", "Mcoll"]:
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        for n_jobs in [1, 2]:
+          motif_adj_mats = mcic.build_motif_adjacency_matrix_series(
+            adj_mats, motif_name, motif_type, mam_weight_type, n_jobs)
+
+          for adj_mat, motif_adj_mat in zip(adj_mats, motif_adj_mats):
+            adj_mat = adj_mat - sparse.diags(adj_mat.diagonal())
+            ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name,
+                                                    motif_type, mam_weight_type)
+
+            assert np.allclose(motif_adj_mat.toarray(), ans.toarray())
+
+
+def test_build_motif_adjacency_matrix_series_pattern(monkeypatch):
+
+  monkeypatch.setattr(mcic, "_DERIVE_COST_RATIO", 0)
+  rng = np.random.default_rng(8)
+  adj_mats = [sparse.csr_matrix(mcut._random_sparse_matrix(100, 100, 0.1, "poisson", 3)) * 0.1]
+
+  # weighted insertions and deletions
+  for _ in range(10):
+    adj_mat = adj_mats[-1].tolil()
+    rows = rng.integers(0, 100, 200)
+    cols = rng.integers(0, 100, 200)
+    adj_mat[rows, cols] = rng.integers(0, 3, 200) * rng.random(200)
+    adj_mats.append(sparse.csr_matrix(adj_mat))
+
+  for mam_weight_type in ["mean", "product"]:
+    motif_adj_mats = mcic.build_motif_adjacency_matrix_series(adj_mats, "M1", "func",
+                                                              mam_weight_type)
+
+    # no entries are left over from deleted instances
+    for adj_mat, motif_adj_mat in zip(adj_mats, motif_adj_mats):
+      adj_mat = adj_mat - sparse.diags(adj_mat.diagonal())
+      ans = mcmo.build_motif_adjacency_matrix(adj_mat, "M1", "func", mam_weight_type)
+      motif_adj_mat.sort_indices()
+      ans.sort_indices()
+
+      assert np.array_equal(motif_adj_mat.indptr, ans.indptr)
+      assert np.array_equal(motif_adj_mat.indices, ans.indices)
+      assert np.allclose(motif_adj_mat.data, ans.data)
+
+
+def test_is_derive_cheaper():
+
+  rng = np.random.default_rng(9)
+  old_mat = mcic._drop_self_loops(mcut._random_sparse_matrix(500, 500, 0.02))
+
+  # a few changed edges are derived, a rewired graph is rebuilt
+  for n_changes, ans in [(5, True), (5000, False)]:
+    new_mat = old_mat.tolil()
+    new_mat[rng.integers(0, 500, n_changes), rng.integers(0, 500, n_changes)] = 1
+    new_mat = mcic._drop_self_loops(new_mat)
+
+    for motif_name in ["Ms", "M1", "M8"]:
+      assert mcic._is_derive_cheaper(old_mat, new_mat, motif_name) == ans
+
+
+def test_get_motif_delta():
+
+  rng = np.random.default_rng(6)
+  old_mat = mcic._drop_self_loops(mcut._random_sparse_matrix(20, 20, 0.2, "poisson", 3))
+  new_mat = old_mat.tolil()
+  new_mat[rng.integers(0, 20, 15), rng.integers(0, 20, 15)] = rng.integers(0, 4, 15)
+  new_mat = mcic._drop_self_loops(new_mat)
+
+  for motif_name in mcut.get_motif_names():
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        table = mcic._get_local_table(motif_name, motif_type)
+        delta, count_delta = mcic._get_motif_delta(old_mat, new_mat, motif_name, table,
+                                                   mam_weight_type)
+        old_mam = mcmo.build_motif_adjacency_matrix(old_mat, motif_name,
+                                                    motif_type, mam_weight_type)
+        new_mam = mcmo.build_motif_adjacency_matrix(new_mat, motif_name,
+                                                    motif_type, mam_weight_type)
+        old_counts = mcmo.build_motif_adjacency_matrix(old_mat, motif_name, motif_type)
+        new_counts = mcmo.build_motif_adjacency_matrix(new_mat, motif_name, motif_type)
+
+        assert np.allclose(delta.toarray(), (new_mam - old_mam).toarray())
+        assert np.array_equal(count_delta.toarray(), (new_counts - old_counts).toarray())
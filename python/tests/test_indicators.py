@@ -56,3 +56,27 @@ def test_indicators():
 
   assert np.allclose(mcin._build_Gp(G_dense), Gp)
   assert np.allclose(mcin._build_Gp(G_sparse).toarray(), Gp)
+
+
+def test_indicator_bundle():
+
+  G_dense = np.array([0, 2, 0, 3, 0, 4, 0, 0, 0]).reshape((3, 3))
+  G_sparse = sparse.csr_matrix(G_dense)
+
+  Js = np.array([0, 0, 0, 0, 0, 1, 0, 0, 0]).reshape((3, 3))
+  Gsym = np.array([0, 5, 0, 5, 0, 4, 0, 4, 0]).reshape((3, 3))
+
+  bundle_dense = mcin.IndicatorBundle(G_sparse, "dense")
+  bundle_sparse = mcin.IndicatorBundle(G_dense, "sparse")
+
+  assert not bundle_dense.is_sparse()
+  assert bundle_sparse.is_sparse()
+
+  assert np.allclose(mcin._build_Js(bundle_dense), Js)
+  assert np.allclose(mcin._build_Js(bundle_sparse).toarray(), Js)
+  assert np.allclose(bundle_dense.get("Gsym"), Gsym)
+  assert np.allclose(bundle_sparse.get("Gsym").toarray(), Gsym)
+
+  # indicators are built once and then reused
+  assert {"G", "J", "Gs", "Js", "Gsym"} <= set(bundle_sparse.cache)
+  assert mcin._build_J(bundle_sparse) is bundle_sparse.get("J")
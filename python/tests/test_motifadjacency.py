@@ -1,4 +1,5 @@
 from motifcluster import motifadjacency as mcmo
+from motifcluster import indicators as mcin
 from motifcluster import sampling as mcsa
 from motifcluster import utils as mcut
 
@@ -1700,3 +1701,385 @@ def test_mam_product_weighted_struc():
     assert np.allclose(mam_sparsematrix_densemethod.toarray(), ans[motifs[i]])
     assert np.allclose(mam_densematrix_sparsemethod.toarray(), ans[motifs[i]])
     assert np.allclose(mam_sparsematrix_sparsemethod.toarray(), ans[motifs[i]])
+
+
+def test_mam_indicator_bundle():
+
+  adj_mat_sparse = mcsa.demonstration_graph()["adj_mat_sparse"]
+
+  for mam_method in ["dense", "sparse"]:
+    bundle = mcin.IndicatorBundle(adj_mat_sparse, mam_method)
+
+    for motif_name in mcut.get_motif_names():
+      for motif_type in ["func", "struc"]:
+        for mam_weight_type in ["unweighted", "mean", "product"]:
+          mam_bundle = mcmo.build_motif_adjacency_matrix(
+            bundle, motif_name, motif_type, mam_weight_type, mam_method)
+          mam_matrix = mcmo.build_motif_adjacency_matrix(
+            adj_mat_sparse, motif_name, motif_type, mam_weight_type, mam_method)
+
+          assert np.allclose(mam_bundle.toarray(), mam_matrix.toarray())
+
+    # indicators were shared across the sweep
+    assert mcin._build_J(bundle) is bundle.get("J")
+
+
+def test_mam_reorder():
+
+  adj_mat_sparse = mcsa.demonstration_graph()["adj_mat_sparse"]
+
+  for reorder in ["degree", "rcm", "bfs"]:
+    for mam_method in ["dense", "sparse", "enumerate"]:
+      for motif_name in ["M1", "M8", "Mcoll"]:
+        mam_reorder = mcmo.build_motif_adjacency_matrix(
+          adj_mat_sparse, motif_name, "func", "mean", mam_method, reorder=reorder)
+        mam = mcmo.build_motif_adjacency_matrix(
+          adj_mat_sparse, motif_name, "func", "mean", mam_method)
+
+        assert np.allclose(mam_reorder.toarray(), mam.toarray())
+
+
+def test_mam_dtype():
+
+  adj_mat_sparse = mcsa.demonstration_graph()["adj_mat_sparse"]
+
+  for dtype in [np.float32, np.float64]:
+    for mam_method in ["dense", "sparse", "enumerate"]:
+      for motif_name in ["M1", "M4", "M9", "Mcoll"]:
+        for mam_weight_type in ["unweighted", "mean", "product"]:
+          mam_dtype = mcmo.build_motif_adjacency_matrix(
+            adj_mat_sparse, motif_name, "func", mam_weight_type, mam_method, dtype=dtype)
+          mam = mcmo.build_motif_adjacency_matrix(
+            adj_mat_sparse, motif_name, "func", mam_weight_type, mam_method)
+
+          if mam_weight_type == "unweighted":
+            assert mam_dtype.dtype == np.dtype(f"int{8 * np.dtype(dtype).itemsize}")
+            assert (mam_dtype.toarray() == mam.toarray()).all()
+
+          else:
+            assert mam_dtype.dtype == dtype
+            assert np.allclose(mam_dtype.toarray(), mam.toarray())
+
+  # in parallel and approximately
+  mams = mcmo.build_motif_adjacency_matrices(adj_mat_sparse, ["M1", "M9"], "func",
+                                             "mean", n_jobs=2, dtype=np.float32)
+  assert all(mam.dtype == np.float32 for mam in mams.values())
+
+  mam = mcmo.build_motif_adjacency_matrix(adj_mat_sparse, "M1", mam_method="approx",
+                                          dtype=np.float32)
+  assert mam.dtype == np.float32
+
+
+def test_mam_upper():
+
+  adj_mat_sparse = mcsa.demonstration_graph()["adj_mat_sparse"]
+
+  for mam_method in ["dense", "sparse", "enumerate"]:
+    for motif_name in ["M1", "M4", "M9", "Mcoll"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        mam = mcmo.build_motif_adjacency_matrix(
+          adj_mat_sparse, motif_name, "struc", mam_weight_type, mam_method)
+
+        for reorder in [None, "rcm"]:
+          mam_upper = mcmo.build_motif_adjacency_matrix(
+            adj_mat_sparse, motif_name, "struc", mam_weight_type, mam_method,
+            reorder=reorder, upper=True)
+
+          assert sparse.issparse(mam_upper)
+          assert np.allclose(mam_upper.toarray(), np.triu(mam.toarray()))
+
+  # in parallel
+  mams = mcmo.build_motif_adjacency_matrices(adj_mat_sparse, ["M1", "M9"], "func",
+                                             "mean", n_jobs=2, upper=True)
+
+  for motif_name, mam_upper in mams.items():
+    mam = mcmo.build_motif_adjacency_matrix(adj_mat_sparse, motif_name, "func", "mean")
+    assert np.allclose(mam_upper.toarray(), np.triu(mam.toarray()))
+
+
+def test_mam_auto(caplog, monkeypatch):
+
+  caplog.set_level("INFO", logger="motifcluster.motifadjacency")
+  adj_mat_sparse = mcsa.demonstration_graph()["adj_mat_sparse"]
+  np.random.seed(3251)
+  large_adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(400, 400, 0.01, "poisson", 3))
+
+  for adj_mat, mam_method in [(adj_mat_sparse, "dense"), (large_adj_mat, "sparse")]:
+    for motif_name in ["M1", "M8", "Mcoll"]:
+      caplog.clear()
+      mam = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "func", "mean", "auto")
+      ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "func", "mean")
+
+      assert np.allclose(mam.toarray(), ans.toarray())
+      assert f"chose the {mam_method} formulation for {motif_name}" in caplog.text
+
+  # products in panels of rows when short of memory
+  monkeypatch.setattr(mcmo, "_AUTO_MEMORY_BYTES", 10000)
+
+  for upper in [False, True]:
+    caplog.clear()
+    mam = mcmo.build_motif_adjacency_matrix(large_adj_mat, "M8", "func", "mean", "auto",
+                                            upper=upper)
+    ans = mcmo.build_motif_adjacency_matrix(large_adj_mat, "M8", "func", "mean", upper=upper)
+
+    assert np.allclose(mam.toarray(), ans.toarray())
+    assert "panels of rows" in caplog.text
+
+  mams = mcmo.build_motif_adjacency_matrices(large_adj_mat, ["M1", "M8"], "func", "mean", "auto")
+
+  for motif_name, mam in mams.items():
+    ans = mcmo.build_motif_adjacency_matrix(large_adj_mat, motif_name, "func", "mean")
+    assert np.allclose(mam.toarray(), ans.toarray())
+
+
+def test_mam_auto_self_loops(caplog, monkeypatch):
+
+  caplog.set_level("INFO", logger="motifcluster.motifadjacency")
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(20, 20, 0.3, "poisson", 3))
+  adj_mat.setdiag(np.arange(20) % 2)
+  motif_names = ["M8", "M10", "M13", "Mcoll", "Mexpa"]
+
+  # the dense formulation would be cheaper, but differs with self-loops
+  for motif_name in motif_names:
+    caplog.clear()
+    mam = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "struc", "mean", "auto")
+    ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "struc", "mean", "sparse")
+
+    assert np.allclose(mam.toarray(), ans.toarray())
+    assert "the graph has self-loops" in caplog.text
+
+  mams = mcmo.build_motif_adjacency_matrices(adj_mat, motif_names, "struc", "mean", "auto")
+
+  for motif_name, mam in mams.items():
+    ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "struc", "mean", "sparse")
+    assert np.allclose(mam.toarray(), ans.toarray())
+
+  # and products in panels of rows agree with the sparse formulation
+  monkeypatch.setattr(mcmo, "_AUTO_MEMORY_BYTES", 100)
+
+  for motif_name in motif_names:
+    caplog.clear()
+    mam = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "struc", "mean", "auto")
+    ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "struc", "mean", "sparse")
+
+    assert np.allclose(mam.toarray(), ans.toarray())
+    assert "panels of rows" in caplog.text
+
+
+def test_mam_all():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.3, "poisson", 3))
+  adj_mat.setdiag(np.arange(30) % 3)
+
+  # negative weights are not read off from the indicator patterns
+  adj_mat_neg = adj_mat.copy()
+  adj_mat_neg.data[::5] *= -1
+
+  for some_mat in [adj_mat, adj_mat_neg]:
+    for mam_method in ["sparse", "dense"]:
+      for motif_name in ["M1", "M2", "M5", "M9", "M13"]:
+        for motif_type in ["func", "struc"]:
+          mams = mcmo.build_motif_adjacency_matrix(some_mat, motif_name, motif_type, "all",
+                                                   mam_method)
+
+          assert list(mams) == ["unweighted", "mean", "product"]
+
+          for mam_weight_type, mam in mams.items():
+            ans = mcmo.build_motif_adjacency_matrix(some_mat, motif_name, motif_type,
+                                                    mam_weight_type, mam_method)
+
+            assert mam.dtype == ans.dtype
+            assert np.allclose(mam.toarray(), ans.toarray())
+
+  motif_names = ["M1", "M8", "Mcoll"]
+
+  for mam_method in ["sparse", "dense", "auto"]:
+    mams = mcmo.build_motif_adjacency_matrices(adj_mat, motif_names, "struc", "all",
+                                               mam_method)
+
+    assert list(mams) == motif_names
+
+    for motif_name in motif_names:
+      assert list(mams[motif_name]) == ["unweighted", "mean", "product"]
+
+      for mam_weight_type, mam in mams[motif_name].items():
+        ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "struc",
+                                                mam_weight_type, mam_method)
+
+        assert mam.dtype == ans.dtype
+        assert np.allclose(mam.toarray(), ans.toarray())
+
+
+def test_mam_both(monkeypatch):
+
+  # few double edges, so that structural products are derived
+  adj_mat = sparse.triu(mcut._random_sparse_matrix(40, 40, 0.3, "poisson", 3), 1).tocoo()
+  adj_mat = sparse.csr_matrix(adj_mat + sparse.coo_matrix(
+    (np.ones(len(adj_mat.row[::40])), (adj_mat.col[::40], adj_mat.row[::40])), shape=(40, 40)))
+  adj_mat.setdiag(np.arange(40) % 2)
+
+  derived = []
+  product_from_func = mcmo._product_from_func
+
+  def count_derived(*args):
+    ans = product_from_func(*args)
+    derived.append(ans is not None)
+    return ans
+
+  monkeypatch.setattr(mcmo, "_product_from_func", count_derived)
+
+  for mam_method in ["sparse", "dense", "enumerate"]:
+    for motif_name in mcut.get_motif_names():
+      mams = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "both", "all", mam_method)
+
+      assert list(mams) == ["func", "struc"]
+
+      for motif_type in ["func", "struc"]:
+        for mam_weight_type, mam in mams[motif_type].items():
+          ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, motif_type,
+                                                  mam_weight_type, mam_method)
+
+          assert mam.dtype == ans.dtype
+          assert np.allclose(mam.toarray(), ans.toarray())
+
+  assert any(derived)
+
+
+def test_build_motif_adjacency_matrices():
+
+  adj_mat_sparse = mcsa.demonstration_graph()["adj_mat_sparse"]
+  motifs = mcut.get_motif_names()
+
+  for mam_method in ["dense", "sparse"]:
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        mams = mcmo.build_motif_adjacency_matrices(
+          adj_mat_sparse, motifs, motif_type, mam_weight_type, mam_method)
+
+        assert list(mams.keys()) == motifs
+
+        for motif_name in motifs:
+          mam = mcmo.build_motif_adjacency_matrix(
+            adj_mat_sparse, motif_name, motif_type, mam_weight_type, mam_method)
+
+          assert np.allclose(mams[motif_name].toarray(), mam.toarray())
+
+
+def test_motif_formulas():
+
+  motifs = mcut.get_motif_names()
+
+  assert list(mcmo._MOTIF_FORMULAS.keys()) == motifs
+
+  for motif_name in motifs:
+    for mam_weight_type in ["unweighted", "mean", "product"]:
+
+      # structural formulas only use structural indicators
+      C_terms, Cprime_terms, _ = mcmo._get_formula(motif_name, "struc", mam_weight_type)
+
+      for term in C_terms + Cprime_terms:
+        for name in term:
+          assert name is None or name.replace(".T", "") not in ["J", "G", "Jn"]
+
+      # sparse plans avoid the dense complement matrices
+      plan, _ = mcmo._plan_formula(motif_name, "func", mam_weight_type, "sparse")
+
+      for _, _, term, _ in plan:
+        assert "Jn" not in term
+        assert mcmo._canonical_term(term) == (term, False)
+
+  # a term and its transpose share one canonical form
+  assert mcmo._canonical_term(("J", "J.T", "G")) == (("J", "J.T", "G"), False)
+  assert mcmo._canonical_term(("J.T", "G.T", "J")) == (("J", "J.T", "G"), True)
+
+
+def test_build_approximate_motif_adjacency_matrix():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.3, "poisson", 3))
+  rng = np.random.default_rng(7)
+
+  for motif_name in ["M1", "M8", "Mcoll"]:
+    ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name, "func", "mean").toarray()
+
+    # the estimates are unbiased
+    n_runs = 200
+    mean = np.zeros(ans.shape)
+    for _ in range(n_runs):
+      estimate, variance_mat = mcmo.build_approximate_motif_adjacency_matrix(
+        adj_mat, motif_name, "func", "mean", sample_budget=6000, random_state=rng)
+      mean += estimate.toarray() / n_runs
+
+      assert (variance_mat.data >= 0).all()
+
+    assert np.linalg.norm(mean - ans) < 0.1 * np.linalg.norm(ans)
+
+    # a full budget is exact
+    estimate, variance_mat = mcmo.build_approximate_motif_adjacency_matrix(
+      adj_mat, motif_name, "func", "mean", sample_budget=10 ** 9)
+
+    assert np.allclose(estimate.toarray(), ans)
+    assert variance_mat.nnz == 0
+
+    # a target error is met
+    estimate, variance_mat = mcmo.build_approximate_motif_adjacency_matrix(
+      adj_mat, motif_name, "func", "mean", rel_error=0.2, random_state=rng)
+
+    assert np.sqrt(variance_mat.sum()) <= 0.2 * np.linalg.norm(estimate.toarray())
+
+  estimate = mcmo.build_motif_adjacency_matrix(adj_mat, "M8", "func", "mean", "approx")
+
+  assert estimate.shape == (30, 30)
+
+
+def test_build_motif_adjacency_operator():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.3, "poisson", 3))
+  x = np.random.default_rng(8).random(30)
+
+  for motif_name in mcut.get_motif_names():
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        motif_adj_op, degs = mcmo.build_motif_adjacency_operator(adj_mat, motif_name,
+                                                                 motif_type, mam_weight_type)
+        ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name,
+                                                motif_type, mam_weight_type)
+
+        assert np.allclose(motif_adj_op @ x, ans @ x)
+        assert np.allclose(degs, np.asarray(ans.sum(axis=1)).ravel())
+
+
+def test_motif_degrees():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.3, "poisson", 3))
+  adj_mat.setdiag(np.arange(30) % 3)
+
+  for motif_name in mcut.get_motif_names():
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        degs = mcmo.motif_degrees(adj_mat, motif_name, motif_type, mam_weight_type)
+        ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name,
+                                                motif_type, mam_weight_type)
+
+        assert degs.shape == (30,)
+        assert np.allclose(degs, np.asarray(ans.sum(axis=1)).ravel())
+
+
+def test_motif_census():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 30, 0.3, "poisson", 3))
+  adj_mat.setdiag(0)
+  adj_mat.eliminate_zeros()
+  census = mcmo.motif_census(adj_mat)
+
+  for motif_name in mcut.get_motif_names():
+    n_pairs = 1 if motif_name in ["Ms", "Md", "Mcoll", "Mexpa"] else 3
+
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        ans = mcmo.build_motif_adjacency_matrix(adj_mat, motif_name,
+                                                motif_type, mam_weight_type)
+
+        assert np.isclose(2 * n_pairs * census[motif_type][mam_weight_type][motif_name],
+                          ans.sum())
+
+  assert isinstance(census["struc"]["unweighted"]["M1"], int)
@@ -0,0 +1,50 @@
+from motifcluster import motifadjacency as mcmo
+from motifcluster import outofcore as mcoc
+from motifcluster import sampling as mcsa
+from motifcluster import utils as mcut
+
+import os
+import numpy as np
+from scipy import sparse
+
+def test_save_csr(tmp_path):
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 20, 0.2, "poisson", 3))
+  path = os.path.join(tmp_path, "adj_mat")
+  mcoc.save_csr(adj_mat, path)
+  loaded_mat = mcoc.load_csr(path)
+
+  assert loaded_mat.shape == (30, 20)
+  assert np.array_equal(loaded_mat.toarray(), adj_mat.toarray())
+
+  # empty matrix
+  mcoc.save_csr(sparse.csr_matrix((5, 5)), path)
+
+  assert mcoc.load_csr(path).nnz == 0
+
+
+def test_get_panels():
+
+  row_costs = np.array([1, 2, 3, 10, 1, 1])
+
+  assert mcoc._get_panels(row_costs, 3) == [(0, 2), (2, 3), (3, 4), (4, 6)]
+  assert mcoc._get_panels(row_costs, 100) == [(0, 6)]
+  assert mcoc._get_panels(np.zeros(0), 3) == [(0, 0)]
+
+
+def test_build_motif_adjacency_matrix_out_of_core(tmp_path):
+
+  adj_mat = mcsa.demonstration_graph()["adj_mat_sparse"]
+  adj_mat_path = os.path.join(tmp_path, "adj_mat")
+  mam_path = os.path.join(tmp_path, "mam")
+  mcoc.save_csr(adj_mat, adj_mat_path)
+
+  for motif_name in mcut.get_motif_names():
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        mam_out_of_core = mcmo.build_motif_adjacency_matrix_out_of_core(
+          adj_mat_path, motif_name, mam_path, motif_type, mam_weight_type, panel_size=20)
+        mam_in_memory = mcmo.build_motif_adjacency_matrix(
+          adj_mat, motif_name, motif_type, mam_weight_type)
+
+        assert np.allclose(mam_out_of_core.toarray(), mam_in_memory.toarray())
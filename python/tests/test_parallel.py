@@ -0,0 +1,67 @@
+from motifcluster import motifadjacency as mcmo
+from motifcluster import parallel as mcpa
+from motifcluster import sampling as mcsa
+from motifcluster import utils as mcut
+
+import os
+import numpy as np
+from scipy import sparse
+
+def test_get_n_jobs():
+
+  assert mcpa._get_n_jobs(None) == 1
+  assert mcpa._get_n_jobs(3) == 3
+  assert mcpa._get_n_jobs(-1) == (os.cpu_count() or 1)
+
+
+def test_get_row_blocks():
+
+  assert mcpa._get_row_blocks(10, 3) == [(0, 3), (3, 6), (6, 10)]
+  assert mcpa._get_row_blocks(2, 4) == [(0, 1), (1, 2)]
+  assert mcpa._get_row_blocks(0, 4) == [(0, 0)]
+  assert mcpa._get_row_blocks(6, 3, np.ones(6)) == [(0, 2), (2, 4), (4, 6)]
+  assert mcpa._get_row_blocks(6, 3, [1, 10, 1, 1, 1, 1]) == [(0, 2), (2, 6)]
+  assert mcpa._get_row_blocks(3, 2, np.zeros(3)) == [(0, 1), (1, 3)]
+
+
+def test_share_matrix():
+
+  adj_mat = sparse.csr_matrix(mcut._random_sparse_matrix(20, 20, 0.3))
+
+  for some_mat in [adj_mat, adj_mat.toarray()]:
+    shms, spec = mcpa._share_matrix(some_mat)
+    shared_mat, attached_shms = mcpa._attach_matrix(spec)
+
+    if sparse.issparse(shared_mat):
+      shared_mat = shared_mat.toarray()
+
+    assert np.array_equal(shared_mat, adj_mat.toarray())
+
+    del shared_mat
+    for shm in attached_shms + shms:
+      shm.close()
+    for shm in shms:
+      shm.unlink()
+
+
+def test_build_in_row_blocks():
+
+  adj_mat = mcsa.demonstration_graph()["adj_mat_sparse"]
+  motifs = ["Ms", "M1", "M6", "M8", "M13", "Mcoll"]
+
+  for mam_method in ["dense", "sparse"]:
+    for motif_type in ["func", "struc"]:
+      for mam_weight_type in ["unweighted", "mean", "product"]:
+        mams_parallel = mcmo.build_motif_adjacency_matrices(
+          adj_mat, motifs, motif_type, mam_weight_type, mam_method, n_jobs=2)
+
+        for motif_name in motifs:
+          mam_serial = mcmo.build_motif_adjacency_matrix(
+            adj_mat, motif_name, motif_type, mam_weight_type, mam_method)
+
+          assert np.allclose(mams_parallel[motif_name].toarray(), mam_serial.toarray())
+
+  mam_parallel = mcmo.build_motif_adjacency_matrix(adj_mat, "M8", n_jobs=3)
+  mam_serial = mcmo.build_motif_adjacency_matrix(adj_mat, "M8")
+
+  assert np.allclose(mam_parallel.toarray(), mam_serial.toarray())
@@ -1,4 +1,5 @@
 from motifcluster import spectral as mcsp
+from motifcluster import utils as mcut
 
 import random
 from scipy import sparse
@@ -96,6 +97,9 @@ def test_build_laplacian_sparse():
   assert np.allclose(mcsp.build_laplacian(G, type_lap = "comb").toarray(), comb_lap)
   assert np.allclose(mcsp.build_laplacian(G, type_lap = "rw").toarray(), rw_lap)
 
+  for type_lap in ["comb", "rw"]:
+    assert mcsp.build_laplacian(G, type_lap, np.float32).dtype == np.float32
+
 
 def test_build_laplacian_row_sum_error():
 
@@ -188,6 +192,41 @@ def test_run_laplace_embedding_sparse():
   assert np.allclose(vects_rw, ans_vects_rw, atol=0.01)
 
 
+def test_run_laplace_embedding_implicit():
+
+  rng = np.random.default_rng(9235)
+  G = rng.random((8, 8))
+  G = G + G.transpose()
+  G_op = sparse.linalg.aslinearoperator(G)
+
+  for type_lap in ["comb", "rw"]:
+    for num_eigs in [3, 7]:
+      spectrum = mcsp.run_laplace_embedding(G_op, num_eigs, type_lap)
+      ans = mcsp.run_laplace_embedding(G, num_eigs, type_lap)
+      laplacian = mcsp.build_laplacian(G, type_lap)
+
+      assert np.allclose(spectrum["vals"], ans["vals"], atol=1e-6)
+      assert np.allclose(laplacian @ spectrum["vects"],
+                         spectrum["vects"] * spectrum["vals"], atol=1e-6)
+
+  # degrees given
+  spectrum = mcsp.run_laplace_embedding(G_op, 3, "rw", G.sum(axis=1))
+
+  assert np.allclose(spectrum["vals"], ans["vals"][:3], atol=1e-6)
+
+  # the eigensolve follows the type of the operator
+  G_op = sparse.linalg.aslinearoperator(G.astype(np.float32))
+
+  for type_lap in ["comb", "rw"]:
+    for num_eigs in [3, 7]:
+      spectrum = mcsp.run_laplace_embedding(G_op, num_eigs, type_lap)
+      ans = mcsp.run_laplace_embedding(G, num_eigs, type_lap)
+
+      assert spectrum["vals"].dtype == np.float32
+      assert spectrum["vects"].dtype == np.float32
+      assert np.allclose(spectrum["vals"], ans["vals"], atol=1e-4)
+
+
 # run_motif_embedding
 
 def test_run_mot_embedding_dense_restrict():
@@ -412,3 +451,82 @@ def test_run_mot_embedding_sparse_no_restrict():
   assert np.allclose(ans_motif_adj_mat, emb_list["motif_adj_mat"].toarray())
   assert np.allclose(ans_vals, emb_list["vals"], atol=0.01)
   assert np.allclose(ans_vects, emb_list["vects"], atol=0.01)
+
+
+def test_run_mot_embedding_reorder():
+
+  np.random.seed(9235)
+  adj_mat = mcut._random_sparse_matrix(60, 60, 0.1, "poisson", 3)
+
+  for restrict in [True, False]:
+    ans = mcsp.run_motif_embedding(adj_mat, "M1", "func", "mean", "sparse", 3,
+                                   "comb", restrict)
+
+    for reorder in ["degree", "rcm", "bfs"]:
+      emb_list = mcsp.run_motif_embedding(adj_mat, "M1", "func", "mean", "sparse", 3,
+                                          "comb", restrict, reorder=reorder)
+
+      # flip eigenvector signs if necessary
+      for i in range(3):
+        if np.dot(emb_list["vects"][:, i], ans["vects"][:, i]) < 0:
+          emb_list["vects"][:, i] = -emb_list["vects"][:, i]
+
+      assert emb_list["comps"] == ans["comps"]
+      assert np.allclose(emb_list["motif_adj_mat"].toarray(), ans["motif_adj_mat"].toarray())
+      assert np.allclose(emb_list["vals"], ans["vals"])
+      assert np.allclose(emb_list["vects"], ans["vects"], atol=1e-6)
+
+
+def test_run_mot_embedding_dtype():
+
+  np.random.seed(9235)
+  adj_mat = mcut._random_sparse_matrix(60, 60, 0.1, "poisson", 3)
+
+  for mam_weight_type in ["unweighted", "mean"]:
+    ans = mcsp.run_motif_embedding(adj_mat, "M1", "func", mam_weight_type, "sparse", 3,
+                                   "comb", dtype=np.float64)
+    emb_list = mcsp.run_motif_embedding(adj_mat, "M1", "func", mam_weight_type, "sparse", 3,
+                                        "comb", dtype=np.float32)
+
+    assert emb_list["vects"].dtype == np.float32
+    assert emb_list["comps"] == ans["comps"]
+    assert np.allclose(emb_list["motif_adj_mat"].toarray(), ans["motif_adj_mat"].toarray())
+    assert np.allclose(emb_list["vals"], ans["vals"], atol=1e-4)
+
+
+def test_run_mot_embedding_upper():
+
+  np.random.seed(4271)
+  adj_mat = mcut._random_sparse_matrix(60, 60, 0.1, "poisson", 3)
+
+  for type_lap in ["comb", "rw"]:
+    for reorder in [None, "rcm"]:
+      ans = mcsp.run_motif_embedding(adj_mat, "M1", "func", "mean", "sparse", 3, type_lap,
+                                     reorder=reorder)
+      emb_list = mcsp.run_motif_embedding(adj_mat, "M1", "func", "mean", "sparse", 3,
+                                          type_lap, reorder=reorder, upper=True)
+
+      assert np.allclose(emb_list["motif_adj_mat"].toarray(),
+                         np.triu(ans["motif_adj_mat"].toarray()))
+      assert emb_list["comps"] == ans["comps"]
+      assert np.allclose(emb_list["vals"], ans["vals"])
+      assert np.allclose(np.abs(emb_list["vects"]), np.abs(ans["vects"]))
+
+  # the precision of the upper triangle is kept
+  for mam_weight_type in ["unweighted", "mean"]:
+    for type_lap in ["comb", "rw"]:
+      ans = mcsp.run_motif_embedding(adj_mat, "M1", "func", mam_weight_type, "sparse", 3,
+                                     type_lap, dtype=np.float32)
+      emb_list = mcsp.run_motif_embedding(adj_mat, "M1", "func", mam_weight_type, "sparse", 3,
+                                          type_lap, dtype=np.float32, upper=True)
+
+      assert emb_list["vals"].dtype == np.float32
+      assert emb_list["vects"].dtype == np.float32
+
+      # the shifted operator loses precision relative to the largest degree
+      assert np.allclose(emb_list["vals"], ans["vals"], atol=1e-3)
+
+  # symmetric operator from half storage
+  half_mat = sparse.triu(sparse.csr_matrix([[1, 2, 0], [2, 0, 3], [0, 3, 4]]))
+  sym_op = mcsp._get_symmetric_operator(half_mat)
+  assert np.allclose(sym_op @ np.identity(3), [[1, 2, 0], [2, 0, 3], [0, 3, 4]])
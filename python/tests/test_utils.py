@@ -78,3 +78,72 @@ def test_get_largest_component():
   assert mcut.get_largest_component(adj_mat_dense, "sparse") == ans
   assert mcut.get_largest_component(adj_mat_sparse, "dense") == ans
   assert mcut.get_largest_component(adj_mat_sparse, "sparse") == ans
+
+
+def test_masked_product():
+
+  mask_dense = np.array([1, 0, 2, 0, 0, 1, 1, 0, 0]).reshape((3, 3))
+  a_dense = np.array(range(-4, 5)).reshape((3, 3))
+  b_dense = np.array(range(-1, 8)).reshape((3, 3))
+  mask_sparse = sparse.csr_matrix(mask_dense)
+  a_sparse = sparse.csr_matrix(a_dense)
+  b_sparse = sparse.csr_matrix(b_dense)
+
+  ans = mask_dense * (a_dense @ b_dense)
+
+  assert np.allclose(
+    mcut._masked_product(mask_dense, a_dense, b_dense).toarray(),
+    ans
+  )
+
+  assert np.allclose(
+    mcut._masked_product(mask_sparse, a_sparse, b_sparse).toarray(),
+    ans
+  )
+
+  assert np.allclose(
+    mcut._masked_product(mask_sparse, a_sparse, b_sparse, max_chunk=1).toarray(),
+    ans
+  )
+
+
+def test_masked_product_expand(monkeypatch):
+
+  mask_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 40, 0.2, "poisson", 2))
+  a_mat = sparse.csr_matrix(mcut._random_sparse_matrix(30, 50, 0.1, "poisson", 2))
+  b_mat = sparse.csr_matrix(mcut._random_sparse_matrix(50, 40, 0.1, "poisson", 2))
+
+  ans = mask_mat.toarray() * (a_mat.toarray() @ b_mat.toarray())
+
+  # all rows by look-up, all rows expanded, and a mixture
+  for expand_ratio in [-1, 10**9, 1]:
+    monkeypatch.setattr(mcut, "_EXPAND_RATIO", expand_ratio)
+
+    for max_chunk in [1, 2**22]:
+      assert np.allclose(
+        mcut._masked_product(mask_mat, a_mat, b_mat, max_chunk=max_chunk).toarray(),
+        ans
+      )
+
+
+def test_get_vertex_order():
+
+  adj_mat = mcut._random_sparse_matrix(40, 40, 0.05)
+
+  for reorder in ["degree", "rcm", "bfs"]:
+    order = mcut._get_vertex_order(adj_mat, reorder)
+
+    assert sorted(order) == list(range(40))
+
+    perm_mat = mcut._permute_matrix(sparse.csr_matrix(adj_mat), order)
+
+    assert np.allclose(perm_mat.toarray(), adj_mat[np.ix_(order, order)])
+    assert np.allclose(mcut._permute_matrix(perm_mat, np.argsort(order)).toarray(), adj_mat)
+
+
+def test_fold_upper():
+
+  some_mat = sparse.csr_matrix([[1, 0, 0], [2, 0, 0], [0, 3, 4]])
+  ans = np.array([[1, 2, 0], [0, 0, 3], [0, 0, 4]])
+
+  assert np.allclose(mcut._fold_upper(some_mat).toarray(), ans)